@@ -0,0 +1,204 @@
+'''
+按上游的并发限制与准入控制
+
+- 每个上游一个并发上限，超出的请求进入有界等待队列，按 user_role 优先级出队（数值小的优先，同级先到先得）
+- 队列满时，新请求优先级更高则挤掉队列中优先级最低的等待者，否则直接拒绝（429）
+- 排队超过 queue_timeout 拒绝（503）；两种拒绝都带 Retry-After
+'''
+import asyncio
+import heapq
+import itertools
+import statistics
+from collections import deque
+from typing import Any
+
+import tracing
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, upstream: str, status_code: int, retry_after: float, reason: str) -> None:
+        super().__init__(f'{upstream}: {reason}')
+        self.upstream = upstream
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class Permit:
+    '''
+    一个并发名额，release 可重复调用
+    '''
+    __slots__ = ('_limiter', 'released')
+
+    def __init__(self, limiter: 'UpstreamLimiter') -> None:
+        self._limiter = limiter
+        self.released = False
+
+    def release(self) -> None:
+        if not self.released:
+            self.released = True
+            self._limiter._release()
+
+
+class _Waiter:
+    __slots__ = ('priority', 'seq', 'future')
+
+    def __init__(self, priority: int, seq: int, future: asyncio.Future) -> None:
+        self.priority = priority
+        self.seq = seq
+        self.future = future
+
+    def __lt__(self, other: '_Waiter') -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class UpstreamLimiter:
+    def __init__(self, name: str, limit: int, queue_size: int, queue_timeout: float, retry_after: float,
+                 window: int = 1000) -> None:
+        self.name = name
+        # limit <= 0 表示不限制
+        self.limit = limit
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self.in_flight = 0
+        # 等待者小顶堆；超时 / 被挤掉的等待者不立即删除，出队时跳过
+        self._heap: list[_Waiter] = []
+        self._seq = itertools.count()
+        self.waiting = 0
+        self.max_waiting = 0
+        self.admitted = 0
+        self.queued = 0
+        self.rejected_full = 0
+        self.rejected_timeout = 0
+        self.shed = 0
+        self.wait_samples: deque[float] = deque(maxlen=window)
+
+    def _rejected(self, status_code: int, reason: str) -> AdmissionRejected:
+        return AdmissionRejected(self.name, status_code, self.retry_after, reason)
+
+    def try_acquire(self) -> Permit | None:
+        '''
+        不排队：有空闲名额且没有人在等待时立即占用，否则返回 None
+        '''
+        if self.limit > 0 and (self.in_flight >= self.limit or self.waiting):
+            return None
+        self.in_flight += 1
+        self.admitted += 1
+        return Permit(self)
+
+    async def acquire(self, priority: int) -> Permit:
+        permit = self.try_acquire()
+        if permit is not None:
+            self.wait_samples.append(0.0)
+            return permit
+        if self.waiting >= self.queue_size:
+            victim = max((w for w in self._heap if not w.future.done()), default=None)
+            if victim is None or priority >= victim.priority:
+                self.rejected_full += 1
+                raise self._rejected(429, 'queue full')
+            # 挤掉优先级最低、最晚到达的等待者
+            self.shed += 1
+            self.waiting -= 1
+            victim.future.set_exception(self._rejected(429, 'shed by higher priority request'))
+        loop = asyncio.get_running_loop()
+        waiter = _Waiter(priority, next(self._seq), loop.create_future())
+        heapq.heappush(self._heap, waiter)
+        self.waiting += 1
+        self.queued += 1
+        self.max_waiting = max(self.max_waiting, self.waiting)
+        enqueued = loop.time()
+        try:
+            await asyncio.wait((waiter.future,), timeout=self.queue_timeout)
+        except asyncio.CancelledError:
+            self._abandon(waiter)
+            raise
+        if not waiter.future.done():
+            self._abandon(waiter)
+            self.rejected_timeout += 1
+            raise self._rejected(503, 'queue timeout')
+        # 被挤掉时抛出 AdmissionRejected
+        waiter.future.result()
+        self.wait_samples.append(loop.time() - enqueued)
+        return Permit(self)
+
+    def _abandon(self, waiter: _Waiter) -> None:
+        future = waiter.future
+        if not future.done():
+            future.cancel()
+            self.waiting -= 1
+            if len(self._heap) > 2 * self.queue_size:
+                self._heap = [w for w in self._heap if not w.future.done()]
+                heapq.heapify(self._heap)
+        elif not future.cancelled() and future.exception() is None:
+            # 名额已经转交过来但调用方被取消，交给下一个等待者
+            self._release()
+
+    def _release(self) -> None:
+        while self._heap:
+            waiter = heapq.heappop(self._heap)
+            if not waiter.future.done():
+                # 名额直接转交，in_flight 不变
+                self.waiting -= 1
+                self.admitted += 1
+                waiter.future.set_result(None)
+                return
+        self.in_flight -= 1
+
+    @staticmethod
+    def _summary(values: list[float]) -> dict[str, float]:
+        if not values:
+            return {}
+        values = sorted(values)
+        return {"avg": round(statistics.fmean(values), 4),
+                "p50": round(values[len(values) // 2], 4),
+                "p95": round(values[min(len(values) - 1, int(len(values) * 0.95))], 4),
+                "max": round(values[-1], 4)}
+
+    def stats(self) -> dict[str, Any]:
+        return {"limit": self.limit,
+                "in_flight": self.in_flight,
+                "queue_depth": self.waiting,
+                "max_queue_depth": self.max_waiting,
+                "queue_size": self.queue_size,
+                "admitted": self.admitted,
+                "queued": self.queued,
+                "rejected_full": self.rejected_full,
+                "rejected_timeout": self.rejected_timeout,
+                "shed": self.shed,
+                "wait_seconds": self._summary(list(self.wait_samples))}
+
+
+class AdmissionController:
+    def __init__(self, limits: dict[str, int], default_limit: int, queue_size: int, queue_timeout: float,
+                 retry_after: float, role_priority: dict[str, int]) -> None:
+        self.limits = limits
+        self.default_limit = default_limit
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self.role_priority = role_priority
+        # 未配置的角色（以及后台任务）排在最后
+        self.default_priority = max(role_priority.values(), default=0) + 1
+        self.limiters: dict[str, UpstreamLimiter] = {}
+
+    def limiter(self, upstream: str) -> UpstreamLimiter:
+        limiter = self.limiters.get(upstream)
+        if limiter is None:
+            limiter = self.limiters[upstream] = UpstreamLimiter(
+                upstream, self.limits.get(upstream, self.default_limit), self.queue_size, self.queue_timeout,
+                self.retry_after)
+        return limiter
+
+    def priority(self, user_role: str | None) -> int:
+        return self.role_priority.get(user_role, self.default_priority)
+
+    async def acquire(self, upstream: str, user_role: str | None = None) -> Permit:
+        with tracing.span('admission', upstream=upstream):
+            return await self.limiter(upstream).acquire(self.priority(user_role))
+
+    def try_acquire(self, upstream: str) -> Permit | None:
+        return self.limiter(upstream).try_acquire()
+
+    def stats(self) -> dict[str, Any]:
+        return {upstream: limiter.stats() for upstream, limiter in self.limiters.items()}
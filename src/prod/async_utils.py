@@ -0,0 +1,21 @@
+'''
+asyncio 辅助函数
+'''
+import asyncio
+
+
+async def cancel_and_wait(task: asyncio.Task) -> None:
+    '''
+    取消任务并等待其清理完成（关闭连接等）
+
+    调用方若处于 anyio 已取消的作用域内（例如 EventSourceResponse 在客户端断开后），
+    每次 await 都会被重复取消；直接 await task 会把取消再次传给 task，打断它的清理。
+    这里用 shield 隔离，调用方被取消时提前返回，任务自己的清理照常进行。
+    '''
+    if task.done():
+        return
+    task.cancel()
+    try:
+        await asyncio.shield(task)
+    except asyncio.CancelledError:
+        pass
@@ -0,0 +1,170 @@
+'''
+考勤查询结果缓存：按（归一化问题, user_no, user_role, 日期范围）缓存 execute_sql_stream 转发给客户端的 SSE 字节块
+
+- 从问题中解析日期范围（昨天 / 上周 / 上个月 / 2024-03-01 ...），没有时间词时按今天处理；
+  相对时间词解析成具体日期后进入缓存 key，跨天后“昨天”自然对应新的条目
+- 日期范围在今天之前结束（已关闭的周期）的条目长期缓存，包含今天的条目只缓存很短时间
+- 补卡 / 考勤修正后按日期失效：删除日期范围包含该日期的所有条目（汇总类回答跨用户，不按 user_no 区分）
+- 按周期分桶统计命中率
+'''
+import re
+from datetime import date, timedelta
+from typing import Any, AsyncIterator, Callable, Hashable
+
+from kb_cache import FrameCache
+from intent_cache import normalize_question
+
+BUCKET_UNSPECIFIED = 'unspecified'
+BUCKET_MIXED = 'mixed'
+
+_CN_DIGITS = {'一': 1, '两': 2, '二': 2, '三': 3, '四': 4, '五': 5, '六': 6, '七': 7, '八': 8, '九': 9, '十': 10}
+
+
+def _month_start(day: date) -> date:
+    return day.replace(day=1)
+
+
+def _last_month(today: date) -> tuple[date, date]:
+    end = _month_start(today) - timedelta(days=1)
+    return _month_start(end), end
+
+
+def _monday(day: date) -> date:
+    return day - timedelta(days=day.weekday())
+
+
+def _recent_days(match: re.Match, today: date) -> tuple[date, date]:
+    text = match.group(1)
+    days = int(text) if text.isdigit() else _CN_DIGITS[text]
+    return today - timedelta(days=max(1, days) - 1), today
+
+
+def _full_date(match: re.Match, today: date) -> tuple[date, date]:
+    day = date(int(match.group(1)), int(match.group(2)), int(match.group(3)))
+    return day, day
+
+
+def _month_day(match: re.Match, today: date) -> tuple[date, date]:
+    day = date(today.year, int(match.group(1)), int(match.group(2)))
+    return day, day
+
+
+# (正则, 分桶, 解析函数)；按顺序匹配，已匹配的文字不再参与后面的规则（“上个月”不会再匹配“个月”）
+_PERIOD_RULES: list[tuple[re.Pattern, str, Callable[[re.Match, date], tuple[date, date]]]] = [
+    (re.compile(r'(\d{4})\s*[-/.年]\s*(\d{1,2})\s*[-/.月]\s*(\d{1,2})\s*[日号]?'), 'date', _full_date),
+    (re.compile(r'(\d{1,2})\s*月\s*(\d{1,2})\s*[日号]'), 'date', _month_day),
+    (re.compile(r'(?:最近|近)(\d+|[一两二三四五六七八九十])天'), 'recent_days', _recent_days),
+    (re.compile(r'今天|今日|当天'), 'today', lambda m, today: (today, today)),
+    (re.compile(r'前天'), 'day_before_yesterday', lambda m, today: (today - timedelta(days=2),) * 2),
+    (re.compile(r'昨天|昨日'), 'yesterday', lambda m, today: (today - timedelta(days=1),) * 2),
+    (re.compile(r'上周|上星期|上个星期|上礼拜|上个礼拜'), 'last_week',
+     lambda m, today: (_monday(today) - timedelta(days=7), _monday(today) - timedelta(days=1))),
+    (re.compile(r'本周|这周|本星期|这星期|这个星期|本礼拜|这礼拜|这个礼拜'), 'this_week',
+     lambda m, today: (_monday(today), today)),
+    (re.compile(r'上个月|上月'), 'last_month', lambda m, today: _last_month(today)),
+    (re.compile(r'这个月|本月|这月|当月'), 'this_month', lambda m, today: (_month_start(today), today)),
+    (re.compile(r'去年|上一年'), 'last_year',
+     lambda m, today: (date(today.year - 1, 1, 1), date(today.year - 1, 12, 31))),
+    (re.compile(r'今年|本年'), 'this_year', lambda m, today: (date(today.year, 1, 1), today)),
+]
+
+
+class Period:
+    __slots__ = ('bucket', 'start', 'end')
+
+    def __init__(self, bucket: str, start: date, end: date) -> None:
+        self.bucket = bucket
+        self.start = start
+        self.end = end
+
+    def closed(self, today: date) -> bool:
+        return self.end < today
+
+    def __repr__(self) -> str:
+        return f'Period({self.bucket}, {self.start}, {self.end})'
+
+
+def resolve_period(question: str, today: date) -> Period:
+    '''
+    解析问题中的日期范围；命中多个时间词时取并集（分桶为 mixed），没有时间词时按今天处理
+    非法日期（如 2 月 30 日）忽略
+    '''
+    periods = []
+    for pattern, bucket, resolve in _PERIOD_RULES:
+        for match in pattern.finditer(question):
+            try:
+                start, end = resolve(match, today)
+            except ValueError:
+                continue
+            periods.append(Period(bucket, start, end))
+        question = pattern.sub(' ', question)
+    if not periods:
+        return Period(BUCKET_UNSPECIFIED, today, today)
+    if len(periods) == 1:
+        return periods[0]
+    return Period(BUCKET_MIXED, min(p.start for p in periods), max(p.end for p in periods))
+
+
+class AttendanceCache:
+    def __init__(self, frames: FrameCache, closed_ttl: float, open_ttl: float,
+                 today: Callable[[], date] = date.today,
+                 on_lookup: Callable[[str, bool], None] | None = None) -> None:
+        '''
+        closed_ttl: 日期范围在今天之前结束的条目 TTL；open_ttl: 包含今天的条目 TTL（<= 0 不缓存）
+        on_lookup: 每次查询调用一次，参数为分桶与是否命中
+        '''
+        self.frames = frames
+        self.closed_ttl = closed_ttl
+        self.open_ttl = open_ttl
+        self.today = today
+        self.on_lookup = on_lookup
+        # 分桶 -> [命中数, 未命中数]
+        self.buckets: dict[str, list[int]] = {}
+
+    def resolve(self, question: str, user_no: str, user_role: str) -> tuple[Hashable, Period]:
+        '''
+        返回缓存 key 与解析出的日期范围；同一次请求的查询与写入使用同一个 key（避免跨零点时前后不一致）
+        '''
+        period = resolve_period(question, self.today())
+        key = (normalize_question(question), user_no, user_role, period.start, period.end)
+        return key, period
+
+    def ttl(self, period: Period) -> float:
+        return self.closed_ttl if period.closed(self.today()) else self.open_ttl
+
+    def contains(self, key: Hashable) -> bool:
+        return self.frames.contains(key)
+
+    async def fetch(self, key: Hashable, period: Period, interval: float = 0.0) -> AsyncIterator[bytes] | None:
+        cached = await self.frames.fetch(key, interval)
+        counts = self.buckets.setdefault(period.bucket, [0, 0])
+        counts[cached is None] += 1
+        if self.on_lookup is not None:
+            self.on_lookup(period.bucket, cached is not None)
+        return cached
+
+    def tee(self, key: Hashable, period: Period, stream: AsyncIterator[bytes], done: bytes,
+            skip: bytes = b'') -> AsyncIterator[bytes]:
+        ttl = self.ttl(period)
+        if ttl <= 0:
+            return stream
+        return self.frames.tee(key, stream, done=done, skip=skip, ttl=ttl)
+
+    async def invalidate(self, day: date | None = None) -> int:
+        '''
+        day 为空时清空全部，否则删除日期范围包含 day 的条目；返回本 worker 删除的条目数
+        启用共享存储时共享条目无法按日期筛选，所有 worker 的考勤缓存都会清空
+        '''
+        if day is None:
+            removed = self.frames.invalidate()
+        else:
+            removed = self.frames.invalidate_where(lambda key: key[3] <= day <= key[4])
+        await self.frames.invalidate_shared()
+        return removed
+
+    def stats(self) -> dict[str, Any]:
+        stats = self.frames.stats()
+        stats["buckets"] = {bucket: {"hits": hits, "misses": misses,
+                                     "hit_ratio": round(hits / (hits + misses), 4) if hits + misses else 0.0}
+                            for bucket, (hits, misses) in sorted(self.buckets.items())}
+        return stats
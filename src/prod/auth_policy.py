@@ -0,0 +1,57 @@
+'''
+按（角色, 路由）的权限校验
+
+配置格式与 auth_role_allown_map 一致：{路由: [允许的角色, ...]}，路由为 attendance / knowledge / chat，
+未出现在配置中的路由不限角色。加载时编译为 frozenset，请求时只做集合查找
+
+查看权限矩阵（在 src/prod 目录下）：
+    python auth_policy.py [policy.json]
+经过网关的权限矩阵测试见 tests/test_auth_policy.py
+'''
+import json
+import sys
+from typing import Iterable
+
+ROUTES = ("attendance", "knowledge", "chat")
+
+
+class AuthPolicy:
+    def __init__(self, rules: dict[str, Iterable[str] | None]) -> None:
+        self._rules = {route: list(roles) for route, roles in rules.items() if roles is not None}
+        # 允许的 (角色, 路由) 组合与不限角色的路由
+        self._allowed = frozenset((role, route) for route, roles in self._rules.items() for role in roles)
+        self._open_routes = frozenset(route for route in ROUTES if route not in self._rules)
+        self.roles = frozenset(role for roles in self._rules.values() for role in roles)
+
+    @classmethod
+    def load(cls, path: str) -> 'AuthPolicy':
+        with open(path, encoding='utf-8') as f:
+            return cls(json.load(f))
+
+    def allows(self, role: str, route: str) -> bool:
+        return route in self._open_routes or (role, route) in self._allowed
+
+    def allowed_routes(self, role: str) -> frozenset[str]:
+        return self._open_routes | frozenset(route for route in ROUTES if (role, route) in self._allowed)
+
+    def rules(self) -> dict[str, list[str]]:
+        return {route: roles[:] for route, roles in self._rules.items()}
+
+
+def matrix(policy: AuthPolicy, roles: Iterable[str] = ()) -> list[tuple[str, dict[str, bool]]]:
+    '''
+    每个角色（含配置外的角色）对每个路由的校验结果
+    '''
+    rows = sorted(set(roles) | policy.roles) + ['(other)']
+    return [(role, {route: policy.allows(role, route) for route in ROUTES}) for role in rows]
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        policy = AuthPolicy.load(sys.argv[1])
+    else:
+        policy = AuthPolicy({"attendance": ["Boss", "Assistant", "HR"],
+                             "chat": ["Boss", "Assistant", "HR", "Manager", "Employee"]})
+    print('role'.ljust(12) + ''.join(route.ljust(12) for route in ROUTES))
+    for role, result in matrix(policy):
+        print(role.ljust(12) + ''.join(('allow' if result[route] else 'deny').ljust(12) for route in ROUTES))
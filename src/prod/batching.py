@@ -0,0 +1,109 @@
+'''
+微批处理：并发到达的请求先排队几毫秒，凑成一批后一次调用处理函数，再把结果分发回各个等待者
+
+- 队列达到 max_batch 立即发出，否则第一个请求入队 max_wait 秒后发出
+- 等待者被取消不影响同批其他请求；整批都已取消时不再调用处理函数
+- 统计批大小分布与排队带来的额外延迟
+'''
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Generic, Sequence, TypeVar
+
+T = TypeVar('T')
+R = TypeVar('R')
+
+
+class _Pending(Generic[T]):
+    __slots__ = ('item', 'future', 'enqueued')
+
+    def __init__(self, item: T, future: asyncio.Future) -> None:
+        self.item = item
+        self.future = future
+        self.enqueued = time.perf_counter()
+
+
+class MicroBatcher(Generic[T, R]):
+    def __init__(self, handler: Callable[[list[T]], Awaitable[Sequence[R]]], max_batch: int, max_wait: float,
+                 on_batch: Callable[[int, float], None] | None = None) -> None:
+        '''
+        handler: 接收一批请求，按相同顺序返回结果；抛出异常时整批请求都收到该异常
+        on_batch: 每发出一批调用一次，参数为批大小与该批最长的排队时间（秒）
+        '''
+        self.handler = handler
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max_wait
+        self.on_batch = on_batch
+        self._pending: list[_Pending[T]] = []
+        self._timer: asyncio.TimerHandle | None = None
+        self._tasks: set[asyncio.Task] = set()
+        self.submitted = 0
+        self.batched = 0
+        self.batches = 0
+        self.dropped = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        # 批大小 -> 批数，批大小不超过 max_batch
+        self.sizes: dict[int, int] = {}
+
+    async def submit(self, item: T) -> R:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append(_Pending(item, future))
+        self.submitted += 1
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch = [pending for pending in self._pending if not pending.future.done()]
+        self.dropped += len(self._pending) - len(batch)
+        self._pending = []
+        if not batch:
+            return
+        now = time.perf_counter()
+        waits = [now - pending.enqueued for pending in batch]
+        self._record(len(batch), waits)
+        task = asyncio.create_task(self._run(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _record(self, size: int, waits: list[float]) -> None:
+        self.batches += 1
+        self.batched += size
+        self.sizes[size] = self.sizes.get(size, 0) + 1
+        self.wait_total += sum(waits)
+        self.wait_max = max(self.wait_max, max(waits))
+        if self.on_batch is not None:
+            self.on_batch(size, max(waits))
+
+    async def _run(self, batch: list[_Pending[T]]) -> None:
+        try:
+            results = await self.handler([pending.item for pending in batch])
+            if len(results) != len(batch):
+                raise ValueError(f'batch handler returned {len(results)} results for {len(batch)} items')
+        except Exception as e:
+            for pending in batch:
+                if not pending.future.done():
+                    pending.future.set_exception(e)
+            return
+        for pending, result in zip(batch, results):
+            if not pending.future.done():
+                pending.future.set_result(result)
+
+    def stats(self) -> dict[str, Any]:
+        return {"submitted": self.submitted,
+                "batches": self.batches,
+                "dropped": self.dropped,
+                "pending": len(self._pending),
+                "in_flight": len(self._tasks),
+                "max_batch": self.max_batch,
+                "max_wait_ms": self.max_wait * 1000,
+                "mean_batch_size": round(self.batched / self.batches, 2) if self.batches else 0.0,
+                "batch_sizes": {str(size): self.sizes[size] for size in sorted(self.sizes)},
+                "mean_queue_delay_ms": round(self.wait_total / self.batched * 1000, 3) if self.batched else 0.0,
+                "max_queue_delay_ms": round(self.wait_max * 1000, 3)}
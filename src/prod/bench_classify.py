@@ -0,0 +1,172 @@
+'''
+意图识别输出方式对比：原自由文本 prompt（max_tokens=512 + 子串匹配）与约束输出（单字母编号，max_tokens=1，
+可选 guided_choice / logprobs），统计准确率、延迟、输出 token 数与置信度
+
+用法（在 src/prod 目录下）：
+    python bench_classify.py                          # 使用 LLM_BASE_URL 指向的真实模型
+    python bench_classify.py --dataset labeled.jsonl  # 每行 {"question": ..., "intent": ...}
+    python bench_classify.py --fake                   # 本地假 LLM，只验证流程；自由文本偶尔同时提到两个负责人
+'''
+import argparse
+import asyncio
+import json
+import time
+
+import settings
+from client import AsyncCustomOpenaiClient, classify_generate_config, parse_classification
+from fake_upstreams import build_fake_llm_app, serve_in_thread
+from intent_gataway_api import (INTENT_CODE_PROMPT_PREFIX, INTENT_CODE_SYS_PROMPT, INTENT_GENERATE_CONFIG,
+                                INTENT_PROMPT_PREFIX, INTENT_SYS_PROMPT)
+from intents import INTENT_ATTENDANCE, INTENT_CHAT, INTENT_CODES, INTENT_KNOWLEDGE, parse_intent
+
+LABELED_QUESTIONS = [
+    ('昨天有多少人迟到', INTENT_ATTENDANCE),
+    ('上周谁请假了', INTENT_ATTENDANCE),
+    ('本月加班时长最多的是谁', INTENT_ATTENDANCE),
+    ('今天有谁没打卡', INTENT_ATTENDANCE),
+    ('研发部上个月的旷工人数', INTENT_ATTENDANCE),
+    ('张三这周的工时是多少', INTENT_ATTENDANCE),
+    ('昨天谁来得最早', INTENT_ATTENDANCE),
+    ('早退的员工有哪些', INTENT_ATTENDANCE),
+    ('调休余额还有多少天', INTENT_ATTENDANCE),
+    ('今天几个人在休假', INTENT_ATTENDANCE),
+    ('考勤制度是什么', INTENT_KNOWLEDGE),
+    ('如何申请年假', INTENT_KNOWLEDGE),
+    ('一天要打几次卡', INTENT_KNOWLEDGE),
+    ('迟到会扣多少钱', INTENT_KNOWLEDGE),
+    ('报销流程是怎样的', INTENT_KNOWLEDGE),
+    ('加班费怎么计算', INTENT_KNOWLEDGE),
+    ('新员工入职需要准备哪些材料', INTENT_KNOWLEDGE),
+    ('出差补贴标准', INTENT_KNOWLEDGE),
+    ('病假需要提交什么证明', INTENT_KNOWLEDGE),
+    ('VPN 怎么配置', INTENT_KNOWLEDGE),
+    ('今天天气怎么样', INTENT_CHAT),
+    ('讲个笑话', INTENT_CHAT),
+    ('你好', INTENT_CHAT),
+    ('帮我写一首关于春天的诗', INTENT_CHAT),
+    ('一加一等于几', INTENT_CHAT),
+    ('推荐几本管理类的书', INTENT_CHAT),
+    ('翻译一下 good morning', INTENT_CHAT),
+    ('你是谁', INTENT_CHAT),
+    ('周末去哪里玩比较好', INTENT_CHAT),
+    ('怎么做红烧肉', INTENT_CHAT),
+]
+
+
+def load_dataset(path: str) -> list[tuple[str, str]]:
+    with open(path, encoding='utf-8') as f:
+        return [(row['question'], row['intent']) for row in map(json.loads, f) if row]
+
+
+def fake_label(truth: dict[str, str]):
+    '''
+    假 LLM 的输出：约束 prompt 返回编号；自由文本每 4 个知识库问题有 1 个同时提到考勤数据查询助理（模拟跑题）
+    '''
+    codes = {label: code for code, label in INTENT_CODES.items()}
+
+    def label(prompt: str) -> str:
+        question = prompt.rsplit('问：', 1)[-1].split('\n', 1)[0].strip()
+        intent = truth.get(question, INTENT_CHAT)
+        if '答：C' in prompt:
+            return codes[intent]
+        if intent == INTENT_KNOWLEDGE and sum(map(ord, question)) % 4 == 0:
+            return f'{INTENT_KNOWLEDGE}。该问题涉及考勤规则，不需要{INTENT_ATTENDANCE}查询具体数据。'
+        return intent
+
+    return label
+
+
+async def classify_prompt(client: AsyncCustomOpenaiClient, question: str) -> tuple[str, float | None, int]:
+    messages = [{"role": "system", "content": INTENT_SYS_PROMPT},
+                {"role": "user", "content": INTENT_PROMPT_PREFIX.format(question)}]
+    response = await client.achat_completions(messages, generate_config=INTENT_GENERATE_CONFIG)
+    tokens = response.usage.completion_tokens if response.usage else 0
+    return parse_intent(response.choices[0].message.content or ''), None, tokens
+
+
+async def classify_constrained(client: AsyncCustomOpenaiClient, question: str, guided: bool,
+                               logprobs: bool) -> tuple[str | None, float | None, int]:
+    messages = [{"role": "system", "content": INTENT_CODE_SYS_PROMPT},
+                {"role": "user", "content": INTENT_CODE_PROMPT_PREFIX.format(question)}]
+    config = classify_generate_config(list(INTENT_CODES), guided=guided, logprobs=logprobs)
+    response = await client.achat_completions(messages, generate_config=config)
+    tokens = response.usage.completion_tokens if response.usage else 0
+    intent, confidence = parse_classification(response, INTENT_CODES)
+    return intent, confidence, tokens
+
+
+def percentile(values: list[float], p: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))] if ordered else 0.0
+
+
+async def run_mode(name: str, classify, dataset: list[tuple[str, str]], repeats: int,
+                   concurrency: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, confidences, tokens = [], [], []
+    correct = invalid = errors = 0
+
+    async def one(question: str, expected: str) -> None:
+        nonlocal correct, invalid, errors
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                intent, confidence, used = await classify(question)
+            except Exception:
+                errors += 1
+                return
+            latencies.append(time.perf_counter() - started)
+            tokens.append(used)
+            if confidence is not None:
+                confidences.append(confidence)
+            if intent is None:
+                invalid += 1
+            elif intent == expected:
+                correct += 1
+
+    await asyncio.gather(*(one(question, expected) for _ in range(repeats) for question, expected in dataset))
+    total = len(dataset) * repeats
+    return {"mode": name,
+            "requests": total,
+            "accuracy": round(correct / total, 4),
+            "invalid": invalid,
+            "errors": errors,
+            "p50_ms": round(percentile(latencies, 0.5) * 1000, 1),
+            "p95_ms": round(percentile(latencies, 0.95) * 1000, 1),
+            "mean_completion_tokens": round(sum(tokens) / len(tokens), 2) if tokens else 0.0,
+            "mean_confidence": round(sum(confidences) / len(confidences), 4) if confidences else None}
+
+
+async def main(args: argparse.Namespace) -> None:
+    dataset = load_dataset(args.dataset) if args.dataset else LABELED_QUESTIONS
+    base_url = settings.LLM_BASE_URL
+    if args.fake:
+        truth = dict(dataset)
+        serve_in_thread(build_fake_llm_app(args.fake_latency, label=fake_label(truth),
+                                           decode_interval=args.fake_decode_interval), port=args.fake_port)
+        base_url = f'http://127.0.0.1:{args.fake_port}/v1'
+    client = AsyncCustomOpenaiClient(default_model=settings.LLM_MODEL, base_url=base_url,
+                                     api_key=settings.LLM_API_KEY)
+    modes = [('prompt', lambda q: classify_prompt(client, q)),
+             ('constrained', lambda q: classify_constrained(client, q, guided=False, logprobs=True))]
+    if not args.no_guided:
+        modes.append(('constrained+guided', lambda q: classify_constrained(client, q, guided=True, logprobs=True)))
+    print('mode'.ljust(20) + 'accuracy  invalid  errors  p50_ms  p95_ms  tokens  confidence')
+    for name, classify in modes:
+        result = await run_mode(name, classify, dataset, args.repeats, args.concurrency)
+        print(f'{name:<20}{result["accuracy"]:<10}{result["invalid"]:<9}{result["errors"]:<8}'
+              f'{result["p50_ms"]:<8}{result["p95_ms"]:<8}{result["mean_completion_tokens"]:<8}'
+              f'{result["mean_confidence"]}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--dataset', default='', help='标注数据 jsonl，为空使用内置问题')
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--no-guided', action='store_true', help='服务端不支持 guided_choice 时跳过该模式')
+    parser.add_argument('--fake', action='store_true', help='使用本地假 LLM')
+    parser.add_argument('--fake-port', type=int, default=18092)
+    parser.add_argument('--fake-latency', type=float, default=0.02)
+    parser.add_argument('--fake-decode-interval', type=float, default=0.005, help='假 LLM 每个输出 token 的耗时')
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,93 @@
+'''
+并发基准：本地假 LLM + 网关，N 个并发 /getaway_api 请求应并行完成而不是串行排队
+
+用法（在 src/prod 目录下）：
+    python bench_concurrency.py --concurrency 20 --latency 0.5
+'''
+import argparse
+import asyncio
+import json
+import os
+import threading
+import time
+
+from aiohttp import web
+
+from fake_upstreams import build_fake_llm_app, start_in_thread
+
+
+async def drive(gateway_url: str, concurrency: int) -> list[float]:
+    import aiohttp
+
+    async def one(session: aiohttp.ClientSession, i: int) -> float:
+        # 每个请求的问题不同，避免命中意图缓存
+        body = {"question": f"今天天气怎么样{i}", "user_id": "1", "user_no": "1", "user_role": "Boss", "topic_id": "1"}
+        started = time.perf_counter()
+        async with session.post(gateway_url, json=body) as response:
+            async for _ in response.content:
+                pass
+        return time.perf_counter() - started
+
+    async with aiohttp.ClientSession() as session:
+        return await asyncio.gather(*(one(session, i) for i in range(concurrency)))
+
+
+async def fetch_json(url: str) -> dict:
+    import aiohttp
+
+    async with aiohttp.ClientSession() as session:
+        async with session.get(url) as response:
+            return await response.json()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--concurrency', type=int, default=20)
+    parser.add_argument('--latency', type=float, default=0.5, help='假 LLM 每次调用的延迟（秒）')
+    parser.add_argument('--llm-port', type=int, default=18082)
+    parser.add_argument('--gateway-port', type=int, default=18088)
+    args = parser.parse_args()
+
+    async def serve_llm(ready: threading.Event):
+        runner = web.AppRunner(build_fake_llm_app(args.latency))
+        await runner.setup()
+        await web.TCPSite(runner, '127.0.0.1', args.llm_port).start()
+        ready.set()
+
+    start_in_thread(serve_llm)
+
+    # 网关在导入时读取配置，必须先设置环境变量
+    os.environ['LLM_BASE_URL'] = f'http://127.0.0.1:{args.llm_port}/v1'
+    import uvicorn
+    from intent_gataway_api import app
+
+    async def serve_gateway(ready: threading.Event):
+        server = uvicorn.Server(uvicorn.Config(app, host='127.0.0.1', port=args.gateway_port, log_level='warning'))
+        asyncio.get_running_loop().create_task(server.serve())
+        while not server.started:
+            await asyncio.sleep(0.01)
+        ready.set()
+
+    start_in_thread(serve_gateway)
+
+    started = time.perf_counter()
+    latencies = asyncio.run(drive(f'http://127.0.0.1:{args.gateway_port}/getaway_api', args.concurrency))
+    wall = time.perf_counter() - started
+    pool_stats = asyncio.run(fetch_json(f'http://127.0.0.1:{args.gateway_port}/stats/pools'))
+    stream_stats = asyncio.run(fetch_json(f'http://127.0.0.1:{args.gateway_port}/stats/chat_stream'))
+    # 开放领域分支每个请求调用两次 LLM（意图识别 + 回答）
+    serial = args.concurrency * 2 * args.latency
+    print(json.dumps({
+        "concurrency": args.concurrency,
+        "llm_latency": args.latency,
+        "wall_seconds": round(wall, 3),
+        "serial_estimate_seconds": round(serial, 3),
+        "parallel_speedup": round(serial / wall, 2),
+        "max_request_seconds": round(max(latencies), 3),
+        "llm_pool": pool_stats["llm"],
+        "chat_stream": stream_stats,
+    }, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+'''
+SSE 帧编码微基准：原路径 json.dumps(dict) + ServerSentEvent.encode() 与预构造前缀 / 后缀的 TypedFrameEncoder 对比
+先校验输出逐字节一致（orjson 除外），再统计每秒帧数与每帧的临时内存分配
+
+用法（在 src/prod 目录下）：
+    python bench_sse_frames.py --frames 200000
+'''
+import argparse
+import json
+import random
+import time
+import tracemalloc
+
+from sse_starlette.sse import ServerSentEvent
+
+from intent_gataway_api import knowledge_event, knowledge_frame
+from sse_frames import TypedFrameEncoder, orjson_dumps
+
+
+def sample_payloads(count: int) -> list[str]:
+    '''
+    模拟三类输出：对话增量（短中文）、考勤结果行、知识库 answer / docs JSON
+    '''
+    rng = random.Random(0)
+    text = '工作时间规定中标准工时制的上班时间是几点到几点，迟到早退按制度处理。'
+    payloads = []
+    for i in range(count):
+        kind = i % 3
+        if kind == 0:
+            payloads.append(''.join(rng.choice(text) for _ in range(rng.randint(1, 16))))
+        elif kind == 1:
+            payloads.append(f'| {rng.randint(1000, 9999)} | 张三 | 2024-07-0{rng.randint(1, 9)} | 迟到 {rng.randint(1, 59)} 分钟 |')
+        else:
+            payloads.append(json.dumps({"answer": text[:rng.randint(1, 20)]}, ensure_ascii=False))
+    payloads.append(json.dumps({"docs": ["出处 [1] 行政办公管理制度.pdf"]}, ensure_ascii=False))
+    payloads.append('含\n换行与 "引号" 和 \\ 反斜杠\t')
+    return payloads
+
+
+def legacy_typed(frame_type: int):
+    return lambda data: ServerSentEvent(json.dumps({"data": data, "type": frame_type}), sep='\r\n').encode()
+
+
+def legacy_knowledge(data: str) -> bytes:
+    return ServerSentEvent(knowledge_frame(data), sep='\r\n').encode()
+
+
+def check_identical(payloads: list[str]) -> None:
+    typed = TypedFrameEncoder(3)
+    encode_legacy = legacy_typed(3)
+    frames = TypedFrameEncoder(2)
+    for data in payloads:
+        assert typed.encode(data) == encode_legacy(data), data
+        assert knowledge_event(data, frames) == legacy_knowledge(data), data
+    assert typed.done == encode_legacy('[DONE]')
+
+
+def frames_per_second(encode, payloads: list[str], total: int) -> float:
+    rounds = max(1, total // len(payloads))
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for data in payloads:
+            encode(data)
+    return rounds * len(payloads) / (time.perf_counter() - started)
+
+
+def transient_bytes(encode, payloads: list[str]) -> float:
+    '''
+    每帧编码过程中的峰值内存减去结果本身，即中间对象占用的字节数
+    '''
+    total = 0
+    tracemalloc.start()
+    for data in payloads:
+        tracemalloc.reset_peak()
+        result = encode(data)
+        current, peak = tracemalloc.get_traced_memory()
+        total += peak - current
+        del result
+    tracemalloc.stop()
+    return total / len(payloads)
+
+
+def main(args: argparse.Namespace) -> None:
+    payloads = sample_payloads(args.samples)
+    check_identical(payloads)
+    print('输出逐字节一致：typed / knowledge / done')
+    knowledge_frames = TypedFrameEncoder(2)
+    modes = [('legacy typed', legacy_typed(3)),
+             ('encoder typed', TypedFrameEncoder(3).encode),
+             ('legacy knowledge', legacy_knowledge),
+             ('encoder knowledge', lambda data: knowledge_event(data, knowledge_frames))]
+    if orjson_dumps() is not None:
+        modes.append(('encoder typed+orjson', TypedFrameEncoder(3, use_orjson=True).encode))
+    else:
+        print('未安装 orjson，跳过 orjson 模式')
+    print('mode'.ljust(24) + 'frames/s'.rjust(12) + 'transient B/frame'.rjust(20))
+    for name, encode in modes:
+        rate = frames_per_second(encode, payloads, args.frames)
+        transient = transient_bytes(encode, payloads[:args.alloc_samples])
+        print(f'{name:<24}{rate:>12,.0f}{transient:>20.1f}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--frames', type=int, default=200000)
+    parser.add_argument('--samples', type=int, default=1000)
+    parser.add_argument('--alloc-samples', type=int, default=300)
+    main(parser.parse_args())
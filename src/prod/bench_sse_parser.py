@@ -0,0 +1,122 @@
+'''
+知识库流解析微基准：原逐行解码 + 正则 + 逐字符拼接 与 增量 SSE 解析器对比
+
+用法（在 src/prod 目录下）：
+    python bench_sse_parser.py --chunks 5000            # 使用合成的录制流
+    python bench_sse_parser.py --recording stream.bin   # 使用抓包保存的原始字节流
+'''
+import argparse
+import json
+import random
+import re
+import time
+
+import settings
+from intent_gataway_api import UPSTREAM_SPECS, knowledge_frame
+from sse_parser import SSEParser
+
+
+def synthetic_recording(chunks: int) -> bytes:
+    '''
+    模拟 knowledge_base_chat 的输出：逐段 answer，摘要行（冒号后有 / 无空格两种写法），最后一条 docs，然后 [DONE]
+    '''
+    rng = random.Random(0)
+    parts = []
+    for i in range(chunks):
+        answer = ''.join(rng.choice('工作时间规定中标准工时制的上班时间是几点到几点') for _ in range(rng.randint(1, 8)))
+        parts.append(f'data: {json.dumps({"answer": answer}, ensure_ascii=False)}\r\n\r\n')
+    parts.append('data:[summary]共检索到 3 篇相关文档\r\n\r\n')
+    parts.append('data: [summary]以上回答仅供参考\r\n\r\n')
+    parts.append(f'data: {json.dumps({"docs": ["出处 [1] 行政办公管理制度.pdf"] * 3}, ensure_ascii=False)}\r\n\r\n')
+    parts.append('data:[DONE]\r\n\r\n')
+    return ''.join(parts).encode('utf-8')
+
+
+def network_chunks(raw: bytes, seed: int = 1) -> list[bytes]:
+    # 按随机大小切分，模拟 TCP 读到的字节块
+    rng = random.Random(seed)
+    chunks, i = [], 0
+    while i < len(raw):
+        size = rng.randint(64, 4096)
+        chunks.append(raw[i:i + size])
+        i += size
+    return chunks
+
+
+def legacy(raw: bytes) -> list[str]:
+    '''
+    原实现的同步等价版本（原代码对 str 使用 async for，实际无法运行）
+    '''
+    frames = []
+    for line in raw.splitlines(keepends=True):
+        line = line.decode('utf-8').strip()
+        if "data:[DONE]" in line:
+            frames.append(json.dumps({"data": "[DONE]", "type": 2}))
+            break
+        if line:
+            data_str = re.sub(r'^data: ', '', line)
+            answer = ""
+            if "docs" in data_str:
+                frames.append(json.dumps({"data": data_str, "type": 2}))
+            elif "data:[summary]" in data_str:
+                frames.append(json.dumps({"data": data_str, "type": 2}))
+            else:
+                for token in data_str:
+                    answer += token
+                frames.append(json.dumps({"data": answer, "docs": data_str, "type": 2}))
+    return frames
+
+
+def incremental(chunks: list[bytes]) -> list[str]:
+    frames = []
+    parser = SSEParser(**UPSTREAM_SPECS["knowledge"].decoder_options)
+    for chunk in chunks:
+        for event in parser.feed(chunk):
+            if event.data == '[DONE]':
+                frames.append(json.dumps({"data": "[DONE]", "type": 2}))
+                return frames
+            frames.append(knowledge_frame(event.data))
+    return frames
+
+
+def timeit(fn, *args, repeat: int) -> tuple[float, list[str]]:
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn(*args)
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--chunks', type=int, default=5000)
+    parser.add_argument('--recording', help='原始 SSE 字节流文件')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    # 与原实现对比输出，使用字符串转义格式
+    settings.KNOWLEDGE_JSON_PASSTHROUGH = False
+
+    if args.recording:
+        with open(args.recording, 'rb') as f:
+            raw = f.read()
+    else:
+        raw = synthetic_recording(args.chunks)
+    chunks = network_chunks(raw)
+
+    # 原实现按行读取（aiohttp 的 readline 已拼好整行），不计入切块开销
+    legacy_seconds, legacy_frames = timeit(legacy, raw, repeat=args.repeat)
+    new_seconds, new_frames = timeit(incremental, chunks, repeat=args.repeat)
+    print(json.dumps({
+        "bytes": len(raw),
+        "events": len(new_frames),
+        "same_output": legacy_frames == new_frames,
+        "legacy_ms": round(legacy_seconds * 1000, 2),
+        "incremental_ms": round(new_seconds * 1000, 2),
+        "speedup": round(legacy_seconds / new_seconds, 2),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
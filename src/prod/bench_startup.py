@@ -0,0 +1,167 @@
+'''
+多 worker 冷启动与吞吐扩展测试：假上游（独立进程）+ python serve.py（GATEWAY_WORKERS=N）+ 多进程压测客户端
+
+- 冷启动：启动 serve.py 到 /health 第一次返回 200 的时间，以及看到全部 N 个 worker（/health 返回的 pid）的时间
+- 吞吐：固定并发压测 --duration 秒，统计每秒完成的请求数、每个 worker 的吞吐与相对单 worker 的扩展效率
+- 默认压测知识库问题（意图缓存 + 回答缓存命中，主要消耗网关自身 CPU）；--uncached 关闭回答缓存，走假知识库
+
+用法（在 src/prod 目录下）：
+    python bench_startup.py --workers 1,2,4 --duration 10
+    python bench_startup.py --workers 1,2 --shared sqlite:////tmp/gateway_bench.db
+'''
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import signal
+import subprocess
+import sys
+import time
+import urllib.request
+
+import aiohttp
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+QUESTIONS = ['考勤制度是什么', '如何申请年假', '一天要打几次卡', '迟到会扣多少钱', '报销流程是怎样的',
+             '加班费怎么计算', '出差补贴标准', '病假需要提交什么证明']
+
+
+def measure_import() -> float:
+    code = 'import time; t = time.perf_counter(); import intent_gataway_api; print(time.perf_counter() - t)'
+    env = {**os.environ, 'LOG_LEVEL': 'WARNING'}
+    output = subprocess.run([sys.executable, '-c', code], cwd=HERE, env=env, capture_output=True, text=True,
+                            check=True).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def health(url: str) -> dict | None:
+    try:
+        with urllib.request.urlopen(url + '/health', timeout=0.5) as response:
+            return json.loads(response.read())
+    except OSError:
+        return None
+
+
+def start_gateway(args, workers: int) -> tuple[subprocess.Popen, dict[str, float]]:
+    env = {**os.environ,
+           'GATEWAY_HOST': '127.0.0.1', 'GATEWAY_PORT': str(args.port), 'GATEWAY_WORKERS': str(workers),
+           'LLM_BASE_URL': f'http://127.0.0.1:{args.upstream_port_base}/v1',
+           'ATTENDANCE_URL': f'http://127.0.0.1:{args.upstream_port_base + 1}/execute_sql_stream',
+           'KNOWLEDGE_URL': f'http://127.0.0.1:{args.upstream_port_base + 2}/chat/knowledge_base_chat',
+           'SHARED_STORE_URL': args.shared, 'LOG_LEVEL': 'WARNING',
+           'INTENT_CACHE_PREWARM': '0', 'PROMPT_PREWARM_INTERVAL': '0'}
+    if args.uncached:
+        env['KB_CACHE_ENABLED'] = '0'
+    url = f'http://127.0.0.1:{args.port}'
+    started = time.perf_counter()
+    process = subprocess.Popen([sys.executable, 'serve.py'], cwd=HERE, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    timings: dict[str, float] = {}
+    pids: set[int] = set()
+    deadline = started + args.startup_timeout
+    while time.perf_counter() < deadline and len(pids) < workers:
+        result = health(url)
+        if result is not None:
+            timings.setdefault('first_ready_s', round(time.perf_counter() - started, 3))
+            pids.add(result['worker'])
+        else:
+            time.sleep(0.01)
+    timings['all_ready_s'] = round(time.perf_counter() - started, 3) if len(pids) >= workers else None
+    timings['workers_seen'] = len(pids)
+    return process, timings
+
+
+def stop(process: subprocess.Popen) -> None:
+    process.send_signal(signal.SIGINT)
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+async def drive(url: str, concurrency: int, duration: float, offset: int) -> tuple[int, int]:
+    completed = errors = 0
+    deadline = time.perf_counter() + duration
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        async def worker(index: int) -> None:
+            nonlocal completed, errors
+            i = index
+            while time.perf_counter() < deadline:
+                body = {"question": QUESTIONS[i % len(QUESTIONS)], "user_id": "bench", "user_no": "bench",
+                        "user_role": "Boss", "topic_id": f"bench-{offset}-{index}-{i}"}
+                i += concurrency
+                try:
+                    async with session.post(url + '/getaway_api', json=body) as response:
+                        await response.read()
+                        if response.status == 200:
+                            completed += 1
+                        else:
+                            errors += 1
+                except aiohttp.ClientError:
+                    errors += 1
+
+        await asyncio.gather(*(worker(index) for index in range(concurrency)))
+    return completed, errors
+
+
+def client_process(url: str, concurrency: int, duration: float, offset: int) -> tuple[int, int]:
+    return asyncio.run(drive(url, concurrency, duration, offset))
+
+
+def load(args, url: str) -> dict[str, float]:
+    per_client = max(1, args.concurrency // args.clients)
+    # 预热：每个问题先请求一次，写入意图缓存与回答缓存
+    client_process(url, len(QUESTIONS), 1.0, -1)
+    with multiprocessing.get_context('spawn').Pool(args.clients) as pool:
+        results = pool.starmap(client_process, [(url, per_client, args.duration, offset)
+                                                for offset in range(args.clients)])
+    completed = sum(result[0] for result in results)
+    errors = sum(result[1] for result in results)
+    return {"rps": round(completed / args.duration, 1), "errors": errors}
+
+
+def main(args: argparse.Namespace) -> None:
+    print(f'CPU 核数：{os.cpu_count()}（worker 数超过核数时吞吐不会继续提升）')
+    print(f'导入 intent_gataway_api：{measure_import():.3f}s')
+    upstreams = subprocess.Popen([sys.executable, 'fake_upstreams.py', '--latency', '0', '--token-interval', '0',
+                                  '--label', '知识库助理', '--llm-port', str(args.upstream_port_base),
+                                  '--attendance-port', str(args.upstream_port_base + 1),
+                                  '--knowledge-port', str(args.upstream_port_base + 2)],
+                                 cwd=HERE, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    time.sleep(1.0)
+    rows = []
+    try:
+        for workers in args.workers:
+            process, timings = start_gateway(args, workers)
+            try:
+                result = load(args, f'http://127.0.0.1:{args.port}') if timings['all_ready_s'] else {}
+            finally:
+                stop(process)
+            rows.append({"workers": workers, **timings, **result})
+    finally:
+        upstreams.terminate()
+        upstreams.wait()
+    base = rows[0].get("rps") if rows else None
+    print('workers  first_ready_s  all_ready_s  rps       rps/worker  scaling  errors')
+    for row in rows:
+        rps = row.get("rps", 0.0)
+        scaling = f'{rps / base:.2f}x' if base else '-'
+        print(f'{row["workers"]:<9}{row["first_ready_s"]!s:<15}{row["all_ready_s"]!s:<13}{rps:<10}'
+              f'{rps / row["workers"]:<12.1f}{scaling:<9}{row.get("errors", "-")}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=lambda value: [int(item) for item in value.split(',')], default=[1, 2, 4])
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--clients', type=int, default=2, help='压测客户端进程数')
+    parser.add_argument('--port', type=int, default=18288)
+    parser.add_argument('--upstream-port-base', type=int, default=18282)
+    parser.add_argument('--shared', default='', help='SHARED_STORE_URL，例如 sqlite:////tmp/gateway_bench.db')
+    parser.add_argument('--uncached', action='store_true', help='关闭知识库回答缓存')
+    parser.add_argument('--startup-timeout', type=float, default=60.0)
+    main(parser.parse_args())
@@ -0,0 +1,123 @@
+'''
+开放领域对话的流式输出：上游 token 增量按时间 / 长度窗口合并成帧，并统计首 token 时间（TTFT）与帧数
+'''
+import asyncio
+import statistics
+import time
+from collections import deque
+from typing import Any, AsyncIterator
+
+from async_utils import cancel_and_wait
+
+_END = object()
+
+
+async def coalesce(deltas: AsyncIterator[str], max_delay: float, max_chars: int) -> AsyncIterator[str]:
+    '''
+    合并增量文本：第一个增量立即输出（降低 TTFT），之后缓冲区达到 max_chars 或等待超过 max_delay 时输出
+    上游读取放在独立任务里，等待超时只取消 queue.get，不会中断上游迭代器
+    '''
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def pump() -> None:
+        try:
+            async for delta in deltas:
+                queue.put_nowait(delta)
+            queue.put_nowait(_END)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            queue.put_nowait(e)
+        finally:
+            await deltas.aclose()
+
+    pump_task = asyncio.create_task(pump())
+    try:
+        first = await queue.get()
+        if first is _END:
+            return
+        if isinstance(first, BaseException):
+            raise first
+        yield first
+
+        buffer: list[str] = []
+        size = 0
+        deadline = None
+        loop = asyncio.get_running_loop()
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - loop.time())
+            try:
+                item = await asyncio.wait_for(queue.get(), timeout)
+            except asyncio.TimeoutError:
+                yield ''.join(buffer)
+                buffer, size, deadline = [], 0, None
+                continue
+            if item is _END:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            buffer.append(item)
+            size += len(item)
+            if deadline is None:
+                deadline = loop.time() + max_delay
+            if size >= max_chars:
+                yield ''.join(buffer)
+                buffer, size, deadline = [], 0, None
+        if buffer:
+            yield ''.join(buffer)
+    finally:
+        # 下游断开时取消上游读取，等待其关闭 LLM 流（关闭 HTTP 连接，服务端随之停止生成）
+        await cancel_and_wait(pump_task)
+
+
+class StreamRecorder:
+    __slots__ = ('stats', 'started', 'ttft', 'frames', 'chars')
+
+    def __init__(self, stats: 'StreamStats', started: float) -> None:
+        self.stats = stats
+        self.started = started
+        self.ttft = None
+        self.frames = 0
+        self.chars = 0
+
+    def frame(self, chars: int) -> None:
+        if self.ttft is None:
+            self.ttft = time.perf_counter() - self.started
+        self.frames += 1
+        self.chars += chars
+
+    def finish(self) -> None:
+        self.stats.add(self.ttft, self.frames, self.chars, time.perf_counter() - self.started)
+
+
+class StreamStats:
+    '''
+    保留最近 window 个响应的 TTFT / 帧数 / 字符数 / 总时长
+    '''
+
+    def __init__(self, window: int = 1000) -> None:
+        self.samples: deque[tuple[float | None, int, int, float]] = deque(maxlen=window)
+        self.responses = 0
+
+    def start(self, started: float | None = None) -> StreamRecorder:
+        return StreamRecorder(self, time.perf_counter() if started is None else started)
+
+    def add(self, ttft: float | None, frames: int, chars: int, duration: float) -> None:
+        self.samples.append((ttft, frames, chars, duration))
+        self.responses += 1
+
+    @staticmethod
+    def _summary(values: list[float]) -> dict[str, float]:
+        if not values:
+            return {}
+        values = sorted(values)
+        return {"avg": round(statistics.fmean(values), 4),
+                "p50": round(values[len(values) // 2], 4),
+                "p95": round(values[min(len(values) - 1, int(len(values) * 0.95))], 4)}
+
+    def stats(self) -> dict[str, Any]:
+        return {"responses": self.responses,
+                "ttft_seconds": self._summary([s[0] for s in self.samples if s[0] is not None]),
+                "frames_per_response": self._summary([s[1] for s in self.samples]),
+                "chars_per_frame": self._summary([s[2] / s[1] for s in self.samples if s[1]]),
+                "duration_seconds": self._summary([s[3] for s in self.samples])}
@@ -1,8 +1,47 @@
-from typing import Any, Generator
-from openai import OpenAI
+import math
+from typing import Any, AsyncIterator, Generator, Sequence
+import httpx
+import tracing
+from openai import AsyncOpenAI, AsyncStream, OpenAI
 from openai.types.chat import ChatCompletion, ChatCompletionChunk
 
 
+def classify_generate_config(codes: Sequence[str], generate_config: dict[str, Any] = {}, guided: bool = True,
+                             logprobs: bool = True) -> dict[str, Any]:
+    '''
+    分类调用的生成参数：max_tokens 截断到最长编号的长度；guided 时用 guided_choice 约束只能输出编号（vLLM 支持），
+    logprobs 时请求各编号的对数概率用于计算置信度
+    '''
+    config = {'temperature': 1e-7, **generate_config, 'stream': False,
+              'max_tokens': max(len(code) for code in codes)}
+    if guided:
+        config['guided_choice'] = list(codes)
+    if logprobs:
+        config['logprobs'] = True
+        config['top_logprobs'] = min(len(codes), 20)
+    return config
+
+
+def parse_classification(response: ChatCompletion, labels: dict[str, str]) -> tuple[str | None, float | None]:
+    '''
+    返回 (标签, 置信度)；输出不是合法编号时标签为 None，服务端不返回 logprobs 时置信度为 None
+    置信度为第一个 token 在候选编号中的归一化概率，因此编号应各为单个 token（如 A / B / C）
+    '''
+    choice = response.choices[0]
+    code = (choice.message.content or '').strip()
+    label = labels.get(code)
+    if label is None or choice.logprobs is None or not choice.logprobs.content:
+        return label, None
+    first = choice.logprobs.content[0]
+    logprobs = {top.token.strip(): top.logprob for top in first.top_logprobs or ()}
+    logprobs.setdefault(first.token.strip(), first.logprob)
+    probs = {token: math.exp(logprob) for token, logprob in logprobs.items() if token in labels}
+    total = sum(probs.values())
+    if code not in probs or total <= 0:
+        return label, None
+    return label, probs[code] / total
+
+
 class CustomOpenaiClient:
     def __init__(self, default_model: str, base_url: str, api_key: str = 'EMPTY_KEY', ) -> None:
         '''
@@ -28,13 +67,15 @@ class CustomOpenaiClient:
         # copy for not modify source dict
         generate_config = generate_config.copy()
 
-        # 调用OpenAI的chat Completion API进行意图识别
-        chat_response = self.create_chat_completions(
-            model=model,
-            messages=messages,
-            stream=generate_config.pop('stream', False),  # 返回聊天完成对象， true，返回一个生成器
-            extra_body=generate_config  # 生成的参数放在 extra_body 发送
-        )
+        stream = generate_config.pop('stream', False)
+        # 调用OpenAI的chat Completion API进行意图识别；流式时 span 只到收到响应头为止
+        with tracing.span('llm.request', model=model, stream=stream):
+            chat_response = self.create_chat_completions(
+                model=model,
+                messages=messages,
+                stream=stream,  # 返回聊天完成对象， true，返回一个生成器
+                extra_body=generate_config  # 生成的参数放在 extra_body 发送
+            )
         return chat_response
 
     # 构建消息列表并调用 chat_completions
@@ -56,6 +97,21 @@ class CustomOpenaiClient:
             return chat_response
         return chat_response.choices[0].message.content # 获取OpenAI生成的回复文本
 
+    # 分类：只输出标签编号
+    def classify(self, prompt: str, labels: dict[str, str], sys_prompt: str, model_or_lora_name: str = None,
+                 generate_config: dict[str, Any] = {}, guided: bool = True, logprobs: bool = True) \
+            -> tuple[str | None, float | None]:
+        '''
+        labels: 编号 -> 标签，prompt 中要求模型只输出编号
+        '''
+        messages = [
+            {"role": "system", "content": sys_prompt},
+            {"role": "user", "content": prompt}
+        ]
+        config = classify_generate_config(list(labels), generate_config, guided=guided, logprobs=logprobs)
+        chat_response = self.chat_completions(messages, model_or_lora_name=model_or_lora_name, generate_config=config)
+        return parse_classification(chat_response, labels)
+
     # 辅助方法，从字典解包并调用chat方法
     def _batch_chat(self, args: dict[str, Any]) -> str:
         '''
@@ -64,11 +120,101 @@ class CustomOpenaiClient:
         return self.chat(**args)
 
 
+class AsyncCustomOpenaiClient:
+    def __init__(self, default_model: str, base_url: str, api_key: str = 'EMPTY_KEY',
+                 http_client: httpx.AsyncClient | None = None, max_retries: int = 2) -> None:
+        '''
+        CustomOpenaiClient 的异步版本，不阻塞事件循环
+        http_client: 共享的连接池，网关中由 client_registry 按 settings 创建；为空时使用 openai SDK 默认的客户端
+        max_retries: openai SDK 自带的重试次数，由调用方控制重试时设为 0
+        '''
+        self.client = AsyncOpenAI(base_url=base_url, api_key=api_key, http_client=http_client,
+                                  max_retries=max_retries)
+        self.default_model = default_model
+        self.create_chat_completions = self.client.chat.completions.create
+
+    async def achat_completions(self, messages: list[dict[str, str]], model_or_lora_name: str = None,
+                                generate_config: dict[str, Any] = {}) \
+            -> ChatCompletion | AsyncStream[ChatCompletionChunk]:
+        '''
+        参数同 CustomOpenaiClient.chat_completions
+        '''
+        model = model_or_lora_name if model_or_lora_name is not None else self.default_model
+        generate_config = generate_config.copy()
+        stream = generate_config.pop('stream', False)
+
+        with tracing.span('llm.request', model=model, stream=stream):
+            chat_response = await self.create_chat_completions(
+                model=model,
+                messages=messages,
+                stream=stream,
+                extra_body=generate_config
+            )
+        return chat_response
+
+    async def achat(self, prompt: str, sys_prompt: str = '你是一个擅长回答各种问题的助手。', model_or_lora_name: str = None,
+                    generate_config: dict[str, Any] = {}, history: list[dict[str, str]] | None = None) \
+            -> str | AsyncStream[ChatCompletionChunk]:
+        '''
+        流式时返回 AsyncStream，需要 async for 迭代
+        history: 插在 system 与本轮问题之间的历史消息
+        '''
+        messages = [
+            {"role": "system", "content": sys_prompt},
+            *(history or ()),
+            {"role": "user", "content": prompt}
+        ]
+        stream = generate_config.get('stream', False)
+
+        chat_response = await self.achat_completions(messages, model_or_lora_name=model_or_lora_name,
+                                                     generate_config=generate_config)
+        if stream:
+            return chat_response
+        return chat_response.choices[0].message.content
+
+    async def aclassify(self, prompt: str, labels: dict[str, str], sys_prompt: str, model_or_lora_name: str = None,
+                        generate_config: dict[str, Any] = {}, guided: bool = True, logprobs: bool = True) \
+            -> tuple[str | None, float | None]:
+        '''
+        参数同 CustomOpenaiClient.classify
+        '''
+        messages = [
+            {"role": "system", "content": sys_prompt},
+            {"role": "user", "content": prompt}
+        ]
+        config = classify_generate_config(list(labels), generate_config, guided=guided, logprobs=logprobs)
+        chat_response = await self.achat_completions(messages, model_or_lora_name=model_or_lora_name,
+                                                     generate_config=config)
+        return parse_classification(chat_response, labels)
+
+    async def astream_chat(self, prompt: str, sys_prompt: str = '你是一个擅长回答各种问题的助手。',
+                           model_or_lora_name: str = None, generate_config: dict[str, Any] = {},
+                           history: list[dict[str, str]] | None = None) \
+            -> AsyncIterator[str]:
+        '''
+        强制流式调用，逐个产出增量文本（跳过空 delta）
+        '''
+        generate_config = {**generate_config, 'stream': True}
+        chat_response = await self.achat(prompt, sys_prompt=sys_prompt, model_or_lora_name=model_or_lora_name,
+                                         generate_config=generate_config, history=history)
+        async with chat_response:
+            async for chunk in chat_response:
+                if not chunk.choices:
+                    continue
+                content = chunk.choices[0].delta.content
+                if content:
+                    tracing.event('llm.first_token')
+                    yield content
+
+
 if __name__ == '__main__':
+    import settings
+
     # openai client:
     stream = False
     generate_config = {'temperature': 1e-7, 'max_tokens': 512, 'stream': stream}
-    client = CustomOpenaiClient(base_url='http://192.168.204.202:8082/v1', api_key='EMPTY_KEY', default_model='Qwen1.5')
+    client = CustomOpenaiClient(base_url=settings.LLM_BASE_URL, api_key=settings.LLM_API_KEY,
+                                default_model=settings.LLM_MODEL)
     sys_prompt = '''\
         你是一个负责人判断的助手，用户将输入一个问题，请根据该问题判断哪个负责人对问题负责，请直接输出对应的负责人
         负责人有以下两种：
@@ -0,0 +1,261 @@
+'''
+进程级长连接客户端注册表：一个带连接池的 LLM 客户端 + 每个上游一个 aiohttp ClientSession
+由 FastAPI lifespan 负责创建与关闭
+'''
+import asyncio
+import time
+from collections import deque
+from types import SimpleNamespace
+from typing import Any
+
+import aiohttp
+import httpx
+
+import settings
+from client import AsyncCustomOpenaiClient
+from metrics import CONNECT_SECONDS
+
+
+class _ConnectionCounter:
+    '''
+    统计新建连接数与请求数，复用率 = 1 - 新建连接数 / 请求数
+    '''
+    __slots__ = ('requests', 'connections_created')
+
+    def __init__(self) -> None:
+        self.requests = 0
+        self.connections_created = 0
+
+    def reuse_ratio(self) -> float:
+        if self.requests == 0:
+            return 0.0
+        return max(0.0, 1 - self.connections_created / self.requests)
+
+    def as_dict(self) -> dict[str, Any]:
+        return {"requests": self.requests,
+                "connections_created": self.connections_created,
+                "reuse_ratio": round(self.reuse_ratio(), 4)}
+
+
+class _PoolGauge:
+    '''
+    aiohttp 连接池的使用中 / 空闲连接数，由连接的取用、复用与归还维护，不读取 connector 内部状态
+    空闲数是估算：归还后可复用的连接记为空闲，被复用或超过 keepalive_timeout（连接池会关闭）后移除
+    '''
+    __slots__ = ('keepalive_timeout', 'in_use', '_idle')
+
+    def __init__(self, keepalive_timeout: float) -> None:
+        self.keepalive_timeout = keepalive_timeout
+        self.in_use = 0
+        # 空闲连接的归还时间
+        self._idle: deque[float] = deque()
+
+    def acquired(self) -> None:
+        self.in_use += 1
+
+    def reused(self) -> None:
+        if self._idle:
+            self._idle.pop()
+
+    def released(self, reusable: bool) -> None:
+        self.in_use -= 1
+        if reusable:
+            self._idle.append(time.monotonic())
+
+    def idle(self) -> int:
+        expired = time.monotonic() - self.keepalive_timeout
+        while self._idle and self._idle[0] < expired:
+            self._idle.popleft()
+        return len(self._idle)
+
+
+class _CountingConnector(aiohttp.TCPConnector):
+    '''
+    取出连接时计入使用中，连接归还（release / close）时通过 Connection 的回调计出
+    '''
+
+    def __init__(self, gauge: _PoolGauge, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.gauge = gauge
+
+    async def connect(self, req, traces, timeout) -> aiohttp.connector.Connection:
+        connection = await super().connect(req, traces, timeout)
+        self.gauge.acquired()
+
+        def on_release() -> None:
+            protocol = connection.protocol
+            self.gauge.released(protocol is not None and not protocol.should_close)
+
+        connection.add_callback(on_release)
+        return connection
+
+
+def _utilisation(in_use: int, limit: int) -> float | None:
+    # limit <= 0 表示不限制，没有使用率
+    return round(in_use / limit, 4) if limit > 0 else None
+
+
+class _CountingTransport(httpx.AsyncHTTPTransport):
+    '''
+    通过 httpcore 的 trace 扩展统计 LLM 连接池新建连接次数
+    '''
+
+    def __init__(self, counter: _ConnectionCounter, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.counter = counter
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self.counter.requests += 1
+        upstream_trace = request.extensions.get("trace")
+        connect_started = None
+
+        async def trace(event_name: str, info: dict[str, Any]) -> None:
+            nonlocal connect_started
+            if event_name == "connection.connect_tcp.started":
+                connect_started = time.perf_counter()
+            elif event_name == "connection.connect_tcp.complete":
+                self.counter.connections_created += 1
+                if connect_started is not None:
+                    CONNECT_SECONDS.observe(time.perf_counter() - connect_started, "llm")
+            if upstream_trace is not None:
+                await upstream_trace(event_name, info)
+
+        request.extensions["trace"] = trace
+        return await super().handle_async_request(request)
+
+    def pool_stats(self) -> dict[str, int]:
+        connections = self._pool.connections
+        idle = sum(1 for conn in connections if conn.is_idle())
+        return {"open": len(connections), "idle": idle, "in_use": len(connections) - idle}
+
+
+def _session_trace_config(upstream: str, counter: _ConnectionCounter, gauge: _PoolGauge) -> aiohttp.TraceConfig:
+    async def on_request_start(session, ctx, params) -> None:
+        counter.requests += 1
+
+    async def on_connection_create_start(session, ctx, params) -> None:
+        ctx.connect_started = time.perf_counter()
+
+    async def on_connection_create_end(session, ctx, params) -> None:
+        counter.connections_created += 1
+        CONNECT_SECONDS.observe(time.perf_counter() - ctx.connect_started, upstream)
+
+    async def on_connection_reuseconn(session, ctx, params) -> None:
+        gauge.reused()
+
+    trace_config = aiohttp.TraceConfig(trace_config_ctx_factory=SimpleNamespace)
+    trace_config.on_request_start.append(on_request_start)
+    trace_config.on_connection_create_start.append(on_connection_create_start)
+    trace_config.on_connection_create_end.append(on_connection_create_end)
+    trace_config.on_connection_reuseconn.append(on_connection_reuseconn)
+    return trace_config
+
+
+class ClientRegistry:
+    # 启动时预先创建会话的上游，其他上游在首次使用时创建
+    UPSTREAMS = ("attendance", "knowledge")
+
+    def __init__(self) -> None:
+        self._llm: AsyncCustomOpenaiClient | None = None
+        self._llm_transport: _CountingTransport | None = None
+        self._llm_http_client: httpx.AsyncClient | None = None
+        self._llm_counter = _ConnectionCounter()
+        self._sessions: dict[str, aiohttp.ClientSession] = {}
+        self._session_counters = {name: _ConnectionCounter() for name in self.UPSTREAMS}
+        self._session_gauges: dict[str, _PoolGauge] = {}
+
+    @property
+    def llm(self) -> AsyncCustomOpenaiClient:
+        if self._llm is None:
+            limits = httpx.Limits(max_connections=settings.LLM_MAX_CONNECTIONS if settings.LLM_MAX_CONNECTIONS > 0
+                                  else None,
+                                  max_keepalive_connections=settings.LLM_MAX_KEEPALIVE_CONNECTIONS,
+                                  keepalive_expiry=settings.LLM_KEEPALIVE_EXPIRY)
+            self._llm_transport = _CountingTransport(self._llm_counter, limits=limits)
+            # 首字节 / 空闲超时与重试由 resilience 控制，这里只作为兜底
+            read_timeout = max(settings.UPSTREAM_FIRST_BYTE_TIMEOUTS.get('llm', 60.0),
+                               settings.UPSTREAM_IDLE_TIMEOUTS.get('llm', 60.0))
+            self._llm_http_client = httpx.AsyncClient(
+                transport=self._llm_transport,
+                timeout=httpx.Timeout(read_timeout, connect=settings.UPSTREAM_CONNECT_TIMEOUT))
+            self._llm = AsyncCustomOpenaiClient(base_url=settings.LLM_BASE_URL, api_key=settings.LLM_API_KEY,
+                                                default_model=settings.LLM_MODEL,
+                                                http_client=self._llm_http_client, max_retries=0)
+        return self._llm
+
+    def session(self, upstream: str) -> aiohttp.ClientSession:
+        '''
+        获取上游对应的长连接会话，首次使用时创建（必须在事件循环内调用）
+        '''
+        session = self._sessions.get(upstream)
+        if session is None or session.closed:
+            # 重建会话时旧连接池的连接已随旧会话关闭
+            gauge = self._session_gauges[upstream] = _PoolGauge(settings.UPSTREAM_KEEPALIVE_TIMEOUT)
+            connector = _CountingConnector(gauge, limit=settings.UPSTREAM_LIMIT,
+                                           limit_per_host=settings.UPSTREAM_LIMIT_PER_HOST,
+                                           keepalive_timeout=settings.UPSTREAM_KEEPALIVE_TIMEOUT,
+                                           ttl_dns_cache=settings.UPSTREAM_DNS_CACHE_TTL)
+            counter = self._session_counters.setdefault(upstream, _ConnectionCounter())
+            # 不限制总时长（流式响应可能很长），首字节 / 空闲超时由 resilience 控制
+            timeout = aiohttp.ClientTimeout(total=None, sock_connect=settings.UPSTREAM_CONNECT_TIMEOUT)
+            session = aiohttp.ClientSession(connector=connector, timeout=timeout,
+                                            trace_configs=[_session_trace_config(upstream, counter, gauge)])
+            self._sessions[upstream] = session
+        return session
+
+    async def start(self) -> None:
+        self.llm  # 触发 LLM 客户端与连接池创建
+        for upstream in self.UPSTREAMS:
+            self.session(upstream)
+
+    async def prewarm(self, urls: dict[str, str]) -> dict[str, Any]:
+        '''
+        启动时预先建立连接：LLM 请求 /models，其他上游发送 HEAD（只为建立连接，不关心响应状态）
+        返回每个上游的状态码或异常，失败不影响启动
+        '''
+        async def warm_llm() -> int:
+            self.llm  # 确保连接池已创建
+            response = await self._llm_http_client.get(f'{settings.LLM_BASE_URL.rstrip("/")}/models',
+                                                       headers={"Authorization": f"Bearer {settings.LLM_API_KEY}"})
+            return response.status_code
+
+        async def warm(upstream: str, url: str) -> int:
+            async with self.session(upstream).head(url) as response:
+                return response.status
+
+        names = ["llm", *urls]
+        results = await asyncio.gather(warm_llm(), *(warm(upstream, url) for upstream, url in urls.items()),
+                                       return_exceptions=True)
+        return {name: repr(result) if isinstance(result, BaseException) else result
+                for name, result in zip(names, results)}
+
+    async def close(self) -> None:
+        for session in self._sessions.values():
+            await session.close()
+        self._sessions.clear()
+        if self._llm_http_client is not None:
+            await self._llm_http_client.aclose()
+        self._llm = self._llm_transport = self._llm_http_client = None
+
+    def stats(self) -> dict[str, Any]:
+        '''
+        连接池使用率与连接复用率；连接数不限制（<= 0）时 utilisation 为 None
+        '''
+        llm_pool = self._llm_transport.pool_stats() if self._llm_transport is not None else {}
+        result = {"llm": {**self._llm_counter.as_dict(), "pool": llm_pool,
+                          "pool_limit": settings.LLM_MAX_CONNECTIONS,
+                          "utilisation": _utilisation(llm_pool.get("in_use", 0), settings.LLM_MAX_CONNECTIONS)}}
+        for upstream, counter in self._session_counters.items():
+            session = self._sessions.get(upstream)
+            gauge = self._session_gauges.get(upstream)
+            in_use = idle = 0
+            if session is not None and not session.closed and gauge is not None:
+                in_use, idle = gauge.in_use, gauge.idle()
+            result[upstream] = {**counter.as_dict(),
+                                "pool": {"open": in_use + idle, "idle": idle, "in_use": in_use},
+                                "pool_limit": settings.UPSTREAM_LIMIT,
+                                "utilisation": _utilisation(in_use, settings.UPSTREAM_LIMIT)}
+        return result
+
+
+registry = ClientRegistry()
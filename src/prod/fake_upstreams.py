@@ -0,0 +1,160 @@
+'''
+本地假上游，用于基准测试与压测：OpenAI 兼容 LLM、考勤 execute_sql_stream、知识库 knowledge_base_chat
+
+单独启动（在 src/prod 目录下）：
+    python fake_upstreams.py --llm-port 18082 --attendance-port 18098 --knowledge-port 18095
+然后把 LLM_BASE_URL / ATTENDANCE_URL / KNOWLEDGE_URL 指向这些端口再启动网关
+'''
+import argparse
+import asyncio
+import json
+import threading
+import time
+from typing import Callable
+
+from aiohttp import web
+
+
+def build_fake_llm_app(latency: float, label: str | Callable[[str], str] = '前台助理',
+                       answer: str = '你好，我是前台助理。', token_interval: float = 0.01,
+                       decode_interval: float = 0.0) -> web.Application:
+    '''
+    OpenAI 兼容的 /v1/chat/completions，固定延迟后返回
+    意图识别请求（system prompt 含“负责人”）返回 label（可以是 prompt -> 负责人 的函数），其余返回 answer
+    stream=true 时每个字符一个 chunk，间隔 token_interval 秒
+    非流式按一个字符一个 token 模拟：输出截断到 max_tokens，每个 token 额外耗时 decode_interval 秒；
+    请求 logprobs 时第一个 token 的概率为 1
+    '''
+    async def chat_completions(request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        await asyncio.sleep(latency)
+        sys_prompt = body['messages'][0]['content']
+        if '负责人' in sys_prompt:
+            content = label(body['messages'][-1]['content']) if callable(label) else label
+        else:
+            content = answer
+        if body.get('stream'):
+            response = web.StreamResponse(headers={'Content-Type': 'text/event-stream'})
+            await response.prepare(request)
+            for char in content:
+                chunk = {"id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": int(time.time()),
+                         "model": body['model'], "choices": [{"index": 0, "delta": {"content": char}}]}
+                await response.write(f'data: {json.dumps(chunk, ensure_ascii=False)}\n\n'.encode('utf-8'))
+                await asyncio.sleep(token_interval)
+            await response.write(b'data: [DONE]\n\n')
+            return response
+        if body.get('max_tokens'):
+            content = content[:body['max_tokens']]
+        await asyncio.sleep(decode_interval * len(content))
+        choice = {"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}
+        if body.get('logprobs') and content:
+            choice["logprobs"] = {"content": [{"token": content[0], "logprob": 0.0, "bytes": None,
+                                               "top_logprobs": [{"token": content[0], "logprob": 0.0,
+                                                                 "bytes": None}]}]}
+        return web.json_response({
+            "id": "chatcmpl-fake", "object": "chat.completion", "created": int(time.time()), "model": body['model'],
+            "choices": [choice],
+            "usage": {"prompt_tokens": 0, "completion_tokens": len(content), "total_tokens": len(content)},
+        })
+
+    app = web.Application()
+    app.router.add_post('/v1/chat/completions', chat_completions)
+    return app
+
+
+def build_fake_attendance_app(latency: float, rows: int = 10, row_interval: float = 0.01) -> web.Application:
+    '''
+    考勤 POST /execute_sql_stream：延迟 latency 秒后逐行输出 rows 行数据，最后输出 [DONE]
+    '''
+    async def execute_sql_stream(request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        await asyncio.sleep(latency)
+        response = web.StreamResponse(headers={'Content-Type': 'text/event-stream'})
+        await response.prepare(request)
+        for i in range(rows):
+            row = {"userNo": body.get('userNo'), "name": f"员工{i}", "workHours": 8 + i % 3}
+            await response.write(f'data: {json.dumps(row, ensure_ascii=False)}\n'.encode('utf-8'))
+            await asyncio.sleep(row_interval)
+        await response.write(b'[DONE]\n')
+        return response
+
+    app = web.Application()
+    app.router.add_post('/execute_sql_stream', execute_sql_stream)
+    return app
+
+
+def build_fake_knowledge_app(latency: float, answer: str = '标准工时制的上班时间为上午9点到下午6点。',
+                             token_interval: float = 0.01) -> web.Application:
+    '''
+    知识库 POST /chat/knowledge_base_chat：每个字符一个 {"answer": ...} 事件，然后输出 docs 与 [DONE]
+    '''
+    async def knowledge_base_chat(request: web.Request) -> web.StreamResponse:
+        await request.json()
+        await asyncio.sleep(latency)
+        response = web.StreamResponse(headers={'Content-Type': 'text/event-stream'})
+        await response.prepare(request)
+        for char in answer:
+            event = json.dumps({"answer": char}, ensure_ascii=False)
+            await response.write(f'data: {event}\r\n\r\n'.encode('utf-8'))
+            await asyncio.sleep(token_interval)
+        docs = json.dumps({"docs": ["出处 [1] 行政办公管理制度.pdf"]}, ensure_ascii=False)
+        await response.write(f'data: {docs}\r\n\r\n'.encode('utf-8'))
+        await response.write(b'data: [DONE]\r\n\r\n')
+        return response
+
+    app = web.Application()
+    app.router.add_post('/chat/knowledge_base_chat', knowledge_base_chat)
+    return app
+
+
+def start_in_thread(coro_factory) -> None:
+    '''
+    在独立线程的事件循环中运行服务，避免与压测客户端争用同一个循环
+    '''
+    ready = threading.Event()
+
+    def run():
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        loop.run_until_complete(coro_factory(ready))
+        loop.run_forever()
+
+    threading.Thread(target=run, daemon=True).start()
+    ready.wait()
+
+
+def serve_in_thread(app: web.Application, port: int, host: str = '127.0.0.1') -> None:
+    async def serve(ready: threading.Event):
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        ready.set()
+
+    start_in_thread(serve)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--llm-port', type=int, default=18082)
+    parser.add_argument('--attendance-port', type=int, default=18098)
+    parser.add_argument('--knowledge-port', type=int, default=18095)
+    parser.add_argument('--latency', type=float, default=0.2, help='每次调用的首包延迟（秒）')
+    parser.add_argument('--token-interval', type=float, default=0.01, help='流式输出的间隔（秒）')
+    parser.add_argument('--label', default='前台助理', help='意图识别固定返回的负责人')
+    args = parser.parse_args()
+
+    serve_in_thread(build_fake_llm_app(args.latency, args.label, token_interval=args.token_interval),
+                    args.llm_port, args.host)
+    serve_in_thread(build_fake_attendance_app(args.latency, row_interval=args.token_interval),
+                    args.attendance_port, args.host)
+    serve_in_thread(build_fake_knowledge_app(args.latency, token_interval=args.token_interval),
+                    args.knowledge_port, args.host)
+    print(f'LLM_BASE_URL=http://{args.host}:{args.llm_port}/v1')
+    print(f'ATTENDANCE_URL=http://{args.host}:{args.attendance_port}/execute_sql_stream')
+    print(f'KNOWLEDGE_URL=http://{args.host}:{args.knowledge_port}/chat/knowledge_base_chat')
+    threading.Event().wait()
+
+
+if __name__ == '__main__':
+    main()
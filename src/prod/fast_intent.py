@@ -0,0 +1,256 @@
+'''
+意图识别快速通道：基于意图识别 prompt 中的词表做确定性预分类，置信度足够时跳过 LLM
+
+- 词表匹配使用 Aho-Corasick 自动机，一次扫描得到全部命中词
+- 命中词按规则打分，得到 (意图, 置信度)
+- 可选加载离线训练的字符 bigram 朴素贝叶斯模型，词表无法判断时作为补充
+
+离线训练（logs.jsonl 每行包含 question 与 intent / llm 字段）：
+    python fast_intent.py train logs.jsonl fast_intent_model.json
+'''
+import json
+import logging
+import math
+import sys
+from collections import deque
+from typing import Any, Iterable
+
+from intents import INTENT_ATTENDANCE, INTENT_CHAT, INTENT_KNOWLEDGE, INTENTS
+
+logger = logging.getLogger('fast_intent')
+
+# 词表 -> (类别, 权重)
+# attendance_term: 考勤数据词；time / aggregate: 时间范围、统计类提示，单独出现不计分，与考勤词同时出现才加分
+# knowledge / how: 制度类名词与“如何”类提问；chat: 开放领域寒暄
+LEXICON: dict[str, tuple[str, float]] = {
+    **{word: ('attendance_term', 1.0) for word in (
+        '旷工', '缺勤', '迟到', '早退', '工时', '工作时长', '上下班', '上班', '下班', '打卡', '刷卡',
+        '请假', '休假', '加班', '调休', '出勤', '考勤数据')},
+    **{word: ('time', 1.0) for word in (
+        '今天', '昨天', '前天', '本周', '这周', '上周', '本月', '这个月', '上个月', '上月', '今年', '去年',
+        '最近', '号', '月份')},
+    **{word: ('aggregate', 1.0) for word in (
+        '多少人', '几个人', '多少天', '多少次', '谁', '哪些人', '统计', '平均', '最长', '最短', '最多', '最少',
+        '排名', '列表', '名单', '对比', '查询', '分别')},
+    **{word: ('knowledge', 2.0) for word in (
+        '制度', '规则', '规范', '规定', '政策', '流程', '文档', '指南', '办法', '条例', '手册', '标准工时制',
+        '职责', '责任部门')},
+    **{word: ('how', 1.0) for word in (
+        '如何', '怎么', '怎样', '应该', '需要', '是否', '哪个部门', '负责什么', '负责哪些', '包括哪些', '有哪些方式',
+        '几次')},
+    **{word: ('chat', 2.0) for word in (
+        '你好', '您好', '天气', '谢谢', '你是谁', '笑话', '早上好', '晚上好', '再见')},
+}
+
+
+class AhoCorasick:
+    '''
+    多模式串匹配自动机
+    '''
+
+    def __init__(self, words: Iterable[str]) -> None:
+        self.goto: list[dict[str, int]] = [{}]
+        self.fail: list[int] = [0]
+        self.output: list[list[str]] = [[]]
+        for word in words:
+            self._add(word)
+        self._build()
+
+    def _add(self, word: str) -> None:
+        state = 0
+        for char in word:
+            next_state = self.goto[state].get(char)
+            if next_state is None:
+                next_state = len(self.goto)
+                self.goto[state][char] = next_state
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append([])
+            state = next_state
+        self.output[state].append(word)
+
+    def _build(self) -> None:
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fail = self.fail[state]
+                while fail and char not in self.goto[fail]:
+                    fail = self.fail[fail]
+                self.fail[next_state] = self.goto[fail].get(char, 0)
+                self.output[next_state] = self.output[next_state] + self.output[self.fail[next_state]]
+
+    def findall(self, text: str) -> list[str]:
+        state = 0
+        found = []
+        goto, fail, output = self.goto, self.fail, self.output
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                found.extend(output[state])
+        return found
+
+
+class BigramModel:
+    '''
+    字符 bigram 朴素贝叶斯，模型文件为 JSON：{"priors": {...}, "counts": {intent: {bigram: n}}, "totals": {...}}
+    '''
+
+    def __init__(self, priors: dict[str, float], counts: dict[str, dict[str, int]], totals: dict[str, int],
+                 vocab_size: int) -> None:
+        self.priors = priors
+        self.counts = counts
+        self.totals = totals
+        self.vocab_size = max(vocab_size, 1)
+
+    @staticmethod
+    def bigrams(text: str) -> list[str]:
+        text = f'^{text}$'
+        return [text[i:i + 2] for i in range(len(text) - 1)]
+
+    @classmethod
+    def train(cls, samples: Iterable[tuple[str, str]]) -> 'BigramModel':
+        counts: dict[str, dict[str, int]] = {intent: {} for intent in INTENTS}
+        docs = {intent: 0 for intent in INTENTS}
+        vocab = set()
+        for question, intent in samples:
+            if intent not in counts:
+                continue
+            docs[intent] += 1
+            for bigram in cls.bigrams(question):
+                counts[intent][bigram] = counts[intent].get(bigram, 0) + 1
+                vocab.add(bigram)
+        total_docs = sum(docs.values()) or 1
+        priors = {intent: (docs[intent] + 1) / (total_docs + len(INTENTS)) for intent in INTENTS}
+        totals = {intent: sum(counts[intent].values()) for intent in INTENTS}
+        return cls(priors, counts, totals, len(vocab))
+
+    def predict(self, text: str) -> tuple[str, float]:
+        '''
+        返回最可能的意图及其后验概率
+        '''
+        scores = {}
+        grams = self.bigrams(text)
+        for intent, prior in self.priors.items():
+            counts = self.counts.get(intent, {})
+            denominator = self.totals.get(intent, 0) + self.vocab_size
+            scores[intent] = math.log(prior) + sum(math.log((counts.get(g, 0) + 1) / denominator) for g in grams)
+        best = max(scores, key=scores.get)
+        norm = sum(math.exp(score - scores[best]) for score in scores.values())
+        return best, 1 / norm
+
+    def to_dict(self) -> dict[str, Any]:
+        return {"priors": self.priors, "counts": self.counts, "totals": self.totals, "vocab_size": self.vocab_size}
+
+    @classmethod
+    def load(cls, path: str) -> 'BigramModel':
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        return cls(data['priors'], data['counts'], data['totals'], data['vocab_size'])
+
+
+class FastIntentClassifier:
+    def __init__(self, threshold: float = 0.8, model: BigramModel | None = None,
+                 lexicon: dict[str, tuple[str, float]] = LEXICON) -> None:
+        self.threshold = threshold
+        self.model = model
+        self.lexicon = lexicon
+        self.matcher = AhoCorasick(lexicon)
+        self.decided = 0
+        self.deferred = 0
+        self.shadow_agree = 0
+        self.shadow_disagree = 0
+        self.recent_disagreements: deque[dict[str, Any]] = deque(maxlen=100)
+
+    def score(self, question: str) -> dict[str, float]:
+        '''
+        规则打分：考勤词需配合时间或统计提示；制度词或“如何”类提问偏向知识库
+        '''
+        weights = {'attendance_term': 0.0, 'time': 0.0, 'aggregate': 0.0, 'knowledge': 0.0, 'how': 0.0, 'chat': 0.0}
+        for word in set(self.matcher.findall(question)):
+            category, weight = self.lexicon[word]
+            weights[category] += weight
+        attendance = 0.0
+        if weights['attendance_term']:
+            attendance = weights['attendance_term'] + weights['time'] + weights['aggregate']
+            if not (weights['time'] or weights['aggregate']):
+                # 只有考勤词、没有时间 / 统计提示，例如“如何请假”，不足以判断为数据查询
+                attendance *= 0.5
+        knowledge = weights['knowledge'] + weights['how']
+        return {INTENT_ATTENDANCE: attendance, INTENT_KNOWLEDGE: knowledge, INTENT_CHAT: weights['chat']}
+
+    def predict(self, question: str) -> tuple[str | None, float]:
+        '''
+        返回 (意图, 置信度)；规则与模型都没有把握时意图为 None
+        '''
+        scores = self.score(question)
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        (best, top), (_, second) = ranked[0], ranked[1]
+        # 平滑后的相对优势，只命中一个弱提示词时置信度不会过高
+        confidence = (top - second) / (top + second + 0.5) if top else 0.0
+        if confidence < self.threshold and self.model is not None:
+            model_best, model_confidence = self.model.predict(question)
+            if model_confidence > confidence:
+                best, confidence = model_best, model_confidence
+        if confidence < self.threshold:
+            return None, confidence
+        return best, confidence
+
+    def classify(self, question: str) -> str | None:
+        intent, _ = self.predict(question)
+        if intent is None:
+            self.deferred += 1
+        else:
+            self.decided += 1
+        return intent
+
+    def record_shadow(self, question: str, fast_intent: str | None, confidence: float, llm_intent: str) -> None:
+        '''
+        影子模式：只记录快速通道与 LLM 的判断是否一致，不影响路由
+        '''
+        if fast_intent is None:
+            return
+        if fast_intent == llm_intent:
+            self.shadow_agree += 1
+            return
+        self.shadow_disagree += 1
+        record = {"question": question, "fast": fast_intent, "confidence": round(confidence, 4), "llm": llm_intent}
+        self.recent_disagreements.append(record)
+        logger.info("fast intent shadow disagreement", extra={"fields": record})
+
+    def stats(self) -> dict[str, Any]:
+        shadow_total = self.shadow_agree + self.shadow_disagree
+        return {"threshold": self.threshold,
+                "model_loaded": self.model is not None,
+                "decided": self.decided,
+                "deferred": self.deferred,
+                "shadow_agree": self.shadow_agree,
+                "shadow_disagree": self.shadow_disagree,
+                "shadow_agreement": round(self.shadow_agree / shadow_total, 4) if shadow_total else None,
+                "recent_disagreements": list(self.recent_disagreements)}
+
+
+def _train(log_path: str, model_path: str) -> None:
+    samples = []
+    with open(log_path, encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                samples.append((record['question'], record.get('intent') or record['llm']))
+    model = BigramModel.train(samples)
+    with open(model_path, 'w', encoding='utf-8') as f:
+        json.dump(model.to_dict(), f, ensure_ascii=False)
+    print(f'trained on {len(samples)} samples -> {model_path}')
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 4 and sys.argv[1] == 'train':
+        _train(sys.argv[2], sys.argv[3])
+    else:
+        classifier = FastIntentClassifier()
+        for question in sys.argv[1:] or ['昨天有多少人迟到', '今天天气怎么样', '考勤制度', '一天要打几次卡',
+                                         '昨天有谁请假了', '如何请假', '上周几个人请假了，分别请了多少天']:
+            print(question, classifier.predict(question))
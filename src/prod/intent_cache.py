@@ -0,0 +1,153 @@
+'''
+意图识别结果缓存：归一化问题 -> 意图标签
+一级为进程内 LRU + TTL，二级为可选的共享存储（多 worker 共享命中）
+'''
+import asyncio
+import logging
+import re
+import unicodedata
+from typing import Any, Awaitable, Callable, Iterable
+
+from intents import INTENTS
+from shared_store import SharedStore
+from ttl_cache import TTLCache
+
+logger = logging.getLogger('intent_cache')
+
+try:
+    from opencc import OpenCC  # 可选依赖，完整的繁简转换
+    _opencc = OpenCC('t2s')
+except ImportError:
+    _opencc = None
+
+# 未安装 opencc 时使用的常用繁体字对照（覆盖考勤 / 制度类问题的高频字）
+_T2S_TABLE = str.maketrans(
+    '請遲會們個這還嗎麼誰幾時間週數據統計長門員測試責職規則開發單碼備務問題識庫現',
+    '请迟会们个这还吗么谁几时间周数据统计长门员测试责职规则开发单码备务问题识库现'
+)
+# NFKC 不处理的中文标点
+_CJK_PUNCT_TABLE = str.maketrans('，。、；：？！“”‘’（）【】《》', ',.,;:?!""\'\'()[]<>')
+_WHITESPACE_RE = re.compile(r'\s+')
+_TRAILING_PUNCT = '?!.,;:~…'
+
+SHARED_KEY_PREFIX = 'intent:'
+
+
+def normalize_question(question: str) -> str:
+    '''
+    归一化：全角转半角、中文标点转英文、繁体转简体、去空白、去结尾标点、小写
+    '''
+    text = unicodedata.normalize('NFKC', question).translate(_CJK_PUNCT_TABLE)
+    text = _opencc.convert(text) if _opencc is not None else text.translate(_T2S_TABLE)
+    text = _WHITESPACE_RE.sub('', text).rstrip(_TRAILING_PUNCT)
+    return text.lower()
+
+
+class IntentCache:
+    def __init__(self, maxsize: int, ttl: float, shared: SharedStore | None = None) -> None:
+        self.local = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.ttl = ttl
+        self.shared = shared
+        self.local_hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.shared_errors = 0
+
+    async def get(self, key: str) -> str | None:
+        intent = self.local.get(key)
+        if intent is not None:
+            self.local_hits += 1
+            return intent
+        if self.shared is not None:
+            try:
+                value = await self.shared.get(SHARED_KEY_PREFIX + key)
+            except Exception:
+                # 共享存储不可用时退化为仅本地缓存
+                self.shared_errors += 1
+                value = None
+            if value is not None:
+                intent = value.decode('utf-8')
+                if intent in INTENTS:
+                    self.shared_hits += 1
+                    self.local.set(key, intent)
+                    return intent
+        self.misses += 1
+        return None
+
+    async def contains(self, key: str) -> bool:
+        '''
+        本地或共享存储中已有该问题（共享命中时写入本地），不计入命中统计
+        '''
+        if self.local.get(key) is not None:
+            return True
+        if self.shared is None:
+            return False
+        try:
+            value = await self.shared.get(SHARED_KEY_PREFIX + key)
+        except Exception:
+            self.shared_errors += 1
+            return False
+        if value is None or value.decode('utf-8') not in INTENTS:
+            return False
+        self.local.set(key, value.decode('utf-8'))
+        return True
+
+    async def set(self, key: str, intent: str) -> None:
+        self.local.set(key, intent)
+        if self.shared is not None:
+            try:
+                await self.shared.set(SHARED_KEY_PREFIX + key, intent.encode('utf-8'), self.ttl)
+            except Exception:
+                self.shared_errors += 1
+
+    def stats(self) -> dict[str, Any]:
+        lookups = self.local_hits + self.shared_hits + self.misses
+        return {"size": len(self.local),
+                "maxsize": self.local.maxsize,
+                "local_hits": self.local_hits,
+                "shared_hits": self.shared_hits,
+                "misses": self.misses,
+                "hit_ratio": round((self.local_hits + self.shared_hits) / lookups, 4) if lookups else 0.0,
+                "evictions": self.local.evictions,
+                "expirations": self.local.expirations,
+                "shared_enabled": self.shared is not None,
+                "shared_errors": self.shared_errors}
+
+
+async def prewarm(cache: IntentCache, questions: Iterable[str], classify: Callable[[str], Awaitable[str]],
+                  concurrency: int = 4) -> int:
+    '''
+    对未命中的问题调用 classify 并写入缓存，返回新写入的条数
+    多 worker 共享存储时其他 worker 已预热的问题直接跳过；单个问题识别失败时跳过，不影响其他问题
+    '''
+    semaphore = asyncio.Semaphore(concurrency)
+    keys = {normalize_question(question): question for question in questions}
+    warmed = 0
+
+    async def warm(key: str, question: str) -> None:
+        nonlocal warmed
+        if await cache.contains(key):
+            return
+        async with semaphore:
+            try:
+                intent = await classify(question)
+            except Exception as e:
+                logger.warning("intent prewarm failed", extra={"fields": {"question": question, "error": repr(e)}})
+                return
+            await cache.set(key, intent)
+            warmed += 1
+
+    await asyncio.gather(*(warm(key, question) for key, question in keys.items()))
+    return warmed
+
+
+def command_center_questions(payload: dict[str, Any]) -> list[str]:
+    '''
+    从 /commandCenter 的响应中提取全部问题（sub_content）
+    '''
+    questions = []
+    for section in payload.get('data') or []:
+        for command in section.get('command_list') or []:
+            if command.get('sub_content'):
+                questions.append(command['sub_content'])
+    return questions
@@ -1,48 +1,89 @@
-from urllib.parse import urlencode
-from fastapi import FastAPI, HTTPException, Body
-from httpx import stream
+from contextlib import asynccontextmanager
+from datetime import date
+from fastapi import FastAPI, HTTPException, Body, Depends, Header, Query, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
 from pydantic import BaseModel
-from client import CustomOpenaiClient
-import requests, json
+from client_registry import registry
+from chat_stream import StreamStats, coalesce
+from json.encoder import encode_basestring_ascii
 import aiohttp
 import asyncio
-import re
-from sse_starlette.sse import EventSourceResponse
+import hmac
+import logging
+import math
+import os
+import time
+import openai
+import settings
+import tracing
+from admission import AdmissionController, AdmissionRejected, Permit
+from attendance_cache import AttendanceCache
+from batching import MicroBatcher
+from auth_policy import AuthPolicy
+from intent_cache import IntentCache, normalize_question, prewarm, command_center_questions
+from fast_intent import BigramModel, FastIntentClassifier
+from kb_cache import FrameCache
+from intents import (INTENT_ATTENDANCE, INTENT_CHAT, INTENT_CODES, INTENT_KNOWLEDGE, parse_batch_intents,
+                     parse_intent)
+from logs import setup_logging, shutdown_logging
+from prompt_usage import DecayedCounter, PromptMatcher
+from resilience import CircuitBreaker, CircuitOpen, RetryBudget, UpstreamPolicy
+from metrics import (ATTENDANCE_CACHE_LOOKUPS, CLASSIFICATIONS, CLASSIFY_SECONDS, ERRORS, INTENT_BATCH_SIZE,
+                     INTENT_BATCH_WAIT_SECONDS, INTENT_CONFIDENCE, KB_CACHE_LOOKUPS, REGISTRY, REQUESTS)
+from shared_store import create_shared_store
+from singleflight import SingleFlight, StreamBroadcast
+from session_store import SessionStore
+from sse_frames import TypedFrameEncoder
+from sse_relay import SSERelay, UpstreamSpec, load_upstream_overrides
+from speculation import Speculation, SpeculationStats
+from stream_guard import StreamGuard
+from tracing import SamplingProfiler, TraceMiddleware, Tracer
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 启动时创建长连接客户端，退出时统一关闭
+    setup_logging(settings.LOG_LEVEL, settings.LOG_SAMPLE_RATE, settings.LOG_QUEUE_SIZE)
+    await registry.start()
+    tasks = []
+    if tracer.profiler is not None:
+        tracer.profiler.start()
+    if settings.STARTUP_PREWARM:
+        await prewarm_connections()
+    tasks.append(asyncio.create_task(prewarm_intent_cache(settings.INTENT_CACHE_PREWARM)))
+    if settings.PROMPT_PREWARM_INTERVAL > 0:
+        tasks.append(asyncio.create_task(prewarm_popular_prompts(settings.PROMPT_PREWARM_INTERVAL)))
+    yield
+    for task in tasks:
+        task.cancel()
+    if tracer.profiler is not None:
+        tracer.profiler.stop()
+    await registry.close()
+    if shared_store is not None:
+        await shared_store.close()
+    shutdown_logging()
+
 
 # 创建FastApi实例
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
+logger = logging.getLogger('gateway')
 # 常量定义如下：
-ATTENDANCE_BASE_URL_GET = "http://192.168.204.198:60001/execute_sql_stream?"  # 考勤
-ATTENDANCE_BASE_URL_POST = "http://192.168.204.198:60001/execute_sql_stream"  # 考勤
-KNOWLEDGE_BASE_URL = "http://192.168.102.95:7861/chat/knowledge_base_chat"  # 知识库
+ATTENDANCE_BASE_URL_GET = settings.ATTENDANCE_URL + "?"  # 考勤
+ATTENDANCE_BASE_URL_POST = settings.ATTENDANCE_URL  # 考勤
+KNOWLEDGE_BASE_URL = settings.KNOWLEDGE_URL  # 知识库
 ILLEGAL_AUTH_REFUSE = "很抱歉，根据您提供的查询条件，你不具有查询考勤的权限。建议您申请权限后再尝试查询。"
-# 权限校验，根据用户角色和查询类型校验用户是否有权限进行访问
+ILLEGAL_AUTH_REFUSE_DEFAULT = "很抱歉，您不具有该类问题的查询权限。建议您申请权限后再尝试查询。"
+AUTH_REFUSE_BY_ROUTE = {"attendance": ILLEGAL_AUTH_REFUSE}
+# 后台预热请求上游时使用的 user_id / user_no / topic_id
+PREWARM_USER = "prewarm"
+# 权限校验，根据用户角色和查询类型校验用户是否有权限进行访问；可通过 AUTH_POLICY_FILE 配置
 auth_role_allown_map = {"attendance": ["Boss", "Assistant", "HR"],
                         "chat": ["Boss", "Assistant", "HR", "Manager", "Employee"]}
+auth_policy = AuthPolicy.load(settings.AUTH_POLICY_FILE) if settings.AUTH_POLICY_FILE else AuthPolicy(
+    auth_role_allown_map)
 
-
-# 创建请求体模型
-class RequestBody(BaseModel):
-    question: str
-    user_id: str
-    user_no: str
-    user_role: str
-    topic_id: str
-
-
-@app.post("/getaway_api")
-async def user_intent_recognize(request_body: RequestBody = Body(...)):
-    question = request_body.question
-    user_id = request_body.user_id
-    user_no = request_body.user_no
-    user_role = request_body.user_role
-    topic_id = request_body.topic_id
-    stream = False
-    generate_config = {'temperature': 1e-7, 'max_tokens': 512, 'stream': stream}
-    client = CustomOpenaiClient(base_url='http://192.168.204.202:8082/v1', api_key='EMPTY_KEY', default_model='Qwen1.5')
-    if not check_auth_role("attendance", user_role):
-        raise HTTPException(status_code=403, detail=ILLEGAL_AUTH_REFUSE)
-    sys_prompt = '''\
+# 意图识别 prompt
+INTENT_SYS_PROMPT = '''\
         你是一个负责人判断的助手，用户将输入一个问题，请根据该问题判断对应的负责人，请直接输出对应的负责人。
         负责人有以下两种：
         1. 前台助理：负责开放领域的沟通。 
@@ -50,7 +91,7 @@ async def user_intent_recognize(request_body: RequestBody = Body(...)):
         3. 考勤数据查询助理：负责查询员工的考勤数据，如旷工（缺勤）、迟到、早退、工时(工作时长)、上下班、打卡\刷卡、请假\休假、加班\调休等。
         用户将会举一些例子，请根据例子要求进行回答，不要添加负责人外的内容。
         '''
-    prompt_prefix = '''\
+INTENT_PROMPT_PREFIX = '''\
         问：昨天有多少人迟到
         答：考勤数据查询助理
         问：今天天气怎么样
@@ -65,106 +106,827 @@ async def user_intent_recognize(request_body: RequestBody = Body(...)):
         答：知识库助理
         问：{}
         答：'''
-    prompt = prompt_prefix.format(question)
-    print("question: " + question)
-    # 根据问题和回答模版去校验 res 属于哪种类型（考勤/知识库/开放领域）
-    res = client.chat(prompt=prompt, sys_prompt=sys_prompt, generate_config=generate_config)
-    print("res: " + str(res))
-    if '考勤数据查询助理' in res:
-        return EventSourceResponse(call_third_party_attendance_api(question, user_id, user_role, topic_id, user_no),
-                                   media_type="text/event-stream")
-    if '知识库助理' in res:
-        return EventSourceResponse(call_third_party_knowledge_api(question, user_id, user_role, topic_id, user_no),
-                                   media_type="text/event-stream")
+# 约束输出的意图识别：只输出编号字母，编号与 INTENT_CODES 一致
+INTENT_CODE_SYS_PROMPT = '''\
+        你是一个负责人判断的助手，用户将输入一个问题，请根据该问题判断对应的负责人，只输出负责人的编号字母。
+        负责人有以下三种：
+        A. 前台助理：负责开放领域的沟通。
+        B. 知识库助理：负责文档、制度、考勤制度、考勤规则、考勤规范、政策、流程、技术指南、历史记录等信息的查询。
+        C. 考勤数据查询助理：负责查询员工的考勤数据，如旷工（缺勤）、迟到、早退、工时(工作时长)、上下班、打卡\刷卡、请假\休假、加班\调休等。
+        '''
+INTENT_CODE_PROMPT_PREFIX = '''\
+        问：昨天有多少人迟到
+        答：C
+        问：今天天气怎么样
+        答：A
+        问：考勤制度
+        答：B
+        问：一天要打几次卡
+        答：B
+        问：昨天有谁请假了
+        答：C
+        问：如何请假
+        答：B
+        问：{}
+        答：'''
+# 批量意图识别：多个问题编号后放在一个 prompt 中，按编号逐行输出
+INTENT_BATCH_SYS_PROMPT = INTENT_SYS_PROMPT + '''\
+        用户可能一次输入多个带编号的问题，请按编号逐行输出每个问题对应的负责人，格式为“编号. 负责人”。
+        '''
+INTENT_BATCH_PROMPT_PREFIX = '''\
+        问：
+        1. 昨天有多少人迟到
+        2. 今天天气怎么样
+        3. 考勤制度
+        4. 如何请假
+        答：
+        1. 考勤数据查询助理
+        2. 前台助理
+        3. 知识库助理
+        4. 知识库助理
+        问：
+        {}
+        答：
+        '''
+INTENT_GENERATE_CONFIG = {'temperature': 1e-7, 'max_tokens': 512, 'stream': False}
+CHAT_GENERATE_CONFIG = {'temperature': 1e-7, 'max_tokens': 512, 'stream': True}
+
+# 多 worker 共享的缓存 / 会话存储，未配置时为 None（仅进程内）
+shared_store = create_shared_store(settings.SHARED_STORE_URL)
+intent_cache = IntentCache(maxsize=settings.INTENT_CACHE_MAXSIZE, ttl=settings.INTENT_CACHE_TTL, shared=shared_store)
+chat_stream_stats = StreamStats()
+# 开放领域对话的 type 3 帧
+chat_frames = TypedFrameEncoder(3, use_orjson=settings.SSE_FRAME_ORJSON)
+speculation_stats = SpeculationStats()
+stream_guard = StreamGuard()
+# 请求耗时追踪（X-Request-ID / GET /debug/traces）
+tracer = Tracer(buffer_size=settings.TRACE_BUFFER_SIZE, max_spans=settings.TRACE_MAX_SPANS,
+                profiler=SamplingProfiler(threshold=settings.TRACE_PROFILE_THRESHOLD,
+                                          interval=settings.TRACE_PROFILE_INTERVAL,
+                                          max_samples=settings.TRACE_PROFILE_MAX_SAMPLES)
+                if settings.TRACE_PROFILE else None)
+if settings.TRACE_ENABLED:
+    app.add_middleware(TraceMiddleware, tracer=tracer, paths=("/getaway_api",))
+
+
+def per_worker(limit: int) -> int:
+    '''
+    整个服务的上限按 worker 数平均分配（<= 0 表示不限制，保持不变）
+    '''
+    return limit if limit <= 0 else max(1, math.ceil(limit / settings.GATEWAY_WORKERS))
+
+
+admission = AdmissionController(limits={upstream: per_worker(limit)
+                                        for upstream, limit in settings.ADMISSION_LIMITS.items()},
+                                default_limit=per_worker(settings.ADMISSION_DEFAULT_LIMIT),
+                                queue_size=settings.ADMISSION_QUEUE_SIZE,
+                                queue_timeout=settings.ADMISSION_QUEUE_TIMEOUT,
+                                retry_after=settings.ADMISSION_RETRY_AFTER,
+                                role_priority=settings.ADMISSION_ROLE_PRIORITY)
+# 上游容错：可重试（计入熔断）的异常，超时与 5xx 由 UpstreamPolicy 统一处理
+LLM_RETRY_ON = (openai.APIConnectionError, openai.InternalServerError)
+RELAY_RETRY_ON = (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError)
+
+
+def build_policy(upstream: str, retry_on: tuple[type[BaseException], ...]) -> UpstreamPolicy:
+    first_byte = settings.UPSTREAM_FIRST_BYTE_TIMEOUTS
+    idle = settings.UPSTREAM_IDLE_TIMEOUTS
+    return UpstreamPolicy(upstream,
+                          first_byte_timeout=first_byte.get(upstream, first_byte.get('default', 60.0)),
+                          idle_timeout=idle.get(upstream, idle.get('default', 60.0)),
+                          max_retries=settings.UPSTREAM_MAX_RETRIES,
+                          budget=RetryBudget(settings.RETRY_BUDGET_RATIO,
+                                             settings.RETRY_BUDGET_MIN_PER_SECOND / settings.GATEWAY_WORKERS,
+                                             settings.RETRY_BUDGET_WINDOW),
+                          breaker=CircuitBreaker(settings.BREAKER_FAILURE_THRESHOLD, settings.BREAKER_RESET_TIMEOUT),
+                          retry_on=retry_on, backoff=settings.UPSTREAM_RETRY_BACKOFF,
+                          hedge_quantile=settings.INTENT_HEDGE_QUANTILE,
+                          hedge_min_delay=settings.INTENT_HEDGE_MIN_DELAY,
+                          # 对冲请求与普通调用共用该上游的并发上限，没有空闲名额时不发
+                          hedge_permit=lambda: admission.try_acquire(upstream))
+
+
+# 上游名 -> 容错策略；考勤 / 知识库等转发上游在创建 SSERelay 时加入
+resilience = {"llm": build_policy("llm", LLM_RETRY_ON)}
+# 指令使用热度，指令中心据此加权推荐；只统计通过权限校验、能归到指令中心已知指令的请求，按指令计数
+known_prompts = PromptMatcher()
+prompt_usage = DecayedCounter(half_life=settings.PROMPT_USAGE_HALF_LIFE, maxsize=settings.PROMPT_USAGE_MAXSIZE)
+# 知识库问题按 (问题, 角色) 统计热度，用于预热回答缓存（缓存 key 默认区分角色）
+knowledge_usage = DecayedCounter(half_life=settings.PROMPT_USAGE_HALF_LIFE, maxsize=settings.PROMPT_USAGE_MAXSIZE)
+# 相同问题的并发意图识别 / 知识库查询只调用一次上游
+classify_flights = SingleFlight()
+knowledge_flights = StreamBroadcast(replay_frames=settings.SINGLEFLIGHT_REPLAY_FRAMES)
+# 知识库完整回答缓存
+kb_cache = FrameCache(max_bytes=settings.KB_CACHE_MAX_BYTES, ttl=settings.KB_CACHE_TTL,
+                      max_entry_bytes=settings.KB_CACHE_MAX_ENTRY_BYTES, shared=shared_store, namespace="kb",
+                      sync_interval=settings.SHARED_CACHE_SYNC_INTERVAL) if settings.KB_CACHE_ENABLED else None
+# 考勤查询结果缓存，按周期分桶统计命中率
+attendance_cache = AttendanceCache(
+    FrameCache(max_bytes=settings.ATTENDANCE_CACHE_MAX_BYTES, ttl=settings.ATTENDANCE_CACHE_CLOSED_TTL,
+               max_entry_bytes=settings.ATTENDANCE_CACHE_MAX_ENTRY_BYTES, shared=shared_store,
+               namespace="attendance", sync_interval=settings.SHARED_CACHE_SYNC_INTERVAL),
+    closed_ttl=settings.ATTENDANCE_CACHE_CLOSED_TTL, open_ttl=settings.ATTENDANCE_CACHE_OPEN_TTL,
+    on_lookup=lambda bucket, hit: ATTENDANCE_CACHE_LOOKUPS.inc(bucket, "hit" if hit else "miss"),
+) if settings.ATTENDANCE_CACHE_ENABLED else None
+REGISTRY.gauge('gateway_upstream_in_flight', '上游进行中的调用数', ('upstream',),
+               lambda: {(name, ): limiter.in_flight for name, limiter in admission.limiters.items()})
+REGISTRY.gauge('gateway_upstream_queue_depth', '等待上游并发名额的请求数', ('upstream',),
+               lambda: {(name, ): limiter.waiting for name, limiter in admission.limiters.items()})
+REGISTRY.gauge('gateway_upstream_circuit_open', '上游熔断是否打开', ('upstream',),
+               lambda: {(name, ): int(policy.is_open()) for name, policy in resilience.items()})
+# topic_id -> 会话状态（上一次意图与最近几轮问答），用于追问路由与投机执行的先验
+sessions = SessionStore(maxsize=settings.SESSION_MAXSIZE, ttl=settings.SESSION_TTL,
+                        max_turns=settings.SESSION_MAX_TURNS, answer_chars=settings.SESSION_ANSWER_CHARS,
+                        follow_up_max_chars=settings.FOLLOW_UP_MAX_CHARS, shared=shared_store)
+fast_classifier = FastIntentClassifier(
+    threshold=settings.FAST_INTENT_THRESHOLD,
+    model=BigramModel.load(settings.FAST_INTENT_MODEL_PATH) if settings.FAST_INTENT_MODEL_PATH else None)
+
+
+# 创建请求体模型
+class RequestBody(BaseModel):
+    question: str
+    user_id: str
+    user_no: str
+    user_role: str
+    topic_id: str
+
+
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected_handler(request: Request, exc: AdmissionRejected):
+    # 上游繁忙时快速失败，客户端按 Retry-After 重试
+    ERRORS.inc(exc.upstream, f"rejected_{exc.status_code}")
+    return JSONResponse(status_code=exc.status_code, content={"detail": str(exc)},
+                        headers={"Retry-After": str(math.ceil(exc.retry_after))})
+
+
+@app.exception_handler(CircuitOpen)
+async def circuit_open_handler(request: Request, exc: CircuitOpen):
+    # 上游熔断期间快速失败
+    ERRORS.inc(exc.upstream, "circuit_open")
+    return JSONResponse(status_code=503, content={"detail": str(exc)},
+                        headers={"Retry-After": str(math.ceil(exc.retry_after))})
+
+
+@app.post("/getaway_api")
+async def user_intent_recognize(request_body: RequestBody = Body(...)):
+    started = time.perf_counter()
+    question = request_body.question
+    user_id = request_body.user_id
+    user_no = request_body.user_no
+    user_role = request_body.user_role
+    topic_id = request_body.topic_id
+    generate_config = CHAT_GENERATE_CONFIG
+    client = registry.llm
+    allowed_routes = auth_policy.allowed_routes(user_role)
+    if not allowed_routes:
+        # 任何意图都无权访问时，不做意图识别直接拒绝
+        raise HTTPException(status_code=403, detail=ILLEGAL_AUTH_REFUSE_DEFAULT)
+    tracing.annotate(user_role=user_role, topic_id=topic_id)
+    with tracing.span("session.load"):
+        session = await sessions.load(topic_id)
+    follow_up = sessions.is_follow_up(question, session, fast_classifier.score)
+    speculation = None
+    if follow_up:
+        # 明确的追问沿用同一 topic 上一次的意图，跳过意图识别
+        intent = session.intent
+        CLASSIFICATIONS.inc(intent, "session")
+    else:
+        if settings.SPECULATIVE_DISPATCH:
+            speculation = start_speculation(question, user_id, user_role, topic_id, user_no, allowed_routes,
+                                            session)
+        # 根据问题和回答模版去校验属于哪种类型（考勤/知识库/开放领域）
+        try:
+            with tracing.span("classify"):
+                intent = await classify_question(question, user_role)
+        except BaseException as e:
+            if isinstance(e, Exception):
+                ERRORS.inc("classify", type(e).__name__)
+            if speculation is not None:
+                await speculation.cancel()
+            raise
+    route = ROUTE_BY_INTENT[intent]
+    classify_seconds = time.perf_counter() - started
+    REQUESTS.inc(route)
+    CLASSIFY_SECONDS.observe(classify_seconds, route)
+    tracing.annotate(route=route, intent=intent, follow_up=follow_up)
+    logger.info("classified", extra={"fields": {"question": question, "intent": intent, "user_role": user_role,
+                                                "topic_id": topic_id, "follow_up": follow_up,
+                                                "classify_ms": round(classify_seconds * 1000, 2)}})
+    session = sessions.record(topic_id, intent, question, reused=follow_up)
+    with tracing.span("session.save"):
+        await sessions.save(topic_id, session)
+    if route not in allowed_routes:
+        # 意图识别后、打开上游流之前拒绝，返回完整的 403 响应
+        ERRORS.inc(route, "forbidden")
+        if speculation is not None:
+            await speculation.cancel()
+        raise HTTPException(status_code=403, detail=AUTH_REFUSE_BY_ROUTE.get(route, ILLEGAL_AUTH_REFUSE_DEFAULT))
+    prompt = known_prompts.match(question)
+    if prompt is not None:
+        prompt_usage.add(prompt)
+    if route == "knowledge":
+        knowledge_usage.add((question.strip(), user_role))
+    upstream = "llm" if route == "chat" else route
+    # 熔断时已缓存的回答照常返回
+    if resilience[upstream].is_open() and not is_cached(route, question, user_role, user_no):
+        if speculation is not None:
+            await speculation.cancel()
+        if route == "knowledge" and settings.BREAKER_KNOWLEDGE_FALLBACK_CHAT and "chat" in allowed_routes \
+                and not resilience["llm"].is_open():
+            # 知识库熔断时改由开放领域对话回答
+            ERRORS.inc(route, "circuit_fallback")
+            logger.warning("circuit open, fallback to chat", extra={"fields": {"upstream": route, "topic_id": topic_id}})
+            intent, route, speculation = INTENT_CHAT, "chat", None
+        else:
+            raise CircuitOpen(upstream, resilience[upstream].breaker.retry_after())
+    if speculation is not None:
+        if speculation.intent == intent:
+            tracing.annotate(speculation="hit")
+            return stream_guard.response(route, speculation.commit(),
+                                         on_close=lambda: speculation.cancel(count=False), started=started,
+                                         media_type="text/event-stream")
+        await speculation.cancel()
+    if intent == INTENT_ATTENDANCE:
+        return await attendance_response(question, user_id, user_role, topic_id, user_no, started)
+    if intent == INTENT_KNOWLEDGE:
+        return await knowledge_response(question, user_id, user_role, topic_id, user_no, started)
+    else:
+        # 只有追问才附带历史对话
+        history = sessions.history(session) if follow_up else None
+
+        async def chat_stream_generator():
+            # 转发上游真实的 token 流，按时间 / 长度窗口合并成帧
+            recorder = chat_stream_stats.start(started)
+            answer = []
+            answer_chars = 0
+            # 收到第一个 token 之前失败时按重试预算重试
+            deltas = resilience["llm"].stream(
+                lambda: client.astream_chat(prompt=question, generate_config=generate_config, history=history))
+            async for chunk in coalesce(deltas, settings.CHAT_STREAM_FLUSH_INTERVAL, settings.CHAT_STREAM_FLUSH_CHARS):
+                recorder.frame(len(chunk))
+                if answer_chars < sessions.answer_chars:
+                    answer.append(chunk)
+                    answer_chars += len(chunk)
+                yield chat_frames.encode(chunk)
+            yield chat_frames.done
+            recorder.finish()
+            sessions.set_answer(session, ''.join(answer))
+            await sessions.save(topic_id, session)
+
+        permit = await admission.acquire("llm", user_role)
+        return admitted_response("chat", permit, chat_stream_generator(), started)
+
+
+def admitted_response(route: str, permit: Permit, stream, started: float):
+    '''
+    响应结束（包括客户端断开）后归还并发名额
+    '''
+    async def release() -> None:
+        permit.release()
+
+    return stream_guard.response(route, stream, on_close=release, started=started, media_type="text/event-stream")
+
+
+def is_cached(route: str, question: str, user_role: str, user_no: str) -> bool:
+    if route == "knowledge":
+        return kb_cache is not None and kb_cache.contains(knowledge_cache_key(question, user_role))
+    if route == "attendance":
+        return attendance_cache is not None \
+            and attendance_cache.contains(attendance_cache.resolve(question, user_no, user_role)[0])
+    return False
+
+
+def cached_attendance_api(question, user_id, user_role, topic_id, user_no, resolved=None):
+    '''
+    未命中时边转发边写入考勤结果缓存；resolved 为查询缓存时得到的 (key, 日期范围)
+    '''
+    stream = call_third_party_attendance_api(question, user_id, user_role, topic_id, user_no)
+    if attendance_cache is None:
+        return stream
+    key, period = resolved or attendance_cache.resolve(question, user_no, user_role)
+    relay = relays["attendance"]
+    return attendance_cache.tee(key, period, stream, done=relay.done_event, skip=relay.heartbeat)
+
+
+async def attendance_response(question, user_id, user_role, topic_id, user_no, started):
+    '''
+    先查考勤结果缓存（按 user_no / user_role 隔离），命中时不占用考勤接口的并发名额
+    '''
+    resolved = None
+    if attendance_cache is not None:
+        resolved = attendance_cache.resolve(question, user_no, user_role)
+        with tracing.span("cache.fetch", cache="attendance") as attrs:
+            cached = await attendance_cache.fetch(*resolved)
+            attrs["hit"] = cached is not None
+        if cached is not None:
+            return stream_guard.response("attendance", cached, started=started, media_type="text/event-stream")
+    permit = await admission.acquire("attendance", user_role)
+    return admitted_response("attendance", permit,
+                             cached_attendance_api(question, user_id, user_role, topic_id, user_no, resolved),
+                             started)
+
+
+def knowledge_cache_key(question: str, user_role: str):
+    question = normalize_question(question)
+    return question if settings.KNOWLEDGE_ROLE_INDEPENDENT else (question, user_role)
+
+
+def cached_knowledge_api(question, user_id, user_role, topic_id, user_no):
+    '''
+    未命中时边转发边写入回答缓存
+    '''
+    stream = call_third_party_knowledge_api(question, user_id, user_role, topic_id, user_no)
+    if kb_cache is None:
+        return stream
+    relay = relays["knowledge"]
+    return kb_cache.tee(knowledge_cache_key(question, user_role), stream, done=relay.done_event,
+                        skip=relay.heartbeat)
+
+
+async def knowledge_response(question, user_id, user_role, topic_id, user_no, started):
+    '''
+    先查回答缓存；未命中时相同问题（默认还要求相同角色）的并发请求合并为一次知识库调用，后加入的请求先回放已输出的帧
+    '''
+    if kb_cache is not None:
+        with tracing.span("cache.fetch", cache="knowledge") as attrs:
+            cached = await kb_cache.fetch(knowledge_cache_key(question, user_role), settings.KB_CACHE_REPLAY_INTERVAL)
+            attrs["hit"] = cached is not None
+        if cached is not None:
+            KB_CACHE_LOOKUPS.inc("hit")
+            return stream_guard.response("knowledge", cached, started=started, media_type="text/event-stream")
+        KB_CACHE_LOOKUPS.inc("miss")
+    if not settings.SINGLEFLIGHT_KNOWLEDGE:
+        permit = await admission.acquire("knowledge", user_role)
+        return admitted_response("knowledge", permit,
+                                 cached_knowledge_api(question, user_id, user_role, topic_id, user_no), started)
+    # 与回答缓存使用同一个 key：只差空白 / 标点的问题也合并为一次调用
+    key = knowledge_cache_key(question, user_role)
+    subscription = knowledge_flights.subscribe(key)
+    if subscription is None:
+        permit = await admission.acquire("knowledge", user_role)
+        # 排队期间相同的请求可能已经发起
+        subscription = knowledge_flights.subscribe(key)
+        if subscription is None:
+            # 合并调用的上游读取只记在发起调用的请求的 Trace 上
+            tracing.annotate(singleflight="leader")
+            subscription = knowledge_flights.start(
+                key, cached_knowledge_api(question, user_id, user_role, topic_id, user_no),
+                on_finish=permit.release)
+        else:
+            permit.release()
+    return stream_guard.response("knowledge", subscription, on_close=subscription.aclose, started=started,
+                                 media_type="text/event-stream")
+
+
+def start_speculation(question, user_id, user_role, topic_id, user_no, allowed_routes,
+                      session) -> Speculation | None:
+    '''
+    先验：关键词打分最高的意图，没有命中时取同一 topic 上一次的意图；只对考勤 / 知识库投机，且只投机有权限的路由
+    投机调用不排队，上游没有空闲名额时不投机
+    '''
+    scores = fast_classifier.score(question)
+    prior = max(scores, key=scores.get)
+    if not scores[prior]:
+        prior = session.intent if session is not None else None
+    if prior not in UPSTREAM_BY_INTENT or UPSTREAM_BY_INTENT[prior] not in allowed_routes:
+        return None
+    # 熔断或已有缓存时不投机
+    if resilience[UPSTREAM_BY_INTENT[prior]].is_open() \
+            or is_cached(UPSTREAM_BY_INTENT[prior], question, user_role, user_no):
+        return None
+    if prior == INTENT_ATTENDANCE:
+        stream = cached_attendance_api(question, user_id, user_role, topic_id, user_no)
     else:
-        def chat_stream_generator():
-            for chunk in client.chat(prompt=question, generate_config=generate_config):
-                yield json.dumps({"data": chunk, "type": 3})
-            yield json.dumps({"data": "[DONE]", "type": 3})
+        stream = cached_knowledge_api(question, user_id, user_role, topic_id, user_no)
+    permit = admission.try_acquire(UPSTREAM_BY_INTENT[prior])
+    if permit is None:
+        return None
+    return Speculation(prior, stream, speculation_stats, settings.SPECULATION_BUFFER_FRAMES, permit=permit)
 
-        return EventSourceResponse(chat_stream_generator(), media_type="text/event-stream")
+
+async def request_intent(question: str) -> str:
+    '''
+    单个问题的 LLM 意图识别（调用方负责准入控制）
+    constrained 模式输出不是合法编号或置信度低于 INTENT_MIN_CONFIDENCE 时回退到自由文本 prompt
+    '''
+    policy = resilience["llm"]
+    if settings.INTENT_CLASSIFY_MODE == 'constrained':
+        intent, confidence = await policy.call(
+            lambda: registry.llm.aclassify(INTENT_CODE_PROMPT_PREFIX.format(question), INTENT_CODES,
+                                           sys_prompt=INTENT_CODE_SYS_PROMPT, guided=settings.INTENT_GUIDED_CHOICE,
+                                           logprobs=settings.INTENT_LOGPROBS),
+            hedge=settings.INTENT_HEDGE)
+        if confidence is not None:
+            INTENT_CONFIDENCE.observe(confidence)
+        if intent is not None and (confidence is None or confidence >= settings.INTENT_MIN_CONFIDENCE):
+            return intent
+        logger.info("constrained intent fallback", extra={"fields": {"question": question, "intent": intent,
+                                                                     "confidence": confidence}})
+    res = await policy.call(lambda: registry.llm.achat(prompt=INTENT_PROMPT_PREFIX.format(question),
+                                                       sys_prompt=INTENT_SYS_PROMPT,
+                                                       generate_config=INTENT_GENERATE_CONFIG),
+                            hedge=settings.INTENT_HEDGE)
+    return parse_intent(res)
+
+
+async def classify_with_llm(question: str, user_role: str | None = None) -> str:
+    if intent_batcher is not None:
+        return await intent_batcher.submit((question, user_role))
+    permit = await admission.acquire("llm", user_role)
+    try:
+        return await request_intent(question)
+    finally:
+        permit.release()
+
+
+async def classify_batch_with_llm(batch: list[tuple[str, str | None]]) -> list[str]:
+    '''
+    一批问题只占用一个 LLM 并发名额，按批内优先级最高的角色排队
+    INTENT_BATCH_MODE=prompt 时合并为一个请求，输出中缺失的编号再单独识别
+    '''
+    user_role = min((role for _, role in batch), key=admission.priority)
+    permit = await admission.acquire("llm", user_role)
+    try:
+        intents: list[str | None] = [None] * len(batch)
+        if settings.INTENT_BATCH_MODE == 'prompt' and len(batch) > 1:
+            numbered = '\n        '.join(f'{i}. {question}' for i, (question, _) in enumerate(batch, 1))
+            res = await resilience["llm"].call(
+                lambda: registry.llm.achat(prompt=INTENT_BATCH_PROMPT_PREFIX.format(numbered),
+                                           sys_prompt=INTENT_BATCH_SYS_PROMPT, generate_config=INTENT_GENERATE_CONFIG))
+            intents = parse_batch_intents(res, len(batch))
+        missing = [i for i, intent in enumerate(intents) if intent is None]
+        results = await asyncio.gather(*(request_intent(batch[i][0]) for i in missing))
+        for i, intent in zip(missing, results):
+            intents[i] = intent
+    finally:
+        permit.release()
+    return intents
+
+
+def observe_intent_batch(size: int, wait: float) -> None:
+    INTENT_BATCH_SIZE.observe(size)
+    INTENT_BATCH_WAIT_SECONDS.observe(wait)
+
+
+intent_batcher = MicroBatcher(classify_batch_with_llm, max_batch=settings.INTENT_BATCH_MAX_SIZE,
+                              max_wait=settings.INTENT_BATCH_MAX_WAIT, on_batch=observe_intent_batch) \
+    if settings.INTENT_BATCH_MODE in ('concurrent', 'prompt') else None
+
+
+async def classify_question(question: str, user_role: str | None = None) -> str:
+    '''
+    快速通道 -> 意图缓存 -> LLM
+    '''
+    if settings.FAST_INTENT_MODE == 'on':
+        intent = fast_classifier.classify(question)
+        if intent is not None:
+            CLASSIFICATIONS.inc(intent, "fast")
+            tracing.annotate(classify_source="fast")
+            return intent
+    cache_key = normalize_question(question)
+    intent = await intent_cache.get(cache_key)
+    source = "cache"
+    if intent is None:
+        source = "shared"
+
+        async def classify_and_cache() -> str:
+            nonlocal source
+            source = "llm"
+            result = await classify_with_llm(question, user_role)
+            await intent_cache.set(cache_key, result)
+            return result
+
+        try:
+            if resilience["llm"].is_open():
+                raise CircuitOpen("llm", resilience["llm"].breaker.retry_after())
+            intent = await classify_flights.do(cache_key, classify_and_cache)
+        except (CircuitOpen, TimeoutError, *LLM_RETRY_ON) as e:
+            # LLM 熔断或重试后仍失败时用本地规则 / 模型的判断，没有把握时按开放领域处理；结果不写入缓存
+            if not isinstance(e, CircuitOpen):
+                ERRORS.inc("classify", type(e).__name__)
+            intent = fast_classifier.predict(question)[0] or INTENT_CHAT
+            source = "fallback"
+    CLASSIFICATIONS.inc(intent, source)
+    tracing.annotate(classify_source=source)
+    if settings.FAST_INTENT_MODE == 'shadow':
+        fast_intent, confidence = fast_classifier.predict(question)
+        fast_classifier.record_shadow(question, fast_intent, confidence, intent)
+    return intent
+
+
+async def prewarm_connections():
+    '''
+    建立 LLM 与各上游的连接，超时或失败不影响启动
+    '''
+    started = time.perf_counter()
+    try:
+        async with asyncio.timeout(settings.STARTUP_PREWARM_TIMEOUT):
+            results = await registry.prewarm({name: spec.url for name, spec in UPSTREAM_SPECS.items()})
+    except TimeoutError:
+        logger.warning("connection prewarm timed out", extra={"fields": {"timeout": settings.STARTUP_PREWARM_TIMEOUT}})
+        return
+    logger.info("connections prewarmed", extra={"fields": {"results": results,
+                                                           "ms": round((time.perf_counter() - started) * 1000, 1)}})
+
+
+async def refresh_known_prompts() -> list[str]:
+    '''
+    从指令中心取全部问题，作为使用热度统计的已知指令
+    '''
+    async with aiohttp.ClientSession() as session:
+        async with session.get(settings.COMMAND_CENTER_URL) as response:
+            questions = command_center_questions(await response.json())
+    known_prompts.update(questions)
+    return questions
+
+
+async def prewarm_intent_cache(warm: bool = True):
+    '''
+    启动时取指令中心的问题（热度统计的已知指令），warm 为 True 时用这些问题预热意图缓存，失败不影响服务启动
+    '''
+    try:
+        questions = await refresh_known_prompts()
+        if warm:
+            warmed = await prewarm(intent_cache, questions, classify_with_llm)
+            logger.info("intent cache prewarmed", extra={"fields": {"warmed": warmed}})
+    except Exception as e:
+        # 后台任务，任何异常都只记录，不能留下未取回的异常
+        logger.warning("intent cache prewarm skipped", extra={"fields": {"error": repr(e)}})
+
+
+async def prewarm_knowledge_answers(limit: int) -> int:
+    '''
+    为最热门的知识库问题预热回答缓存（过期或被淘汰的条目重新拉取），返回拉取的回答数
+    预热不排队：知识库熔断或没有空闲并发名额时本轮停止，不与用户请求争抢
+    '''
+    if kb_cache is None or limit <= 0:
+        return 0
+    warmed = 0
+    for (question, user_role), _ in knowledge_usage.top(limit):
+        if kb_cache.contains(knowledge_cache_key(question, user_role)):
+            continue
+        if resilience["knowledge"].is_open():
+            break
+        permit = admission.try_acquire("knowledge")
+        if permit is None:
+            break
+        try:
+            # 回答缓存不区分用户与会话，预热请求使用固定的占位标识
+            async for _ in cached_knowledge_api(question, PREWARM_USER, user_role, PREWARM_USER, PREWARM_USER):
+                pass
+        finally:
+            permit.release()
+        warmed += 1
+    return warmed
+
+
+async def prewarm_popular_prompts(interval: float):
+    '''
+    定期为最热门的问题预热意图缓存（过期或被淘汰的条目重新识别），再预热热门知识库问题的回答缓存
+    '''
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            # 指令中心的配置可能已重新加载
+            await refresh_known_prompts()
+        except Exception as e:
+            logger.warning("known prompts refresh failed", extra={"fields": {"error": repr(e)}})
+        questions = [question for question, _ in prompt_usage.top(settings.PROMPT_PREWARM_TOP)]
+        try:
+            warmed = await prewarm(intent_cache, questions, classify_with_llm)
+            answers = await prewarm_knowledge_answers(settings.KB_CACHE_PREWARM_TOP)
+        except Exception as e:
+            # 后台任务不能因为一次失败退出
+            logger.warning("popular prompt prewarm failed", extra={"fields": {"error": repr(e)}})
+            continue
+        if warmed or answers:
+            logger.info("popular prompts prewarmed", extra={"fields": {"warmed": warmed, "answers": answers}})
+
+
+def require_admin(request: Request, x_admin_token: str | None = Header(None)) -> None:
+    '''
+    管理接口校验：配置了 ADMIN_TOKEN 时比对请求头 X-Admin-Token，否则只允许本机访问
+    '''
+    if settings.ADMIN_TOKEN:
+        if x_admin_token is None or not hmac.compare_digest(x_admin_token.encode(), settings.ADMIN_TOKEN.encode()):
+            raise HTTPException(status_code=403, detail="admin token required")
+    elif request.client is None or request.client.host not in ("127.0.0.1", "::1"):
+        raise HTTPException(status_code=403, detail="admin endpoints are local only")
+
+
+@app.get("/usage/prompts", dependencies=[Depends(require_admin)])
+async def prompt_usage_endpoint(limit: int = Query(settings.PROMPT_USAGE_MAX_LIMIT, ge=1,
+                                                   le=settings.PROMPT_USAGE_MAX_LIMIT)):
+    '''
+    指令使用热度与角色权限，供指令中心构建推荐；只包含指令中心的已知指令
+    '''
+    return {"half_life": settings.PROMPT_USAGE_HALF_LIFE,
+            "prompts": [{"question": question, "score": round(score, 4)}
+                        for question, score in prompt_usage.top(limit)],
+            "auth_roles": auth_policy.rules()}
+
+
+@app.get("/health")
+async def health():
+    '''
+    网关自身可用即返回 200；有上游熔断时 status 为 degraded
+    '''
+    upstreams = {name: policy.stats() for name, policy in resilience.items()}
+    degraded = any(policy.is_open() for policy in resilience.values())
+    return {"status": "degraded" if degraded else "ok", "worker": os.getpid(), "upstreams": upstreams}
+
+
+@app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/stats/pools")
+async def pool_stats():
+    return registry.stats()
+
+
+@app.get("/stats/intent_cache")
+async def intent_cache_stats():
+    return intent_cache.stats()
+
+
+@app.get("/stats/fast_intent")
+async def fast_intent_stats():
+    return fast_classifier.stats()
+
+
+@app.get("/stats/chat_stream")
+async def chat_stream_stats_endpoint():
+    return chat_stream_stats.stats()
+
+
+@app.get("/stats/speculation")
+async def speculation_stats_endpoint():
+    return speculation_stats.stats()
+
+
+@app.get("/stats/streams")
+async def stream_stats():
+    return stream_guard.stats()
+
+
+@app.get("/stats/singleflight")
+async def singleflight_stats():
+    return {"classify": classify_flights.stats(), "knowledge": knowledge_flights.stats()}
+
+
+@app.get("/stats/intent_batch")
+async def intent_batch_stats():
+    if intent_batcher is None:
+        return {"mode": settings.INTENT_BATCH_MODE}
+    return {"mode": settings.INTENT_BATCH_MODE, **intent_batcher.stats()}
+
+
+@app.get("/stats/sessions")
+async def session_stats():
+    return sessions.stats()
+
+
+@app.get("/stats/kb_cache")
+async def kb_cache_stats():
+    return kb_cache.stats() if kb_cache is not None else {"enabled": False}
+
+
+@app.post("/cache/knowledge/invalidate", dependencies=[Depends(require_admin)])
+async def invalidate_kb_cache(question: str | None = None, user_role: str | None = None):
+    '''
+    知识库重建索引后清空回答缓存；指定 question（及 user_role）时只删除该问题
+    '''
+    if kb_cache is None:
+        return {"removed": 0}
+    key = knowledge_cache_key(question, user_role) if question is not None else None
+    removed = kb_cache.invalidate(key)
+    # 通知其他 worker：指定问题时只失效该 key，否则按版本号整体失效
+    await kb_cache.invalidate_shared(key)
+    return {"removed": removed}
+
+
+@app.get("/stats/attendance_cache")
+async def attendance_cache_stats():
+    return attendance_cache.stats() if attendance_cache is not None else {"enabled": False}
+
+
+@app.post("/cache/attendance/invalidate", dependencies=[Depends(require_admin)])
+async def invalidate_attendance_cache(day: date | None = None):
+    '''
+    补卡 / 考勤修正后调用：删除日期范围包含 day 的缓存结果，不指定 day 时清空全部
+    '''
+    if attendance_cache is None:
+        return {"removed": 0}
+    return {"removed": await attendance_cache.invalidate(day)}
+
+
+@app.get("/stats/admission")
+async def admission_stats():
+    return admission.stats()
+
+
+@app.get("/debug/traces")
+async def debug_traces(limit: int = 20, min_ms: float = 0.0, order: str = "slowest", request_id: str | None = None,
+                       spans: bool = True):
+    '''
+    本 worker 最近的请求耗时（多 worker 时按 /health 返回的 worker 区分）；order=slowest 按耗时倒序，recent 按时间倒序
+    request_id 为响应头 X-Request-ID 的值，只返回该请求
+    '''
+    if request_id is not None:
+        trace = tracer.find(request_id)
+        if trace is None:
+            raise HTTPException(status_code=404, detail=f"trace {request_id} not found")
+        return trace.to_dict()
+    if order == "recent":
+        traces = tracer.recent(limit)
+    else:
+        traces = tracer.slowest(limit, min_ms / 1000)
+    return {"worker": os.getpid(), **tracer.stats(),
+            "traces": [trace.to_dict(spans=spans) for trace in traces]}
 
 
 def check_auth_role(agency_type, user_role):
-    allown_role_list = auth_role_allown_map.get(agency_type)
-    return allown_role_list is None or user_role in allown_role_list
+    return auth_policy.allows(user_role, agency_type)
 
 
 async def call_third_party_attendance_api(question, user_id, user_role, topic_id, user_no):
-    if not check_auth_role("attendance", user_role):
-        raise HTTPException(status_code=403, detail=ILLEGAL_AUTH_REFUSE)
-    params = {
-        "question": question,
-        "userId": user_id,
-        "userNo": user_no,
-        "userRole": user_role,
-        "topicId": topic_id,
-    }
-    try:
-        headers = {'Content-Type': 'application/json'}
-        async with aiohttp.ClientSession() as session:
-            async with session.post(ATTENDANCE_BASE_URL_POST, json=params, headers=headers) as response:
-                print(f"response: {response}")
-                async for line in response.content:
-                    line = line.decode('utf-8').strip()
-                    # 检查SSE事件结束或关闭事件
-                    if line == '[DONE]' or line.startswith('event: close'):
-                        yield "event: [DONE]{\"data\": \"[DONE]\",\"type\": 1}"
-                        break
-                    # 确保yield的数据格式正确
-                    try:
-                        # data = json.loads(line)
-                        data_with_type = ({"data": line, "type": 1})
-                        yield f"{json.dumps(data_with_type)}"
-                    except json.JSONDecodeError:
-                        yield f"{{\"error\": \"Invalid JSON format in response\"}}"
-                print("考勤API调用成功，响应数据:", line)
-    except aiohttp.ClientError as e:
-        yield f"data: {{\"error\": \"{str(e)}\"}}"
+    # 权限已在 user_intent_recognize 中校验（生成器开始输出后无法再返回 403）
+    async for frame in relay_stream("attendance", question=question, user_id=user_id, user_role=user_role,
+                                    topic_id=topic_id, user_no=user_no):
+        yield frame
 
 
 # 知识库 2024年7月1日14:56:29
 async def call_third_party_knowledge_api(question, user_id, user_role, topic_id, user_no):
-    params = {
-        "query": question,
-        "userId": user_id,
-        "userNo": user_no,
-        "topicId": topic_id,
-        "userRole": user_role,
-    }
-    headers = {'Content-Type': 'application/json'}
-    async with aiohttp.ClientSession() as session:
-        async with session.post(KNOWLEDGE_BASE_URL, json=params, headers=headers) as response:
-            print(f"response: {response}")
-            try:
-                async for line in response.content:
-                    line = line.decode('utf-8').strip()
-                    if "data:[DONE]" in line:
-                        yield json.dumps({"data": "[DONE]", "type": 2})
-                        break
-                    if line:
-                        try:
-                            # 假设每行都是有效的JSON数据前缀以"data: "
-                            data_str = re.sub(r'^data: ', '', line)
-                            answer = ""
-                            # 统一数据格式输出
-                            if "docs" in data_str:
-                                yield json.dumps({"data": data_str, "type": 2})
-                            elif "data:[summary]" in data_str:
-                                yield json.dumps({"data": data_str, "type": 2})
-                            else:
-                                async for token in data_str:
-                                    answer += token
-                                yield json.dumps({"data": answer,
-                                                  "docs": data_str, "type": 2})
-                        except json.JSONDecodeError:
-                            # 发生JSON解码错误时，yield错误信息及类型
-                            yield json.dumps({"data": f"Invalid JSON: {line}", "type": 4})
-            except asyncio.CancelledError:
-                print(f"Request cancelled.")
+    async for frame in relay_stream("knowledge", question=question, user_id=user_id, user_role=user_role,
+                                    topic_id=topic_id, user_no=user_no):
+        yield frame
+
+
+def relay_stream(upstream: str, **fields: str):
+    return relays[upstream].stream(registry.session(upstream), **fields)
+
+
+# 知识库的摘要行以 "data:[summary]"（冒号后无空格）输出，原实现按整行匹配、保留 "data:" 前缀且不带 docs；
+# 解析时通过 raw_prefixes 保留该前缀。"data: [summary]" 在原实现中按普通回答处理（带 docs）
+KNOWLEDGE_SUMMARY_MARKER = "data:[summary]"
+
+
+def knowledge_event(data: str, frames: TypedFrameEncoder) -> bytes:
+    '''
+    knowledge_frame 的 bytes 版本，直接产出 SSE 帧
+    '''
+    if settings.KNOWLEDGE_JSON_PASSTHROUGH and data[:1] in ('{', '['):
+        payload = data.encode('utf-8')
+    else:
+        payload = frames.escape(data)
+    return frames.pack(payload, docs=not ("docs" in data or KNOWLEDGE_SUMMARY_MARKER in data))
+
+
+def knowledge_frame(data: str) -> str:
+    '''
+    统一知识库输出格式，与 json.dumps 的结果一致；data 只转义一次
+    开启 KNOWLEDGE_JSON_PASSTHROUGH 时，JSON 载荷原样嵌入，不再作为字符串转义
+    '''
+    if settings.KNOWLEDGE_JSON_PASSTHROUGH and data[:1] in ('{', '['):
+        payload = data
+    else:
+        payload = encode_basestring_ascii(data)
+    if "docs" in data or KNOWLEDGE_SUMMARY_MARKER in data:
+        return '{"data": ' + payload + ', "type": 2}'
+    return '{"data": ' + payload + ', "docs": ' + payload + ', "type": 2}'
+
+
+UPSTREAM_BY_INTENT = {INTENT_ATTENDANCE: "attendance", INTENT_KNOWLEDGE: "knowledge"}
+ROUTE_BY_INTENT = {**UPSTREAM_BY_INTENT, INTENT_CHAT: "chat"}
+
+# 上游转发配置，每个意图路由对应一个；地址、请求字段等可通过 RELAY_BACKENDS_FILE 覆盖
+UPSTREAM_SPECS = {
+    "attendance": UpstreamSpec(
+        name="attendance", url=ATTENDANCE_BASE_URL_POST, decoder="lines", frame_type=1,
+        params={"question": "question", "userId": "user_id", "userNo": "user_no", "userRole": "user_role",
+                "topicId": "topic_id"},
+        done_frame="event: [DONE]{\"data\": \"[DONE]\",\"type\": 1}", done_prefixes=("event: close",),
+        encode_error=lambda e: f"data: {{\"error\": \"{str(e)}\"}}"),
+    "knowledge": UpstreamSpec(
+        name="knowledge", url=KNOWLEDGE_BASE_URL, decoder="sse", frame_type=2, encode=knowledge_frame,
+        encode_event=knowledge_event, decoder_options={"raw_prefixes": ("[summary]",)},
+        params={"query": "question", "userId": "user_id", "userNo": "user_no", "topicId": "topic_id",
+                "userRole": "user_role"}),
+}
+if settings.RELAY_BACKENDS_FILE:
+    UPSTREAM_SPECS = load_upstream_overrides(settings.RELAY_BACKENDS_FILE, UPSTREAM_SPECS)
+relays = {name: SSERelay(spec, queue_size=settings.RELAY_QUEUE_SIZE, batch_frames=settings.RELAY_BATCH_FRAMES,
+                         heartbeat_interval=settings.RELAY_HEARTBEAT_INTERVAL, use_orjson=settings.SSE_FRAME_ORJSON,
+                         policy=resilience.setdefault(name, build_policy(name, RELAY_RETRY_ON)))
+          for name, spec in UPSTREAM_SPECS.items()}
 
 
 if __name__ == '__main__':
-    import uvicorn
+    # 兼容原启动方式，监听地址与 worker 数见 serve.py
+    from serve import main
 
-    uvicorn.run(app=app, host='0.0.0.0', port=8088)
+    main()
@@ -0,0 +1,44 @@
+'''
+意图标签：与意图识别 prompt 中的负责人名称一致
+'''
+import re
+
+INTENT_CHAT = '前台助理'
+INTENT_KNOWLEDGE = '知识库助理'
+INTENT_ATTENDANCE = '考勤数据查询助理'
+
+INTENTS = (INTENT_CHAT, INTENT_KNOWLEDGE, INTENT_ATTENDANCE)
+
+
+def parse_intent(res: str) -> str:
+    '''
+    从模型输出中解析意图，优先级：考勤 > 知识库 > 开放领域
+    '''
+    if INTENT_ATTENDANCE in res:
+        return INTENT_ATTENDANCE
+    if INTENT_KNOWLEDGE in res:
+        return INTENT_KNOWLEDGE
+    return INTENT_CHAT
+
+
+_NUMBERED_LINE = re.compile(r'^\s*(\d+)\s*[.、:：)）]\s*(.+?)\s*$')
+
+
+def parse_batch_intents(res: str, count: int) -> list[str | None]:
+    '''
+    解析批量意图识别的输出（每行“编号. 负责人”），缺失或无法识别的编号为 None
+    '''
+    intents: list[str | None] = [None] * count
+    for line in res.splitlines():
+        match = _NUMBERED_LINE.match(line)
+        if match is None:
+            continue
+        index = int(match.group(1)) - 1
+        answer = match.group(2)
+        if 0 <= index < count and intents[index] is None and any(intent in answer for intent in INTENTS):
+            intents[index] = parse_intent(answer)
+    return intents
+
+
+# 约束输出的意图识别：模型只输出单个字母编号
+INTENT_CODES = {'A': INTENT_CHAT, 'B': INTENT_KNOWLEDGE, 'C': INTENT_ATTENDANCE}
@@ -0,0 +1,337 @@
+'''
+知识库流式回答缓存：按（归一化问题, 角色）缓存转发给客户端的 SSE 字节块
+
+- 未命中时边转发边写入（tee），第一个客户端不需要等整个回答结束；只缓存以结束帧收尾的完整回答
+- 字节块用 zlib 增量压缩保存，按总字节数 LRU 淘汰，条目带 TTL
+- 知识库重建索引后调用 invalidate 清空；清空前已开始写入的回答不再入库
+- 命中时按原字节块回放，可选每块之间的间隔（模拟逐字输出）
+- 可选共享存储作为二级缓存（多 worker 共享命中）；共享 key 带版本号，整体失效时递增版本号，
+  其他 worker 在 sync_interval 内发现版本变化后清空本地缓存；单个 key 失效时删除共享条目并写入失效日志，
+  其他 worker 同步时只删除对应的本地条目
+'''
+import asyncio
+import hashlib
+import struct
+import time
+import zlib
+from array import array
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Callable, Hashable
+
+from shared_store import SharedStore
+
+# 共享存储中的条目：过期时间（unix 时间）、块数、各块长度、压缩数据
+_SHARED_HEADER = struct.Struct('<dI')
+_UNSYNCED = object()
+# 一次同步最多读取的失效日志条数，落后更多时直接清空本地缓存
+_MAX_SYNC_INVALIDATIONS = 256
+
+
+class _Entry:
+    __slots__ = ('blob', 'lengths', 'raw_bytes', 'expires_at')
+
+    def __init__(self, blob: bytes, lengths: array, raw_bytes: int, expires_at: float) -> None:
+        self.blob = blob
+        self.lengths = lengths
+        self.raw_bytes = raw_bytes
+        self.expires_at = expires_at
+
+    @property
+    def size(self) -> int:
+        return len(self.blob) + self.lengths.itemsize * len(self.lengths)
+
+
+class FrameCache:
+    def __init__(self, max_bytes: int, ttl: float, max_entry_bytes: int, level: int = 6,
+                 timer: Callable[[], float] = time.monotonic, shared: SharedStore | None = None,
+                 namespace: str = 'frames', sync_interval: float = 1.0) -> None:
+        '''
+        max_bytes: 所有条目压缩后的总字节数上限
+        max_entry_bytes: 单个回答压缩前的字节数上限，超过后放弃缓存该回答（不影响转发）
+        shared / namespace: 二级共享存储与 key 前缀；sync_interval: 检查共享版本号的最短间隔（秒）
+        '''
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.max_entry_bytes = max_entry_bytes
+        self.level = level
+        self.timer = timer
+        self._data: OrderedDict[Hashable, _Entry] = OrderedDict()
+        self._generation = 0
+        self.bytes = 0
+        self.raw_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.stored = 0
+        self.skipped = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.shared = shared
+        self.namespace = namespace
+        self.sync_interval = sync_interval
+        self._version: Any = _UNSYNCED
+        # 已处理到的失效日志序号
+        self._invalidated_seq: int | None = None
+        self._synced_at = float('-inf')
+        self._writes: set[asyncio.Task] = set()
+        self.shared_hits = 0
+        self.shared_errors = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def _get(self, key: Hashable) -> _Entry | None:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at <= self.timer():
+            self._remove(key)
+            self.expirations += 1
+            return None
+        self._data.move_to_end(key)
+        return entry
+
+    def _remove(self, key: Hashable) -> None:
+        entry = self._data.pop(key)
+        self.bytes -= entry.size
+        self.raw_bytes -= entry.raw_bytes
+
+    def _put(self, key: Hashable, entry: _Entry) -> None:
+        if key in self._data:
+            self._remove(key)
+        if entry.size > self.max_bytes:
+            self.skipped += 1
+            return
+        self._data[key] = entry
+        self.bytes += entry.size
+        self.raw_bytes += entry.raw_bytes
+        self.stored += 1
+        while self.bytes > self.max_bytes:
+            oldest = next(iter(self._data))
+            self._remove(oldest)
+            self.evictions += 1
+
+    @staticmethod
+    def _digest(key: Hashable) -> str:
+        return hashlib.blake2b(repr(key).encode('utf-8'), digest_size=16).hexdigest()
+
+    def _shared_key(self, key: Hashable) -> str:
+        version = self._version.decode() if isinstance(self._version, bytes) else '0'
+        return f'{self.namespace}:{version}:{self._digest(key)}'
+
+    async def _sync(self) -> None:
+        '''
+        其他 worker 整体失效过缓存（版本号变化）时清空本地条目，单个 key 失效时删除对应条目，并放弃正在写入的回答
+        '''
+        now = self.timer()
+        if now - self._synced_at < self.sync_interval:
+            return
+        self._synced_at = now
+        version, seq = await asyncio.gather(self.shared.get(f'{self.namespace}:version'),
+                                            self.shared.get(f'{self.namespace}:invalidated'))
+        seq = int(seq or 0)
+        if version != self._version:
+            if self._version is not _UNSYNCED:
+                self._clear()
+            self._version = version
+        elif self._invalidated_seq is not None and seq > self._invalidated_seq:
+            await self._apply_invalidations(self._invalidated_seq + 1, seq)
+        self._invalidated_seq = seq
+
+    async def _apply_invalidations(self, first: int, last: int) -> None:
+        '''
+        删除失效日志 first..last 中的本地条目；落后太多或日志已过期时清空本地缓存
+        '''
+        if last - first >= _MAX_SYNC_INVALIDATIONS:
+            self._clear()
+            return
+        digests = await asyncio.gather(*(self.shared.get(f'{self.namespace}:invalidated:{seq}')
+                                         for seq in range(first, last + 1)))
+        if any(digest is None for digest in digests):
+            self._clear()
+            return
+        digests = {digest.decode() for digest in digests}
+        for key in [key for key in self._data if self._digest(key) in digests]:
+            self._remove(key)
+        # 这些 key 正在写入的回答不再入库
+        self._generation += 1
+
+    async def _fetch_shared(self, key: Hashable) -> _Entry | None:
+        value = await self.shared.get(self._shared_key(key))
+        if value is None:
+            return None
+        expires_at, count = _SHARED_HEADER.unpack_from(value)
+        lengths = array('I')
+        lengths.frombytes(value[_SHARED_HEADER.size:_SHARED_HEADER.size + count * lengths.itemsize])
+        ttl = expires_at - time.time()
+        if ttl <= 0:
+            return None
+        entry = _Entry(value[_SHARED_HEADER.size + count * lengths.itemsize:], lengths, sum(lengths),
+                       self.timer() + ttl)
+        self._put(key, entry)
+        return entry
+
+    def _store_shared(self, key: Hashable, entry: _Entry, ttl: float) -> None:
+        value = _SHARED_HEADER.pack(time.time() + ttl, len(entry.lengths)) + entry.lengths.tobytes() + entry.blob
+        task = asyncio.create_task(self.shared.set(self._shared_key(key), value, ttl))
+        self._writes.add(task)
+        task.add_done_callback(self._write_done)
+
+    def _write_done(self, task: asyncio.Task) -> None:
+        self._writes.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            self.shared_errors += 1
+
+    async def fetch(self, key: Hashable, interval: float = 0.0) -> AsyncIterator[bytes] | None:
+        '''
+        同 replay，本地未命中时再查共享存储；共享存储不可用时只使用本地缓存
+        '''
+        if self.shared is None:
+            return self.replay(key, interval)
+        try:
+            await self._sync()
+        except Exception:
+            self.shared_errors += 1
+        entry = self._get(key)
+        if entry is None:
+            try:
+                entry = await self._fetch_shared(key)
+            except Exception:
+                self.shared_errors += 1
+            if entry is not None:
+                self.shared_hits += 1
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return self._replay(entry, interval)
+
+    def contains(self, key: Hashable) -> bool:
+        return self._get(key) is not None
+
+    def replay(self, key: Hashable, interval: float = 0.0) -> AsyncIterator[bytes] | None:
+        '''
+        命中时返回回放的字节块迭代器，未命中返回 None
+        '''
+        entry = self._get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return self._replay(entry, interval)
+
+    async def _replay(self, entry: _Entry, interval: float) -> AsyncIterator[bytes]:
+        data = zlib.decompress(entry.blob)
+        offset = 0
+        for i, length in enumerate(entry.lengths):
+            if i and interval > 0:
+                await asyncio.sleep(interval)
+            yield data[offset:offset + length]
+            offset += length
+
+    async def tee(self, key: Hashable, stream: AsyncIterator[bytes], done: bytes,
+                  skip: bytes = b'', ttl: float | None = None) -> AsyncIterator[bytes]:
+        '''
+        转发 stream 的同时压缩保存；最后一块以 done 结尾时写入缓存，与 skip 相同的块（心跳）不保存
+        ttl 为空时使用缓存默认的 TTL
+        '''
+        generation = self._generation
+        compressor = zlib.compressobj(self.level)
+        parts: list[bytes] = []
+        lengths = array('I')
+        raw_bytes = 0
+        last = b''
+        recording = True
+        async for chunk in stream:
+            yield chunk
+            if not recording or chunk == skip:
+                continue
+            raw_bytes += len(chunk)
+            if raw_bytes > self.max_entry_bytes:
+                recording = False
+                parts.clear()
+                continue
+            parts.append(compressor.compress(chunk))
+            lengths.append(len(chunk))
+            last = chunk
+        # 正常结束才会走到这里；客户端断开时生成器在 yield 处被关闭
+        if not recording or not last.endswith(done) or generation != self._generation:
+            self.skipped += 1
+            return
+        parts.append(compressor.flush())
+        ttl = self.ttl if ttl is None else ttl
+        entry = _Entry(b''.join(parts), lengths, raw_bytes, self.timer() + ttl)
+        self._put(key, entry)
+        if self.shared is not None:
+            self._store_shared(key, entry, ttl)
+
+    def invalidate(self, key: Hashable | None = None) -> int:
+        '''
+        key 为空时清空全部（知识库重建索引后调用），返回删除的条目数
+        '''
+        self.invalidations += 1
+        if key is not None:
+            # 该 key 正在写入的回答不再入库
+            self._generation += 1
+            if key in self._data:
+                self._remove(key)
+                return 1
+            return 0
+        return self._clear()
+
+    def _clear(self) -> int:
+        removed = len(self._data)
+        self._data.clear()
+        self.bytes = self.raw_bytes = 0
+        self._generation += 1
+        return removed
+
+    def invalidate_where(self, predicate: Callable[[Hashable], bool]) -> int:
+        '''
+        删除 key 满足 predicate 的条目，返回删除的条目数；此前已开始写入的回答都不再入库
+        '''
+        self.invalidations += 1
+        keys = [key for key in self._data if predicate(key)]
+        for key in keys:
+            self._remove(key)
+        self._generation += 1
+        return len(keys)
+
+    async def invalidate_shared(self, key: Hashable | None = None) -> None:
+        '''
+        本地失效后调用
+        key 为空时递增共享版本号，共享存储中的旧条目不再被读取，其他 worker 同步后清空本地缓存；
+        否则只删除该 key 的共享条目并写入失效日志，其他 worker 同步后删除对应的本地条目
+        '''
+        if self.shared is None:
+            return
+        try:
+            if key is None:
+                self._version = str(await self.shared.incr(f'{self.namespace}:version')).encode()
+                self._synced_at = self.timer()
+                return
+            await self.shared.delete(self._shared_key(key))
+            seq = await self.shared.incr(f'{self.namespace}:invalidated')
+            # 日志条目只需要保留到旧回答全部过期
+            await self.shared.set(f'{self.namespace}:invalidated:{seq}', self._digest(key).encode(), self.ttl)
+        except Exception:
+            self.shared_errors += 1
+
+    def stats(self) -> dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {"entries": len(self._data),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "raw_bytes": self.raw_bytes,
+                "compression_ratio": round(self.raw_bytes / self.bytes, 2) if self.bytes else 0.0,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "stored": self.stored,
+                "skipped": self.skipped,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+                "shared_enabled": self.shared is not None,
+                "shared_hits": self.shared_hits,
+                "shared_errors": self.shared_errors}
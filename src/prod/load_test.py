@@ -0,0 +1,290 @@
+'''
+压测：本地假上游 + 网关 + 指令中心（同进程，各自独立线程的事件循环），按并发驱动 /getaway_api 与 /commandCenter
+
+输出吞吐、p50/p95/p99 延迟、TTFT（收到第一个数据块）与网关事件循环延迟，结果保存为 JSON；
+指定 --baseline 时与之前保存的结果比较，任一指标变差超过 --max-regression 时以状态码 1 退出
+
+用法（在 src/prod 目录下）：
+    python load_test.py --concurrency 50 --requests 2000 --output baseline.json
+    python load_test.py --concurrency 50 --requests 2000 --output current.json --baseline baseline.json
+'''
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+
+import aiohttp
+
+from fake_upstreams import (build_fake_attendance_app, build_fake_knowledge_app, build_fake_llm_app,
+                            serve_in_thread, start_in_thread)
+
+CHAT_QUESTIONS = ['今天天气怎么样', '你好，你是谁', '帮我写一句生日祝福', '推荐一本书', '讲个笑话']
+# 与 intents.py 中的负责人一致
+LABELS = {'attendance': '考勤数据查询助理', 'knowledge': '知识库助理', 'chat': '前台助理'}
+DISTINCT_MARK = '#'
+
+# (指标路径, 越大越好)
+REGRESSION_CHECKS = [
+    (('throughput_rps',), True),
+    (('latency', 'p50'), False),
+    (('latency', 'p95'), False),
+    (('latency', 'p99'), False),
+    (('ttft', 'p95'), False),
+    (('event_loop_lag', 'p99'), False),
+]
+
+
+def summarize(values: list[float]) -> dict[str, float]:
+    if not values:
+        return {}
+    values = sorted(values)
+
+    def pick(q: float) -> float:
+        return round(values[min(len(values) - 1, int(len(values) * q))], 4)
+
+    return {"count": len(values), "avg": round(statistics.fmean(values), 4),
+            "p50": pick(0.5), "p95": pick(0.95), "p99": pick(0.99), "max": round(values[-1], 4)}
+
+
+def parse_mix(value: str) -> dict[str, float]:
+    mix = {}
+    for item in value.split(','):
+        kind, _, weight = item.partition(':')
+        mix[kind.strip()] = float(weight)
+    unknown = set(mix) - {'attendance', 'knowledge', 'chat', 'command_center'}
+    if unknown:
+        raise argparse.ArgumentTypeError(f'unknown request kinds: {sorted(unknown)}')
+    return mix
+
+
+async def monitor_loop_lag(samples: list[float], interval: float = 0.01) -> None:
+    '''
+    在网关的事件循环中运行：每次 sleep 的实际时长超出 interval 的部分即为事件循环延迟
+    '''
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        samples.append(max(0.0, loop.time() - started - interval))
+
+
+def start_stack(args, questions_by_label: dict[str, str], loop_lag: list[float]) -> tuple[str, str]:
+    '''
+    启动假上游、指令中心与网关，返回 (网关地址, 指令中心地址)
+    '''
+    def label(prompt: str) -> str:
+        # 意图识别 prompt 以 “问：{question} 答：” 结尾
+        question = prompt.rsplit('问：', 1)[-1].rsplit('答：', 1)[0].strip()
+        return questions_by_label.get(question.split(DISTINCT_MARK)[0], LABELS['chat'])
+
+    host = '127.0.0.1'
+    serve_in_thread(build_fake_llm_app(args.llm_latency, label, token_interval=args.token_interval),
+                    args.llm_port, host)
+    serve_in_thread(build_fake_attendance_app(args.upstream_latency, rows=args.attendance_rows,
+                                              row_interval=args.token_interval), args.attendance_port, host)
+    serve_in_thread(build_fake_knowledge_app(args.upstream_latency, token_interval=args.token_interval),
+                    args.knowledge_port, host)
+
+    # 网关与指令中心在导入时读取配置，必须先设置环境变量
+    os.environ['LLM_BASE_URL'] = f'http://{host}:{args.llm_port}/v1'
+    os.environ['ATTENDANCE_URL'] = f'http://{host}:{args.attendance_port}/execute_sql_stream'
+    os.environ['KNOWLEDGE_URL'] = f'http://{host}:{args.knowledge_port}/chat/knowledge_base_chat'
+    os.environ['COMMAND_CENTER_URL'] = f'http://{host}:{args.command_center_port}/commandCenter'
+    # 默认不预热、不输出请求日志，可通过环境变量覆盖
+    os.environ.setdefault('INTENT_CACHE_PREWARM', '0')
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+    import uvicorn
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'xl'))
+    from command_center import app as command_center_app
+    from intent_gataway_api import app as gateway_app
+
+    def serve_asgi(app, port: int, monitor: bool):
+        async def serve(ready: threading.Event):
+            server = uvicorn.Server(uvicorn.Config(app, host=host, port=port, log_level='warning',
+                                                   access_log=False))
+            loop = asyncio.get_running_loop()
+            loop.create_task(server.serve())
+            while not server.started:
+                await asyncio.sleep(0.01)
+            if monitor:
+                loop.create_task(monitor_loop_lag(loop_lag))
+            ready.set()
+
+        start_in_thread(serve)
+
+    serve_asgi(command_center_app, args.command_center_port, monitor=False)
+    serve_asgi(gateway_app, args.gateway_port, monitor=True)
+    return f'http://{host}:{args.gateway_port}', f'http://{host}:{args.command_center_port}'
+
+
+async def fetch_questions(command_center_url: str) -> dict[str, list[str]]:
+    '''
+    从指令中心取考勤 / 知识问答两类问题
+    '''
+    async with aiohttp.ClientSession() as session:
+        async with session.get(f'{command_center_url}/commandCenter') as response:
+            payload = await response.json()
+    sections = {section['title']: [command['sub_content'] for command in section['command_list']
+                                   if command.get('sub_content')]
+                for section in payload['data']}
+    return {'attendance': sections['考勤'], 'knowledge': sections['知识问答'], 'chat': CHAT_QUESTIONS}
+
+
+async def run_load(args, gateway_url: str, command_center_url: str, questions: dict[str, list[str]],
+                   total: int, records: list[dict]) -> float:
+    '''
+    concurrency 个 worker 共同完成 total 个请求，返回总耗时
+    '''
+    rng = random.Random(args.seed)
+    kinds = list(args.mix)
+    weights = [args.mix[kind] for kind in kinds]
+    schedule = rng.choices(kinds, weights, k=total)
+    next_index = 0
+
+    async def one(session: aiohttp.ClientSession, index: int, kind: str) -> dict:
+        record = {"kind": kind, "status": None, "latency": None, "ttft": None, "error": None}
+        started = time.perf_counter()
+        try:
+            if kind == 'command_center':
+                async with session.get(f'{command_center_url}/commandCenter') as response:
+                    record["status"] = response.status
+                    await response.read()
+                    record["ttft"] = time.perf_counter() - started
+            else:
+                question = rng.choice(questions[kind])
+                if args.distinct:
+                    # 每个请求的问题不同，绕过意图缓存与请求合并
+                    question = f'{question}{DISTINCT_MARK}{index}'
+                body = {"question": question, "user_id": f"u{index % 100}", "user_no": f"n{index % 100}",
+                        "user_role": args.role, "topic_id": f"t{index}"}
+                async with session.post(f'{gateway_url}/getaway_api', json=body) as response:
+                    record["status"] = response.status
+                    async for chunk in response.content.iter_any():
+                        if record["ttft"] is None and chunk.strip():
+                            record["ttft"] = time.perf_counter() - started
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            record["error"] = type(e).__name__
+        record["latency"] = time.perf_counter() - started
+        return record
+
+    async def worker(session: aiohttp.ClientSession) -> None:
+        nonlocal next_index
+        while next_index < total:
+            index = next_index
+            next_index += 1
+            records.append(await one(session, index, schedule[index]))
+
+    connector = aiohttp.TCPConnector(limit=0)
+    timeout = aiohttp.ClientTimeout(total=args.timeout)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(session) for _ in range(args.concurrency)))
+        return time.perf_counter() - started
+
+
+def build_report(args, records: list[dict], wall: float, loop_lag: list[float]) -> dict:
+    def ok(record: dict) -> bool:
+        return record["error"] is None and record["status"] == 200
+
+    def section(selected: list[dict]) -> dict:
+        succeeded = [r for r in selected if ok(r)]
+        return {"requests": len(selected),
+                "errors": len(selected) - len(succeeded),
+                "latency": summarize([r["latency"] for r in succeeded]),
+                "ttft": summarize([r["ttft"] for r in succeeded if r["ttft"] is not None])}
+
+    report = {"config": {key: value for key, value in vars(args).items() if key not in ('output', 'baseline')},
+              "timestamp": time.strftime('%Y-%m-%dT%H:%M:%S'),
+              "wall_seconds": round(wall, 3),
+              "throughput_rps": round(sum(1 for r in records if ok(r)) / wall, 2) if wall else 0.0,
+              **section(records),
+              "event_loop_lag": summarize(loop_lag),
+              "routes": {kind: section([r for r in records if r["kind"] == kind])
+                         for kind in sorted({r["kind"] for r in records})},
+              "status_codes": {}}
+    for record in records:
+        key = str(record["status"] if record["error"] is None else record["error"])
+        report["status_codes"][key] = report["status_codes"].get(key, 0) + 1
+    return report
+
+
+def compare(report: dict, baseline: dict, max_regression: float) -> list[str]:
+    '''
+    返回超出允许退化比例的指标说明；基线中没有的指标跳过
+    '''
+    failures = []
+    for path, higher_is_better in REGRESSION_CHECKS:
+        current, previous = report, baseline
+        for key in path:
+            current = current.get(key, {}) if isinstance(current, dict) else {}
+            previous = previous.get(key, {}) if isinstance(previous, dict) else {}
+        if not isinstance(current, (int, float)) or not isinstance(previous, (int, float)) or not previous:
+            continue
+        change = (previous - current) / previous if higher_is_better else (current - previous) / previous
+        name = '.'.join(path)
+        print(f'{name:<24} baseline={previous:<10} current={current:<10} change={change:+.1%}')
+        if change > max_regression:
+            failures.append(f'{name} regressed by {change:.1%} (baseline {previous}, current {current})')
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--concurrency', type=int, default=20)
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--warmup', type=int, default=20, help='正式计时前的预热请求数，不计入结果')
+    parser.add_argument('--mix', type=parse_mix, default='attendance:1,knowledge:1,chat:1,command_center:1',
+                        help='请求类型权重，可选 attendance / knowledge / chat / command_center')
+    parser.add_argument('--distinct', action='store_true', help='每个请求的问题加唯一后缀')
+    parser.add_argument('--role', default='Boss')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--timeout', type=float, default=60.0, help='单个请求超时（秒）')
+    parser.add_argument('--llm-latency', type=float, default=0.2, help='假 LLM 首包延迟（秒）')
+    parser.add_argument('--upstream-latency', type=float, default=0.1, help='假考勤 / 知识库首包延迟（秒）')
+    parser.add_argument('--token-interval', type=float, default=0.005, help='假上游流式输出间隔（秒）')
+    parser.add_argument('--attendance-rows', type=int, default=10)
+    parser.add_argument('--llm-port', type=int, default=18082)
+    parser.add_argument('--attendance-port', type=int, default=18098)
+    parser.add_argument('--knowledge-port', type=int, default=18095)
+    parser.add_argument('--command-center-port', type=int, default=18012)
+    parser.add_argument('--gateway-port', type=int, default=18088)
+    parser.add_argument('--output', help='结果 JSON 保存路径')
+    parser.add_argument('--baseline', help='用于比较的历史结果 JSON')
+    parser.add_argument('--max-regression', type=float, default=0.2, help='允许的最大退化比例')
+    args = parser.parse_args()
+
+    loop_lag: list[float] = []
+    labels = {}
+    gateway_url, command_center_url = start_stack(args, labels, loop_lag)
+    questions = asyncio.run(fetch_questions(command_center_url))
+    for kind in ('attendance', 'knowledge'):
+        labels.update({question: LABELS[kind] for question in questions[kind]})
+
+    if args.warmup:
+        asyncio.run(run_load(args, gateway_url, command_center_url, questions, args.warmup, []))
+    records: list[dict] = []
+    loop_lag.clear()
+    wall = asyncio.run(run_load(args, gateway_url, command_center_url, questions, args.requests, records))
+    report = build_report(args, records, wall, list(loop_lag))
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        failures = compare(report, baseline, args.max_regression)
+        if failures:
+            print('\n'.join(['REGRESSION:'] + failures))
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
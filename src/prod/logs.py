@@ -0,0 +1,105 @@
+'''
+非阻塞结构化日志：请求路径只把日志记录放进有界队列，由后台线程格式化为 JSON 行写出
+
+- 结构化字段通过 extra={"fields": {...}} 传入
+- INFO 及以下按 sample_rate 采样，WARNING 及以上全部保留
+- 队列满时丢弃并计数，不阻塞事件循环
+- 请求内的日志带上 request_id（tracing.py）
+'''
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+
+from tracing import current_request_id
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {"ts": round(record.created, 3),
+                 "level": record.levelname,
+                 "logger": record.name,
+                 "pid": record.process,
+                 "msg": record.getMessage()}
+        request_id = getattr(record, 'request_id', None)
+        if request_id is not None:
+            entry["request_id"] = request_id
+        fields = getattr(record, 'fields', None)
+        if fields:
+            entry.update(fields)
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SampleFilter(logging.Filter):
+    def __init__(self, sample_rate: float) -> None:
+        super().__init__()
+        self.sample_rate = sample_rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno >= logging.WARNING or self.sample_rate >= 1.0 or random.random() < self.sample_rate
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    def __init__(self, log_queue: queue.Queue) -> None:
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # 格式化放到后台线程，这里只固定 msg 参数，避免后续被修改
+        record.msg = record.getMessage()
+        record.args = None
+        record.exc_text = None
+        # contextvar 只在调用线程中可见
+        record.request_id = current_request_id()
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_listener: logging.handlers.QueueListener | None = None
+_handler: DroppingQueueHandler | None = None
+
+
+def setup_logging(level: str = 'INFO', sample_rate: float = 1.0, queue_size: int = 10000) -> None:
+    '''
+    把根 logger 的输出切换为队列 + 后台线程，重复调用无效
+    '''
+    global _listener, _handler
+    if _listener is not None:
+        return
+    log_queue: queue.Queue = queue.Queue(maxsize=queue_size)
+    _handler = DroppingQueueHandler(log_queue)
+    _handler.addFilter(SampleFilter(sample_rate))
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(JsonFormatter())
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=False)
+    root = logging.getLogger()
+    root.addHandler(_handler)
+    root.setLevel(level)
+    # httpx 每个请求都会打一条 INFO 日志
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+    _listener.start()
+
+
+def shutdown_logging() -> None:
+    '''
+    写出队列中剩余的日志并停止后台线程
+    '''
+    global _listener, _handler
+    if _listener is None:
+        return
+    _listener.stop()
+    logging.getLogger().removeHandler(_handler)
+    _listener = _handler = None
+
+
+def dropped() -> int:
+    return _handler.dropped if _handler is not None else 0
@@ -0,0 +1,155 @@
+'''
+Prometheus 文本格式指标（计数器 / 直方图 / 回调量表），不依赖 prometheus_client
+
+热路径上只做字典查找与整数加法；GET /metrics 时再生成文本
+'''
+import bisect
+import math
+from typing import Callable, Iterable
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+QUEUE_DELAY_BUCKETS = (0.0005, 0.001, 0.002, 0.005, 0.01, 0.025, 0.05, 0.1)
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = ()) -> None:
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, *labelvalues: str, amount: float = 1) -> None:
+        self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def value(self, *labelvalues: str) -> float:
+        return self._values.get(labelvalues, 0)
+
+    def samples(self) -> list[str]:
+        return [f'{self.name}{_labels(self.labelnames, key)} {_number(value)}'
+                for key, value in sorted(self._values.items())]
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = (),
+                 buckets: Iterable[float] = LATENCY_BUCKETS) -> None:
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labelvalues -> [各桶计数（非累计，最后一个为 +Inf）, sum, count]
+        self._series: dict[tuple[str, ...], list] = {}
+
+    def observe(self, value: float, *labelvalues: str) -> None:
+        series = self._series.get(labelvalues)
+        if series is None:
+            series = self._series[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def samples(self) -> list[str]:
+        lines = []
+        for key, (counts, total, count) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                le = 'le="' + _number(bound) + '"'
+                lines.append(f'{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels(self.labelnames, key)} {_number(total)}')
+            lines.append(f'{self.name}_count{_labels(self.labelnames, key)} {count}')
+        return lines
+
+
+class CallbackGauge:
+    '''
+    渲染时调用 collect() 取值，返回 {labelvalues: value}
+    '''
+    kind = 'gauge'
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str],
+                 collect: Callable[[], dict[tuple[str, ...], float]]) -> None:
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.collect = collect
+
+    def samples(self) -> list[str]:
+        return [f'{self.name}{_labels(self.labelnames, key)} {_number(value)}'
+                for key, value in sorted(self.collect().items())]
+
+
+class MetricsRegistry:
+    def __init__(self) -> None:
+        self.metrics: dict[str, Counter | Histogram | CallbackGauge] = {}
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self.register(Counter(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: Iterable[str] = (),
+                  buckets: Iterable[float] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, labelnames, buckets))
+
+    def gauge(self, name: str, help: str, labelnames: Iterable[str],
+              collect: Callable[[], dict[tuple[str, ...], float]]) -> CallbackGauge:
+        return self.register(CallbackGauge(name, help, labelnames, collect))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+# route: attendance / knowledge / chat
+REQUESTS = REGISTRY.counter('gateway_requests_total', '按路由统计的请求数', ('route',))
+CLASSIFICATIONS = REGISTRY.counter('gateway_classifications_total', '意图识别结果',
+                                   ('intent', 'source'))
+ERRORS = REGISTRY.counter('gateway_errors_total', '错误数', ('route', 'kind'))
+CLASSIFY_SECONDS = REGISTRY.histogram('gateway_classification_seconds', '意图识别耗时', ('route',))
+CONNECT_SECONDS = REGISTRY.histogram('gateway_upstream_connect_seconds', '上游新建连接耗时', ('upstream',))
+TTFT_SECONDS = REGISTRY.histogram('gateway_ttft_seconds', '收到请求到写出第一帧的耗时', ('route',))
+STREAM_SECONDS = REGISTRY.histogram('gateway_stream_duration_seconds', '收到请求到响应结束的耗时',
+                                    ('route',))
+RESPONSE_BYTES = REGISTRY.histogram('gateway_response_bytes', '每个响应写出的字节数', ('route',),
+                                    buckets=BYTES_BUCKETS)
+RESPONSE_FRAMES = REGISTRY.histogram('gateway_response_frames', '每个响应的写出次数（转发时合并写出的多个事件计一次）',
+                                     ('route',), buckets=COUNT_BUCKETS)
+KB_CACHE_LOOKUPS = REGISTRY.counter('gateway_kb_cache_lookups_total', '知识库回答缓存查询', ('result',))
+ATTENDANCE_CACHE_LOOKUPS = REGISTRY.counter('gateway_attendance_cache_lookups_total', '考勤结果缓存查询',
+                                            ('bucket', 'result'))
+INTENT_CONFIDENCE = REGISTRY.histogram('gateway_intent_confidence', '约束输出意图识别的置信度',
+                                       buckets=(0.5, 0.6, 0.7, 0.8, 0.9, 0.95, 0.99))
+INTENT_BATCH_SIZE = REGISTRY.histogram('gateway_intent_batch_size', '意图识别每批的问题数', buckets=COUNT_BUCKETS)
+INTENT_BATCH_WAIT_SECONDS = REGISTRY.histogram('gateway_intent_batch_wait_seconds', '意图识别批内最长的排队时间',
+                                               buckets=QUEUE_DELAY_BUCKETS)
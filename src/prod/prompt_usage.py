@@ -0,0 +1,80 @@
+'''
+问题使用热度：按指数衰减的计数，最近的使用权重更高
+
+采用 forward decay：写入时把增量放大为 amount * 2^((now - base) / half_life)，读取时再除回去，
+写入只更新一个条目，不需要定期衰减所有条目
+
+只统计已知指令（指令中心的问题）的使用次数：原始问题可能含姓名、工号、考勤明细，不进入统计
+'''
+import heapq
+import time
+from typing import Callable, Hashable, Iterable
+
+# 放大系数超过 2^64 时整体换算到新的基准时间，避免浮点溢出
+_REBASE_HALF_LIVES = 64
+
+
+class DecayedCounter:
+    def __init__(self, half_life: float, maxsize: int, timer: Callable[[], float] = time.monotonic) -> None:
+        self.half_life = half_life
+        self.maxsize = maxsize
+        self.timer = timer
+        self._base = timer()
+        self._weights: dict[Hashable, float] = {}
+
+    def __len__(self) -> int:
+        return len(self._weights)
+
+    def _scale(self, now: float) -> float:
+        exponent = (now - self._base) / self.half_life
+        if exponent > _REBASE_HALF_LIVES:
+            factor = 2.0 ** -exponent
+            weights = self._weights
+            for key in weights:
+                weights[key] *= factor
+            self._base = now
+            exponent = 0.0
+        return 2.0 ** exponent
+
+    def add(self, key: Hashable, amount: float = 1.0) -> None:
+        scale = self._scale(self.timer())
+        weights = self._weights
+        weights[key] = weights.get(key, 0.0) + amount * scale
+        if len(weights) > self.maxsize:
+            # 超出容量时一次淘汰权重最低的 10%，均摊淘汰开销
+            for victim in heapq.nsmallest(max(1, self.maxsize // 10), weights, key=weights.get):
+                del weights[victim]
+
+    def score(self, key: Hashable) -> float:
+        scale = self._scale(self.timer())
+        return self._weights.get(key, 0.0) / scale
+
+    def top(self, n: int) -> list[tuple[Hashable, float]]:
+        scale = self._scale(self.timer())
+        return [(key, weight / scale) for key, weight in heapq.nlargest(n, self._weights.items(), key=lambda x: x[1])]
+
+
+class PromptMatcher:
+    '''
+    把用户问题归到已知指令：问题与指令相同，或以指令开头（例如在“姓名为：”后补充了姓名）
+    '''
+
+    def __init__(self, prompts: Iterable[str] = ()) -> None:
+        self.update(prompts)
+
+    def update(self, prompts: Iterable[str]) -> None:
+        # 长的指令优先，避免被作为它前缀的短指令抢先匹配
+        self._prompts = sorted({prompt.strip() for prompt in prompts if prompt.strip()}, key=len, reverse=True)
+        self._exact = frozenset(self._prompts)
+
+    def __len__(self) -> int:
+        return len(self._prompts)
+
+    def match(self, question: str) -> str | None:
+        question = question.strip()
+        if question in self._exact:
+            return question
+        for prompt in self._prompts:
+            if question.startswith(prompt):
+                return prompt
+        return None
@@ -0,0 +1,375 @@
+'''
+上游容错：超时、首字节前重试（受重试预算限制）、对冲请求、熔断
+
+- 超时分三段：建连（由各自的 HTTP 客户端配置）、首字节、流式输出中两帧之间的空闲时间
+- 只在收到第一帧之前重试，已经开始输出的流不能重放；重试次数受滑动窗口内的重试预算限制，避免故障时重试放大流量
+- 对冲：非流式调用超过近期 p95 延迟仍未返回时再发一次，取先返回的结果（对冲请求同样消耗重试预算，并且要占用一个并发名额）
+- 熔断：连续失败达到阈值后打开，reset_timeout 后放行一个探测请求，成功则关闭；探测失败、遇到不可重试的异常或被取消时重新打开
+'''
+import asyncio
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Awaitable, Callable, TypeVar
+
+from async_utils import cancel_and_wait
+
+T = TypeVar('T')
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpen(Exception):
+    def __init__(self, upstream: str, retry_after: float) -> None:
+        super().__init__(f'{upstream}: circuit open')
+        self.upstream = upstream
+        self.retry_after = retry_after
+
+
+class UpstreamStatusError(Exception):
+    '''
+    上游返回 5xx，按可重试的失败处理
+    '''
+
+    def __init__(self, upstream: str, status: int) -> None:
+        super().__init__(f'{upstream}: HTTP {status}')
+        self.upstream = upstream
+        self.status = status
+
+
+class RetryBudget:
+    '''
+    滑动窗口（按秒分桶）内的重试数不超过 min_per_second * window + ratio * 请求数
+    '''
+
+    def __init__(self, ratio: float, min_per_second: float, window: int = 10,
+                 timer: Callable[[], float] = time.monotonic) -> None:
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.window = max(1, window)
+        self.timer = timer
+        self._seconds = [-1] * self.window
+        self._requests = [0] * self.window
+        self._retries = [0] * self.window
+        self.exhausted = 0
+
+    def _slot(self) -> int:
+        second = int(self.timer())
+        slot = second % self.window
+        if self._seconds[slot] != second:
+            self._seconds[slot] = second
+            self._requests[slot] = 0
+            self._retries[slot] = 0
+        return slot
+
+    def _totals(self) -> tuple[int, int]:
+        oldest = int(self.timer()) - self.window
+        requests = retries = 0
+        for second, request_count, retry_count in zip(self._seconds, self._requests, self._retries):
+            if second > oldest:
+                requests += request_count
+                retries += retry_count
+        return requests, retries
+
+    def record_request(self) -> None:
+        self._requests[self._slot()] += 1
+
+    def try_retry(self) -> bool:
+        slot = self._slot()
+        requests, retries = self._totals()
+        if retries >= self.min_per_second * self.window + self.ratio * requests:
+            self.exhausted += 1
+            return False
+        self._retries[slot] += 1
+        return True
+
+    def stats(self) -> dict[str, Any]:
+        requests, retries = self._totals()
+        return {"requests": requests, "retries": retries, "exhausted": self.exhausted,
+                "available": max(0, int(self.min_per_second * self.window + self.ratio * requests) - retries)}
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int, reset_timeout: float,
+                 timer: Callable[[], float] = time.monotonic) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.timer = timer
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.opens = 0
+        self.rejected = 0
+        self._probe_started = 0.0
+
+    def is_open(self) -> bool:
+        '''
+        只读判断：打开且未到探测时间
+        '''
+        return self.state == OPEN and self.timer() - self.opened_at < self.reset_timeout
+
+    def allow(self) -> bool:
+        now = self.timer()
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN:
+            if now - self.opened_at < self.reset_timeout:
+                self.rejected += 1
+                return False
+            self.state = HALF_OPEN
+            self._probe_started = now
+            return True
+        # 半开：同时只放行一个探测请求；探测结果总会通过 record_* / reopen 回报，这里的超时只是兜底
+        if now - self._probe_started >= self.reset_timeout:
+            self._probe_started = now
+            return True
+        self.rejected += 1
+        return False
+
+    def retry_after(self) -> float:
+        return max(0.0, self.reset_timeout - (self.timer() - self.opened_at))
+
+    def record_success(self) -> None:
+        self.state = CLOSED
+        self.failures = 0
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold):
+            self.state = OPEN
+            self.opened_at = self.timer()
+            self.opens += 1
+
+    def reopen(self) -> None:
+        '''
+        半开探测没有得到可判断的结果（不可重试的异常、被取消）时重新打开，reset_timeout 后再放行一个探测请求
+        '''
+        if self.state == HALF_OPEN:
+            self.state = OPEN
+            self.opened_at = self.timer()
+
+    def stats(self) -> dict[str, Any]:
+        return {"state": OPEN if self.is_open() else (HALF_OPEN if self.state != CLOSED else CLOSED),
+                "consecutive_failures": self.failures,
+                "opens": self.opens,
+                "rejected": self.rejected,
+                "retry_after": round(self.retry_after(), 3) if self.state == OPEN else 0.0}
+
+
+class LatencyWindow:
+    '''
+    最近 size 次成功调用的延迟，分位数每 refresh 次记录重新计算一次
+    '''
+
+    def __init__(self, size: int = 512, refresh: int = 64) -> None:
+        self._samples: deque[float] = deque(maxlen=size)
+        self._refresh = refresh
+        self._since_refresh = 0
+        self._sorted: list[float] = []
+
+    def observe(self, seconds: float) -> None:
+        self._samples.append(seconds)
+        self._since_refresh += 1
+
+    def quantile(self, q: float) -> float | None:
+        if self._since_refresh >= self._refresh or len(self._sorted) < min(len(self._samples), self._refresh):
+            self._sorted = sorted(self._samples)
+            self._since_refresh = 0
+        if not self._sorted:
+            return None
+        return self._sorted[min(len(self._sorted) - 1, int(len(self._sorted) * q))]
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+
+class _Unlimited:
+    '''
+    没有配置 hedge_permit 时对冲请求不占名额
+    '''
+
+    @staticmethod
+    def release() -> None:
+        pass
+
+
+_UNLIMITED = _Unlimited()
+
+
+class UpstreamPolicy:
+    def __init__(self, name: str, first_byte_timeout: float, idle_timeout: float, max_retries: int,
+                 budget: RetryBudget, breaker: CircuitBreaker, retry_on: tuple[type[BaseException], ...],
+                 backoff: float = 0.05, hedge_quantile: float = 0.95, hedge_min_delay: float = 0.05,
+                 hedge_min_samples: int = 20, hedge_permit: Callable[[], Any] | None = None) -> None:
+        '''
+        retry_on: 可重试、计入熔断的异常类型（超时、连接错误、5xx）；其他异常直接抛出，不影响熔断
+        hedge_permit: 对冲请求占用并发名额，返回带 release() 的名额，没有空闲名额时返回 None（不发对冲请求）
+        '''
+        self.name = name
+        self.first_byte_timeout = first_byte_timeout
+        self.idle_timeout = idle_timeout
+        self.max_retries = max_retries
+        self.budget = budget
+        self.breaker = breaker
+        self.retry_on = retry_on + (TimeoutError, UpstreamStatusError)
+        self.backoff = backoff
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_min_samples = hedge_min_samples
+        self.hedge_permit = hedge_permit or (lambda: _UNLIMITED)
+        self.latency = LatencyWindow()
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.hedges_skipped = 0
+        self.timeouts = 0
+
+    def is_open(self) -> bool:
+        return self.breaker.is_open()
+
+    def check(self) -> bool:
+        '''
+        返回本次调用是否是半开状态下的探测请求
+        '''
+        if not self.breaker.allow():
+            raise CircuitOpen(self.name, self.breaker.retry_after())
+        return self.breaker.state == HALF_OPEN
+
+    def _failed(self, e: BaseException) -> None:
+        if isinstance(e, TimeoutError):
+            self.timeouts += 1
+        self.breaker.record_failure()
+
+    async def _retry_allowed(self, attempt: int) -> bool:
+        if attempt >= self.max_retries or not self.breaker.allow() or not self.budget.try_retry():
+            return False
+        self.retries += 1
+        await asyncio.sleep(self.backoff * (attempt + 1))
+        return True
+
+    def hedge_delay(self) -> float | None:
+        if len(self.latency) < self.hedge_min_samples:
+            return None
+        return max(self.hedge_min_delay, self.latency.quantile(self.hedge_quantile))
+
+    async def call(self, fn: Callable[[], Awaitable[T]], hedge: bool = False) -> T:
+        '''
+        非流式调用：整个调用受首字节超时限制，失败时按重试预算重试；hedge 为 True 时超过 p95 延迟发起对冲请求
+        '''
+        probe = self.check()
+        self.budget.record_request()
+        attempt = 0
+        while True:
+            started = time.perf_counter()
+            try:
+                async with asyncio.timeout(self.first_byte_timeout):
+                    delay = self.hedge_delay() if hedge else None
+                    result = await (self._hedged(fn, delay) if delay is not None else fn())
+            except self.retry_on as e:
+                self._failed(e)
+                if not await self._retry_allowed(attempt):
+                    raise
+                attempt += 1
+                continue
+            except BaseException:
+                if probe:
+                    self.breaker.reopen()
+                raise
+            self.breaker.record_success()
+            self.latency.observe(time.perf_counter() - started)
+            return result
+
+    def _try_hedge_permit(self) -> Any | None:
+        '''
+        先占并发名额再扣重试预算，没有名额时不消耗预算
+        '''
+        permit = self.hedge_permit()
+        if permit is None:
+            self.hedges_skipped += 1
+            return None
+        if not self.budget.try_retry():
+            permit.release()
+            return None
+        return permit
+
+    async def _hedged(self, fn: Callable[[], Awaitable[T]], delay: float) -> T:
+        first = asyncio.ensure_future(fn())
+        tasks = {first}
+        permit = None
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done:
+                permit = self._try_hedge_permit()
+            if permit is not None:
+                self.hedges += 1
+                tasks.add(asyncio.ensure_future(fn()))
+            error = None
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not first:
+                            self.hedge_wins += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                await cancel_and_wait(task)
+            if permit is not None:
+                permit.release()
+
+    async def stream(self, factory: Callable[[], AsyncIterator[T]]) -> AsyncIterator[T]:
+        '''
+        流式调用：第一帧受首字节超时限制，之后每两帧之间受空闲超时限制（等待下游消费的时间不计入）
+        只在第一帧之前重试
+        '''
+        probe = self.check()
+        self.budget.record_request()
+        loop = asyncio.get_running_loop()
+        attempt = 0
+        while True:
+            iterator = factory()
+            received = False
+            try:
+                async with asyncio.timeout(None) as deadline:
+                    while True:
+                        deadline.reschedule(loop.time() + (self.idle_timeout if received else self.first_byte_timeout))
+                        try:
+                            item = await anext(iterator)
+                        except StopAsyncIteration:
+                            break
+                        deadline.reschedule(None)
+                        if not received:
+                            received = True
+                            self.breaker.record_success()
+                        yield item
+            except self.retry_on as e:
+                self._failed(e)
+                if received or not await self._retry_allowed(attempt):
+                    raise
+                attempt += 1
+                continue
+            except BaseException:
+                # 包括下游断开时的 GeneratorExit / 取消；探测已经收到第一帧时 breaker 已关闭，reopen 不做任何事
+                if probe:
+                    self.breaker.reopen()
+                raise
+            finally:
+                await iterator.aclose()
+            if not received:
+                self.breaker.record_success()
+            return
+
+    def stats(self) -> dict[str, Any]:
+        hedge_delay = self.hedge_delay()
+        return {"breaker": self.breaker.stats(),
+                "retry_budget": self.budget.stats(),
+                "timeouts": {"first_byte": self.first_byte_timeout, "idle": self.idle_timeout},
+                "retries": self.retries,
+                "timed_out": self.timeouts,
+                "hedges": self.hedges,
+                "hedge_wins": self.hedge_wins,
+                "hedges_skipped": self.hedges_skipped,
+                "hedge_delay_ms": round(hedge_delay * 1000, 2) if hedge_delay is not None else None}
@@ -0,0 +1,26 @@
+'''
+网关启动入口（在 src/prod 目录下）：python serve.py
+
+- GATEWAY_WORKERS > 1 时由 uvicorn 主进程管理多个 worker 进程，共用同一个监听端口；
+  主进程只导入 settings 与 uvicorn，不导入网关本身
+- kill -HUP <主进程>：逐个启动新 worker，新 worker 就绪（lifespan 启动完成，含连接预热）后再停止对应的旧 worker，
+  用于不中断服务地发布新代码 / 配置；kill -TTIN / -TTOU 增加 / 减少一个 worker
+- 旧 worker 停止时最多等待 GATEWAY_GRACEFUL_TIMEOUT 秒，让进行中的流式响应结束
+- 多 worker 时建议配置 SHARED_STORE_URL，意图缓存、会话与回答缓存在 worker 之间共享
+'''
+import os
+
+import uvicorn
+
+import settings
+
+
+def main() -> None:
+    uvicorn.run('intent_gataway_api:app', app_dir=os.path.dirname(os.path.abspath(__file__)),
+                host=settings.GATEWAY_HOST, port=settings.GATEWAY_PORT, workers=settings.GATEWAY_WORKERS,
+                timeout_graceful_shutdown=settings.GATEWAY_GRACEFUL_TIMEOUT,
+                timeout_worker_healthcheck=settings.GATEWAY_WORKER_READY_TIMEOUT)
+
+
+if __name__ == '__main__':
+    main()
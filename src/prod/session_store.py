@@ -0,0 +1,166 @@
+'''
+按 topic_id 保存的会话状态：上一次意图与最近几轮问答，LRU + TTL 淘汰
+
+用于识别追问（例如“那上个月呢”）：明确的追问直接沿用上一次的意图，跳过意图识别；
+开放领域的追问再附带精简的历史对话
+多 worker 时同一 topic 的请求可能落在不同 worker，配置共享存储后以共享存储中的记录为准
+'''
+import json
+import sys
+from collections import deque
+from typing import Any, Callable
+
+from intents import INTENTS
+from shared_store import SharedStore
+from ttl_cache import TTLCache
+
+SHARED_KEY_PREFIX = 'session:'
+
+# 追问的开头 / 结尾提示
+FOLLOW_UP_PREFIXES = ('那', '那么', '还有', '再', '换成', '改成', '如果是', '同样', '继续', '然后', '另外')
+# “吗”是通用的疑问语气词（“你能帮我写首诗吗”），不作为追问提示
+FOLLOW_UP_SUFFIXES = ('呢',)
+# 关键词没有任何证据时，只接受以追问开头、去掉开头 / 结尾提示后不超过这么多字的省略句（“那上个月呢”“还有呢”）
+ELLIPSIS_MAX_CHARS = 4
+_TRAILING_PUNCTUATION = '?？!！。.，, '
+
+
+class SessionRecord:
+    __slots__ = ('intent', 'turns')
+
+    def __init__(self, intent: str, max_turns: int) -> None:
+        self.intent = intent
+        # (意图, 问题, 回答)，回答只保存开放领域的截断文本
+        self.turns: deque[tuple[str, str, str | None]] = deque(maxlen=max_turns)
+
+
+class SessionStore:
+    def __init__(self, maxsize: int, ttl: float, max_turns: int = 4, answer_chars: int = 200,
+                 follow_up_max_chars: int = 16, shared: SharedStore | None = None) -> None:
+        self.cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.shared = shared
+        self.shared_errors = 0
+        self.max_turns = max_turns
+        self.answer_chars = answer_chars
+        self.follow_up_max_chars = follow_up_max_chars
+        self.routed = 0
+        self.reused = 0
+
+    def get(self, topic_id: str) -> SessionRecord | None:
+        return self.cache.get(topic_id)
+
+    async def load(self, topic_id: str) -> SessionRecord | None:
+        '''
+        读取会话；启用共享存储时从共享存储读取并覆盖本地副本，共享存储不可用时退化为本地
+        '''
+        if self.shared is None:
+            return self.get(topic_id)
+        try:
+            value = await self.shared.get(SHARED_KEY_PREFIX + topic_id)
+        except Exception:
+            self.shared_errors += 1
+            return self.get(topic_id)
+        if value is None:
+            self.cache.pop(topic_id)
+            return None
+        payload = json.loads(value)
+        record = SessionRecord(payload["intent"], self.max_turns)
+        record.turns.extend(tuple(turn) for turn in payload["turns"])
+        self.cache.set(topic_id, record)
+        return record
+
+    async def save(self, topic_id: str, record: SessionRecord) -> None:
+        '''
+        record / set_answer 之后调用，把会话写回共享存储
+        '''
+        if self.shared is None:
+            return
+        value = json.dumps({"intent": record.intent, "turns": list(record.turns)}, ensure_ascii=False)
+        try:
+            await self.shared.set(SHARED_KEY_PREFIX + topic_id, value.encode('utf-8'), self.cache.ttl)
+        except Exception:
+            self.shared_errors += 1
+
+    def is_follow_up(self, question: str, record: SessionRecord | None,
+                     score: Callable[[str], dict[str, float]]) -> bool:
+        '''
+        明确的追问：问题较短、带有追问提示，且满足其一：
+        - 关键词打分支持上一次的意图（大于 0），且不偏向其他意图
+        - 关键词对所有意图都没有证据，且问题是以追问开头的省略句，本身几乎没有内容
+        '''
+        if record is None:
+            return False
+        text = question.strip().rstrip(_TRAILING_PUNCTUATION)
+        if not text or len(text) > self.follow_up_max_chars:
+            return False
+        if not (text.startswith(FOLLOW_UP_PREFIXES) or text.endswith(FOLLOW_UP_SUFFIXES)):
+            return False
+        scores = score(text)
+        prior = scores.get(record.intent, 0.0)
+        if prior > 0:
+            return all(value <= prior for intent, value in scores.items() if intent != record.intent)
+        if any(value > 0 for value in scores.values()):
+            return False
+        prefix = next((prefix for prefix in sorted(FOLLOW_UP_PREFIXES, key=len, reverse=True)
+                       if text.startswith(prefix)), None)
+        if prefix is None:
+            return False
+        rest = text[len(prefix):]
+        suffix = next((suffix for suffix in FOLLOW_UP_SUFFIXES if rest.endswith(suffix)), '')
+        return len(rest) - len(suffix) <= ELLIPSIS_MAX_CHARS
+
+    def record(self, topic_id: str, intent: str, question: str, reused: bool) -> SessionRecord:
+        self.routed += 1
+        if reused:
+            self.reused += 1
+        record = self.cache.get(topic_id)
+        if record is None:
+            record = SessionRecord(intent, self.max_turns)
+        record.intent = intent
+        record.turns.append((intent, question, None))
+        # 重新写入以刷新 TTL 与 LRU 顺序
+        self.cache.set(topic_id, record)
+        return record
+
+    def set_answer(self, record: SessionRecord, answer: str) -> None:
+        if record.turns:
+            intent, question, _ = record.turns[-1]
+            record.turns[-1] = (intent, question, answer[:self.answer_chars])
+
+    def history(self, record: SessionRecord) -> list[dict[str, str]]:
+        '''
+        当前问题之前的问答，转换为 chat messages；只包含有回答的开放领域轮次
+        '''
+        messages = []
+        for _, question, answer in list(record.turns)[:-1]:
+            if answer is not None:
+                messages.append({"role": "user", "content": question})
+                messages.append({"role": "assistant", "content": answer})
+        return messages
+
+    def memory_bytes(self) -> int:
+        '''
+        估算会话占用的内存（记录、轮次与字符串本身，不含 TTLCache 的索引）
+        '''
+        total = 0
+        for _, record in self.cache.items():
+            total += sys.getsizeof(record) + sys.getsizeof(record.turns)
+            for turn in record.turns:
+                total += sys.getsizeof(turn) + sum(sys.getsizeof(value) for value in turn[1:] if value is not None)
+        return total
+
+    def stats(self) -> dict[str, Any]:
+        intents = dict.fromkeys(INTENTS, 0)
+        for _, record in self.cache.items():
+            intents[record.intent] = intents.get(record.intent, 0) + 1
+        return {"sessions": len(self.cache),
+                "maxsize": self.cache.maxsize,
+                "memory_bytes": self.memory_bytes(),
+                "evictions": self.cache.evictions,
+                "expirations": self.cache.expirations,
+                "intents": intents,
+                "routed": self.routed,
+                "classification_skipped": self.reused,
+                "classification_skip_rate": round(self.reused / self.routed, 4) if self.routed else 0.0,
+                "shared_enabled": self.shared is not None,
+                "shared_errors": self.shared_errors}
@@ -0,0 +1,231 @@
+import os
+
+
+# 网关配置，均可通过同名环境变量覆盖
+def _env_str(name: str, default: str) -> str:
+    return os.getenv(name, default)
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value not in (None, '') else default
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    return float(value) if value not in (None, '') else default
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value in (None, ''):
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def _env_map(name: str, default: dict, convert) -> dict:
+    '''
+    格式：key:value,key:value
+    '''
+    value = os.getenv(name)
+    if value in (None, ''):
+        return default
+    result = {}
+    for item in value.split(','):
+        key, _, number = item.partition(':')
+        result[key.strip()] = convert(number)
+    return result
+
+
+def _env_int_map(name: str, default: dict[str, int]) -> dict[str, int]:
+    return _env_map(name, default, int)
+
+
+def _env_float_map(name: str, default: dict[str, float]) -> dict[str, float]:
+    return _env_map(name, default, float)
+
+
+# 服务进程（python serve.py）：监听地址与 worker 进程数；kill -HUP <主进程> 逐个替换 worker（新 worker 就绪后才停止旧的）
+GATEWAY_HOST = _env_str('GATEWAY_HOST', '0.0.0.0')
+GATEWAY_PORT = _env_int('GATEWAY_PORT', 8088)
+GATEWAY_WORKERS = max(1, _env_int('GATEWAY_WORKERS', 1))
+# 停止 worker 时等待进行中的流式响应结束的最长时间与新 worker 就绪的最长等待时间（秒）
+GATEWAY_GRACEFUL_TIMEOUT = _env_int('GATEWAY_GRACEFUL_TIMEOUT', 30)
+GATEWAY_WORKER_READY_TIMEOUT = _env_int('GATEWAY_WORKER_READY_TIMEOUT', 30)
+# 启动时预热：建立 LLM / 上游连接（完成或超时后 worker 才开始接收请求）
+STARTUP_PREWARM = _env_bool('STARTUP_PREWARM', True)
+STARTUP_PREWARM_TIMEOUT = _env_float('STARTUP_PREWARM_TIMEOUT', 5.0)
+
+# 大模型（意图识别 / 开放领域对话）
+LLM_BASE_URL = _env_str('LLM_BASE_URL', 'http://192.168.204.202:8082/v1')
+LLM_API_KEY = _env_str('LLM_API_KEY', 'EMPTY_KEY')
+LLM_MODEL = _env_str('LLM_MODEL', 'Qwen1.5')
+# 共享 httpx 连接池大小
+LLM_MAX_CONNECTIONS = _env_int('LLM_MAX_CONNECTIONS', 100)
+LLM_MAX_KEEPALIVE_CONNECTIONS = _env_int('LLM_MAX_KEEPALIVE_CONNECTIONS', 20)
+LLM_KEEPALIVE_EXPIRY = _env_float('LLM_KEEPALIVE_EXPIRY', 30.0)
+
+# 考勤 / 知识库上游地址
+ATTENDANCE_URL = _env_str('ATTENDANCE_URL', 'http://192.168.204.198:60001/execute_sql_stream')
+KNOWLEDGE_URL = _env_str('KNOWLEDGE_URL', 'http://192.168.102.95:7861/chat/knowledge_base_chat')
+
+# 考勤 / 知识库上游 aiohttp 连接池
+UPSTREAM_LIMIT = _env_int('UPSTREAM_LIMIT', 100)
+UPSTREAM_LIMIT_PER_HOST = _env_int('UPSTREAM_LIMIT_PER_HOST', 50)
+UPSTREAM_KEEPALIVE_TIMEOUT = _env_float('UPSTREAM_KEEPALIVE_TIMEOUT', 30.0)
+UPSTREAM_DNS_CACHE_TTL = _env_int('UPSTREAM_DNS_CACHE_TTL', 300)
+
+# 上游超时（秒）：建连；首字节；流式输出中两帧之间的最长间隔（等待客户端消费的时间不计入）
+# 首字节 / 空闲超时按上游配置，未列出的上游使用 default
+UPSTREAM_CONNECT_TIMEOUT = _env_float('UPSTREAM_CONNECT_TIMEOUT', 5.0)
+UPSTREAM_FIRST_BYTE_TIMEOUTS = _env_float_map('UPSTREAM_FIRST_BYTE_TIMEOUTS',
+                                              {'llm': 30.0, 'attendance': 60.0, 'knowledge': 60.0, 'default': 60.0})
+UPSTREAM_IDLE_TIMEOUTS = _env_float_map('UPSTREAM_IDLE_TIMEOUTS',
+                                        {'llm': 30.0, 'attendance': 60.0, 'knowledge': 60.0, 'default': 60.0})
+# 收到第一帧前失败（连接错误 / 超时 / 5xx）的重试：最多次数与退避（秒）
+UPSTREAM_MAX_RETRIES = _env_int('UPSTREAM_MAX_RETRIES', 1)
+UPSTREAM_RETRY_BACKOFF = _env_float('UPSTREAM_RETRY_BACKOFF', 0.05)
+# 重试预算：窗口（秒）内重试数不超过 请求数 * RATIO + 每秒保底数 * 窗口
+RETRY_BUDGET_RATIO = _env_float('RETRY_BUDGET_RATIO', 0.1)
+RETRY_BUDGET_MIN_PER_SECOND = _env_float('RETRY_BUDGET_MIN_PER_SECOND', 1.0)
+RETRY_BUDGET_WINDOW = _env_int('RETRY_BUDGET_WINDOW', 10)
+# 熔断：连续失败次数阈值与打开后多久放行探测请求（秒）
+BREAKER_FAILURE_THRESHOLD = _env_int('BREAKER_FAILURE_THRESHOLD', 5)
+BREAKER_RESET_TIMEOUT = _env_float('BREAKER_RESET_TIMEOUT', 30.0)
+# 知识库熔断时改走开放领域对话（需有 chat 权限），否则直接返回 503
+BREAKER_KNOWLEDGE_FALLBACK_CHAT = _env_bool('BREAKER_KNOWLEDGE_FALLBACK_CHAT', True)
+# 意图识别对冲请求：超过近期延迟分位数仍未返回时再发一次（默认关闭）
+INTENT_HEDGE = _env_bool('INTENT_HEDGE', False)
+INTENT_HEDGE_QUANTILE = _env_float('INTENT_HEDGE_QUANTILE', 0.95)
+INTENT_HEDGE_MIN_DELAY = _env_float('INTENT_HEDGE_MIN_DELAY', 0.05)
+
+# 意图识别缓存
+INTENT_CACHE_MAXSIZE = _env_int('INTENT_CACHE_MAXSIZE', 10000)
+INTENT_CACHE_TTL = _env_float('INTENT_CACHE_TTL', 24 * 3600.0)
+# 启动时用指令中心的问题预热意图缓存
+INTENT_CACHE_PREWARM = _env_bool('INTENT_CACHE_PREWARM', True)
+COMMAND_CENTER_URL = _env_str('COMMAND_CENTER_URL', 'http://127.0.0.1:8012/commandCenter')
+# 多 worker 共享存储（意图缓存、会话、知识库 / 考勤回答缓存），空字符串表示不启用，例如
+# redis://127.0.0.1:6379/0（多机）、sqlite:////tmp/gateway_shared.db（单机多 worker）、memory://（调试）
+SHARED_STORE_URL = _env_str('SHARED_STORE_URL', '')
+# 回答缓存检查其他 worker 失效操作的间隔（秒）
+SHARED_CACHE_SYNC_INTERVAL = _env_float('SHARED_CACHE_SYNC_INTERVAL', 1.0)
+
+# 意图识别快速通道：off 关闭，shadow 只记录与 LLM 的分歧，on 置信度达标时跳过 LLM
+FAST_INTENT_MODE = _env_str('FAST_INTENT_MODE', 'shadow')
+FAST_INTENT_THRESHOLD = _env_float('FAST_INTENT_THRESHOLD', 0.8)
+# 离线训练的 bigram 模型路径，可为空
+FAST_INTENT_MODEL_PATH = _env_str('FAST_INTENT_MODEL_PATH', '')
+
+# LLM 意图识别输出：prompt 为原有的自由文本 + 子串匹配；constrained 只输出单字母编号（max_tokens=1），
+# 可选 guided_choice 约束与 logprobs 置信度（需服务端支持，如 vLLM），置信度低于阈值时回退到 prompt 模式
+INTENT_CLASSIFY_MODE = _env_str('INTENT_CLASSIFY_MODE', 'prompt')
+INTENT_GUIDED_CHOICE = _env_bool('INTENT_GUIDED_CHOICE', True)
+INTENT_LOGPROBS = _env_bool('INTENT_LOGPROBS', True)
+INTENT_MIN_CONFIDENCE = _env_float('INTENT_MIN_CONFIDENCE', 0.0)
+
+# 意图识别微批：off 关闭；concurrent 一批共用一个并发名额、并发发出单问题请求；prompt 一批合并为一个多问题 prompt
+INTENT_BATCH_MODE = _env_str('INTENT_BATCH_MODE', 'off')
+# 每批最多的问题数与第一个问题最长的排队时间（秒）
+INTENT_BATCH_MAX_SIZE = _env_int('INTENT_BATCH_MAX_SIZE', 8)
+INTENT_BATCH_MAX_WAIT = _env_float('INTENT_BATCH_MAX_WAIT', 0.005)
+
+# 开放领域流式输出：增量合并的时间窗口（秒）与字符数上限
+CHAT_STREAM_FLUSH_INTERVAL = _env_float('CHAT_STREAM_FLUSH_INTERVAL', 0.05)
+CHAT_STREAM_FLUSH_CHARS = _env_int('CHAT_STREAM_FLUSH_CHARS', 32)
+
+# 投机执行：意图识别的同时按先验提前启动考勤 / 知识库调用（默认关闭）
+SPECULATIVE_DISPATCH = _env_bool('SPECULATIVE_DISPATCH', False)
+# 提交前最多缓冲的下游帧数，满了暂停读取上游
+SPECULATION_BUFFER_FRAMES = _env_int('SPECULATION_BUFFER_FRAMES', 256)
+
+# 会话状态（按 topic_id）：容量、过期时间（秒）、保留轮数、每轮保存的回答字符数
+SESSION_MAXSIZE = _env_int('SESSION_MAXSIZE', 10000)
+SESSION_TTL = _env_float('SESSION_TTL', 1800.0)
+SESSION_MAX_TURNS = _env_int('SESSION_MAX_TURNS', 4)
+SESSION_ANSWER_CHARS = _env_int('SESSION_ANSWER_CHARS', 200)
+# 不超过该长度且带追问提示（那… / …呢）的问题视为追问，沿用上一次意图
+FOLLOW_UP_MAX_CHARS = _env_int('FOLLOW_UP_MAX_CHARS', 16)
+
+# 知识库输出：为 True 时 JSON 载荷原样嵌入 data 字段（前端需按对象解析），默认与原格式一致按字符串转义
+KNOWLEDGE_JSON_PASSTHROUGH = _env_bool('KNOWLEDGE_JSON_PASSTHROUGH', False)
+
+# SSE 帧编码使用 orjson（需安装）：更快，但中文按 UTF-8 原样输出而不是 \uXXXX 转义，前端 JSON 解析结果不变
+SSE_FRAME_ORJSON = _env_bool('SSE_FRAME_ORJSON', False)
+
+# 上游 SSE 转发：上游与客户端之间的队列长度、单次写出的最大帧数、心跳间隔（秒）
+RELAY_QUEUE_SIZE = _env_int('RELAY_QUEUE_SIZE', 64)
+RELAY_BATCH_FRAMES = _env_int('RELAY_BATCH_FRAMES', 32)
+RELAY_HEARTBEAT_INTERVAL = _env_float('RELAY_HEARTBEAT_INTERVAL', 15.0)
+# 覆盖内置考勤 / 知识库上游配置（地址、请求字段等）的 JSON 文件，见 sse_relay.load_upstream_overrides；不能新增上游
+RELAY_BACKENDS_FILE = _env_str('RELAY_BACKENDS_FILE', '')
+
+# 准入控制：每个上游的并发上限（<= 0 不限制），未列出的上游使用 ADMISSION_DEFAULT_LIMIT
+# 上限为整个服务的总量，多 worker 时按 GATEWAY_WORKERS 平均分给每个 worker
+ADMISSION_LIMITS = _env_int_map('ADMISSION_LIMITS', {'llm': 64, 'attendance': 32, 'knowledge': 32})
+ADMISSION_DEFAULT_LIMIT = _env_int('ADMISSION_DEFAULT_LIMIT', 32)
+# 每个上游的等待队列长度与最长排队时间（秒），超出后返回 429 / 503
+ADMISSION_QUEUE_SIZE = _env_int('ADMISSION_QUEUE_SIZE', 128)
+ADMISSION_QUEUE_TIMEOUT = _env_float('ADMISSION_QUEUE_TIMEOUT', 5.0)
+ADMISSION_RETRY_AFTER = _env_float('ADMISSION_RETRY_AFTER', 2.0)
+# 排队优先级，数值越小越优先，未列出的角色排在最后
+ADMISSION_ROLE_PRIORITY = _env_int_map('ADMISSION_ROLE_PRIORITY',
+                                       {'Boss': 0, 'HR': 0, 'Assistant': 0, 'Manager': 1, 'Employee': 2})
+
+# 相同请求合并：并发的相同知识库问题共享一次上游调用（考勤不合并）
+SINGLEFLIGHT_KNOWLEDGE = _env_bool('SINGLEFLIGHT_KNOWLEDGE', True)
+# 知识库回答与提问者角色无关时设为 True，不同角色的相同问题也合并
+KNOWLEDGE_ROLE_INDEPENDENT = _env_bool('KNOWLEDGE_ROLE_INDEPENDENT', False)
+# 每次合并调用最多缓冲多少帧用于回放给后加入的请求，超过后新请求单独调用
+SINGLEFLIGHT_REPLAY_FRAMES = _env_int('SINGLEFLIGHT_REPLAY_FRAMES', 1024)
+
+# 知识库回答缓存：缓存完整的流式回答（压缩保存），知识库重建索引后调用 POST /cache/knowledge/invalidate
+KB_CACHE_ENABLED = _env_bool('KB_CACHE_ENABLED', True)
+KB_CACHE_TTL = _env_float('KB_CACHE_TTL', 3600.0)
+# 压缩后的总字节数上限与单个回答压缩前的字节数上限
+KB_CACHE_MAX_BYTES = _env_int('KB_CACHE_MAX_BYTES', 64 * 1024 * 1024)
+KB_CACHE_MAX_ENTRY_BYTES = _env_int('KB_CACHE_MAX_ENTRY_BYTES', 1024 * 1024)
+# 命中时每个字节块之间的回放间隔（秒），0 表示一次写完
+KB_CACHE_REPLAY_INTERVAL = _env_float('KB_CACHE_REPLAY_INTERVAL', 0.0)
+
+# 考勤查询结果缓存：按问题、user_no / user_role 与解析出的日期范围缓存；补卡后调用 POST /cache/attendance/invalidate
+ATTENDANCE_CACHE_ENABLED = _env_bool('ATTENDANCE_CACHE_ENABLED', True)
+# 已结束周期（昨天、上周、上个月…）与包含今天的周期的 TTL（秒），包含今天的 TTL <= 0 时不缓存
+ATTENDANCE_CACHE_CLOSED_TTL = _env_float('ATTENDANCE_CACHE_CLOSED_TTL', 86400.0)
+ATTENDANCE_CACHE_OPEN_TTL = _env_float('ATTENDANCE_CACHE_OPEN_TTL', 60.0)
+ATTENDANCE_CACHE_MAX_BYTES = _env_int('ATTENDANCE_CACHE_MAX_BYTES', 32 * 1024 * 1024)
+ATTENDANCE_CACHE_MAX_ENTRY_BYTES = _env_int('ATTENDANCE_CACHE_MAX_ENTRY_BYTES', 1024 * 1024)
+
+# 日志：JSON 行输出到 stdout，INFO 日志按比例采样（1.0 全部保留），队列满时丢弃
+LOG_LEVEL = _env_str('LOG_LEVEL', 'INFO')
+LOG_SAMPLE_RATE = _env_float('LOG_SAMPLE_RATE', 1.0)
+LOG_QUEUE_SIZE = _env_int('LOG_QUEUE_SIZE', 10000)
+
+# 请求耗时追踪：/getaway_api 响应头 X-Request-ID 返回请求 ID，GET /debug/traces 查看本 worker 最近最慢的请求与各阶段耗时
+TRACE_ENABLED = _env_bool('TRACE_ENABLED', True)
+# 环形缓冲区保留的请求数与每个请求最多记录的 span 数
+TRACE_BUFFER_SIZE = _env_int('TRACE_BUFFER_SIZE', 1000)
+TRACE_MAX_SPANS = _env_int('TRACE_MAX_SPANS', 64)
+# 采样分析（默认关闭）：每 TRACE_PROFILE_INTERVAL 秒抓取一次事件循环线程的调用栈，
+# 只保留耗时超过 TRACE_PROFILE_THRESHOLD 秒的请求的调用栈，每个请求最多 TRACE_PROFILE_MAX_SAMPLES 个采样
+TRACE_PROFILE = _env_bool('TRACE_PROFILE', False)
+TRACE_PROFILE_THRESHOLD = _env_float('TRACE_PROFILE_THRESHOLD', 1.0)
+TRACE_PROFILE_INTERVAL = _env_float('TRACE_PROFILE_INTERVAL', 0.005)
+TRACE_PROFILE_MAX_SAMPLES = _env_int('TRACE_PROFILE_MAX_SAMPLES', 2000)
+
+# 问题使用热度（供指令中心推荐）：衰减半衰期（秒）与最多记录的问题数
+PROMPT_USAGE_HALF_LIFE = _env_float('PROMPT_USAGE_HALF_LIFE', 7 * 24 * 3600.0)
+PROMPT_USAGE_MAXSIZE = _env_int('PROMPT_USAGE_MAXSIZE', 10000)
+# /usage/prompts 单次最多返回的指令数
+PROMPT_USAGE_MAX_LIMIT = _env_int('PROMPT_USAGE_MAX_LIMIT', 500)
+# 定期预热最热门问题的意图缓存：间隔（秒，<= 0 关闭）与问题数
+PROMPT_PREWARM_INTERVAL = _env_float('PROMPT_PREWARM_INTERVAL', 600.0)
+PROMPT_PREWARM_TOP = _env_int('PROMPT_PREWARM_TOP', 100)
+# 同时预热回答缓存的热门知识库问题数（按问题与角色统计，0 关闭）
+KB_CACHE_PREWARM_TOP = _env_int('KB_CACHE_PREWARM_TOP', 20)
+
+# 管理接口（缓存失效、使用热度）的令牌，通过请求头 X-Admin-Token 传入；为空时只允许本机访问
+ADMIN_TOKEN = _env_str('ADMIN_TOKEN', '')
+
+# 权限配置文件（JSON，{路由: [角色, ...]}），为空时使用网关内置的 auth_role_allown_map
+AUTH_POLICY_FILE = _env_str('AUTH_POLICY_FILE', '')
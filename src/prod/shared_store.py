@@ -0,0 +1,170 @@
+'''
+多 worker 共享的键值存储，用于缓存、会话等跨进程状态
+SHARED_STORE_URL 为空时不启用：
+- redis://（rediss:// / unix://）：redis，多机共享（需安装 redis 包）
+- sqlite:///relative.db 或 sqlite:////absolute/path.db：同一台机器上的多个 worker 共享，只依赖标准库
+- memory://：进程内存储，单 worker 调试用，行为与共享存储一致
+'''
+import asyncio
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Protocol
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # redis 为可选依赖
+    aioredis = None
+
+
+class SharedStore(Protocol):
+    async def get(self, key: str) -> bytes | None: ...
+
+    async def set(self, key: str, value: bytes, ttl: float) -> None: ...
+
+    async def delete(self, key: str) -> None: ...
+
+    async def incr(self, key: str) -> int: ...
+
+    async def close(self) -> None: ...
+
+
+class RedisStore:
+    def __init__(self, url: str) -> None:
+        if aioredis is None:
+            raise RuntimeError('SHARED_STORE_URL 指向 redis，但未安装 redis 包')
+        self.client = aioredis.from_url(url)
+
+    async def get(self, key: str) -> bytes | None:
+        return await self.client.get(key)
+
+    async def set(self, key: str, value: bytes, ttl: float) -> None:
+        await self.client.set(key, value, px=int(ttl * 1000))
+
+    async def delete(self, key: str) -> None:
+        await self.client.delete(key)
+
+    async def incr(self, key: str) -> int:
+        return await self.client.incr(key)
+
+    async def close(self) -> None:
+        await self.client.aclose()
+
+
+class MemoryStore:
+    def __init__(self, timer: Callable[[], float] = time.time) -> None:
+        self.timer = timer
+        # key -> (过期时间, value)，过期时间为 None 表示不过期
+        self._data: dict[str, tuple[float | None, bytes]] = {}
+
+    async def get(self, key: str) -> bytes | None:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        expires_at, value = item
+        if expires_at is not None and expires_at <= self.timer():
+            del self._data[key]
+            return None
+        return value
+
+    async def set(self, key: str, value: bytes, ttl: float) -> None:
+        self._data[key] = (self.timer() + ttl, value)
+
+    async def delete(self, key: str) -> None:
+        self._data.pop(key, None)
+
+    async def incr(self, key: str) -> int:
+        value = int(await self.get(key) or 0) + 1
+        self._data[key] = (None, str(value).encode())
+        return value
+
+    async def close(self) -> None:
+        self._data.clear()
+
+
+class SqliteStore:
+    '''
+    WAL 模式的 SQLite 文件，多个 worker 进程可以同时读写；读写在单独的线程中执行，不阻塞事件循环
+    过期条目在读取时忽略，写入时按一定间隔顺带清理
+    '''
+
+    CLEANUP_INTERVAL = 60.0
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='shared-sqlite')
+        self._conn: sqlite3.Connection | None = None
+        self._cleaned_at = 0.0
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value BLOB, expires_at REAL)')
+            self._conn = conn
+        return self._conn
+
+    async def _run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    def _get(self, key: str) -> bytes | None:
+        row = self._connection().execute('SELECT value, expires_at FROM kv WHERE key = ?', (key,)).fetchone()
+        if row is None or (row[1] is not None and row[1] <= time.time()):
+            return None
+        return row[0]
+
+    def _set(self, key: str, value: bytes, ttl: float) -> None:
+        now = time.time()
+        conn = self._connection()
+        conn.execute('INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)', (key, value, now + ttl))
+        if now - self._cleaned_at >= self.CLEANUP_INTERVAL:
+            self._cleaned_at = now
+            conn.execute('DELETE FROM kv WHERE expires_at IS NOT NULL AND expires_at <= ?', (now,))
+
+    def _delete(self, key: str) -> None:
+        self._connection().execute('DELETE FROM kv WHERE key = ?', (key,))
+
+    def _incr(self, key: str) -> int:
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT value FROM kv WHERE key = ?', (key,)).fetchone()
+            value = int(row[0]) + 1 if row is not None else 1
+            conn.execute('INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, NULL)',
+                         (key, str(value).encode()))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return value
+
+    async def get(self, key: str) -> bytes | None:
+        return await self._run(self._get, key)
+
+    async def set(self, key: str, value: bytes, ttl: float) -> None:
+        await self._run(self._set, key, value, ttl)
+
+    async def delete(self, key: str) -> None:
+        await self._run(self._delete, key)
+
+    async def incr(self, key: str) -> int:
+        return await self._run(self._incr, key)
+
+    async def close(self) -> None:
+        if self._conn is not None:
+            await self._run(self._conn.close)
+            self._conn = None
+        self._executor.shutdown(wait=False)
+
+
+def create_shared_store(url: str) -> SharedStore | None:
+    if not url:
+        return None
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisStore(url)
+    if url.startswith('sqlite:///'):
+        return SqliteStore(url[len('sqlite:///'):])
+    if url == 'memory://':
+        return MemoryStore()
+    raise ValueError(f'不支持的 SHARED_STORE_URL: {url}')
@@ -0,0 +1,206 @@
+'''
+相同请求合并（single-flight）
+
+- SingleFlight：相同 key 的并发调用共享一次协程执行的结果（意图识别）
+- StreamBroadcast：相同 key 的并发流式请求共享一次上游调用，输出分发给所有订阅者，
+  后加入的订阅者先回放已缓冲的帧（知识库）；缓冲达到 replay_frames 后不再接受新的订阅者，
+  之后只保留最慢的订阅者还没读到的帧
+
+只用于与用户身份无关的请求；考勤数据按用户权限返回，不能合并
+'''
+import asyncio
+from collections import deque
+from typing import Any, AsyncIterator, Awaitable, Callable, Hashable
+
+from async_utils import cancel_and_wait
+
+
+class SingleFlight:
+    def __init__(self) -> None:
+        self._calls: dict[Hashable, asyncio.Future] = {}
+        self.calls = 0
+        self.shared = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        '''
+        key 没有进行中的调用时执行 fn()，否则等待进行中调用的结果
+        单个调用方被取消不影响其他调用方
+        '''
+        self.calls += 1
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            self.shared += 1
+        return await asyncio.shield(task)
+
+    def _forget(self, key: Hashable, task: asyncio.Future) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            # 所有调用方都已取消时避免 "exception was never retrieved"
+            task.exception()
+
+    def stats(self) -> dict[str, Any]:
+        return {"calls": self.calls,
+                "shared": self.shared,
+                "in_flight": len(self._calls),
+                "shared_ratio": round(self.shared / self.calls, 4) if self.calls else 0.0}
+
+
+class _Flight:
+    def __init__(self, broadcast: 'StreamBroadcast', key: Hashable, stream: AsyncIterator[Any],
+                 on_finish: Callable[[], None] | None) -> None:
+        self.broadcast = broadcast
+        self.key = key
+        # frames[0] 对应第 offset 帧；接受新订阅者期间保留全部帧用于回放
+        self.frames: deque[Any] = deque()
+        self.offset = 0
+        self.accepting = True
+        self._subscriptions: set['Subscription'] = set()
+        self.finished = False
+        self.error: Exception | None = None
+        self.subscribers = 0
+        # 每追加一帧替换一次，订阅者等待旧事件即可收到通知
+        self.changed = asyncio.Event()
+        self._on_finish = on_finish
+        self._task = asyncio.create_task(self._run(stream))
+
+    def _notify(self) -> None:
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+    @property
+    def received(self) -> int:
+        return self.offset + len(self.frames)
+
+    def detach(self) -> None:
+        '''
+        不再接受新的订阅者，之后的帧读完即可丢弃
+        '''
+        self.accepting = False
+        self.broadcast._detach(self)
+        self.trim()
+
+    def trim(self) -> None:
+        '''
+        丢弃所有订阅者都已读过的帧
+        '''
+        if self.accepting:
+            return
+        needed = min((subscription._index for subscription in self._subscriptions), default=self.received)
+        frames = self.frames
+        while self.offset < needed:
+            frames.popleft()
+            self.offset += 1
+
+    async def _run(self, stream: AsyncIterator[Any]) -> None:
+        try:
+            async for item in stream:
+                self.frames.append(item)
+                if self.accepting and self.received >= self.broadcast.replay_frames:
+                    # 回放缓冲达到上限，不再接受新的订阅者
+                    self.detach()
+                self._notify()
+        except Exception as e:
+            self.error = e
+        finally:
+            self.finished = True
+            self.detach()
+            self._notify()
+            await stream.aclose()
+            if self._on_finish is not None:
+                self._on_finish()
+
+    async def unsubscribe(self, subscription: 'Subscription') -> None:
+        self.subscribers -= 1
+        self._subscriptions.discard(subscription)
+        self.trim()
+        if self.subscribers == 0 and not self.finished:
+            # 所有订阅者都已断开，取消上游调用
+            self.detach()
+            self.broadcast.cancelled += 1
+            await cancel_and_wait(self._task)
+
+
+class Subscription:
+    '''
+    单个订阅者的迭代器，aclose 可在迭代开始前调用
+    '''
+
+    def __init__(self, flight: _Flight) -> None:
+        self._flight = flight
+        # 下一帧的序号（从第一帧起算）
+        self._index = flight.offset
+        self._closed = False
+        flight.subscribers += 1
+        flight._subscriptions.add(self)
+
+    def __aiter__(self) -> 'Subscription':
+        return self
+
+    async def __anext__(self) -> Any:
+        flight = self._flight
+        while self._index >= flight.received:
+            if flight.finished or self._closed:
+                await self.aclose()
+                if flight.error is not None:
+                    raise flight.error
+                raise StopAsyncIteration
+            await flight.changed.wait()
+        item = flight.frames[self._index - flight.offset]
+        self._index += 1
+        if self._index - 1 == flight.offset:
+            # 读的是最旧的一帧，可能可以丢弃
+            flight.trim()
+        return item
+
+    async def aclose(self) -> None:
+        if not self._closed:
+            self._closed = True
+            await self._flight.unsubscribe(self)
+
+
+class StreamBroadcast:
+    def __init__(self, replay_frames: int = 1024) -> None:
+        self.replay_frames = replay_frames
+        self._flights: dict[Hashable, _Flight] = {}
+        self.flights = 0
+        self.joined = 0
+        self.late_joins = 0
+        self.cancelled = 0
+
+    def subscribe(self, key: Hashable) -> Subscription | None:
+        '''
+        加入进行中的同 key 调用，没有时返回 None
+        '''
+        flight = self._flights.get(key)
+        if flight is None:
+            return None
+        self.joined += 1
+        if flight.received:
+            self.late_joins += 1
+        return Subscription(flight)
+
+    def start(self, key: Hashable, stream: AsyncIterator[Any],
+              on_finish: Callable[[], None] | None = None) -> Subscription:
+        '''
+        发起新的上游调用并返回第一个订阅者；on_finish 在上游结束或被取消后调用
+        '''
+        flight = _Flight(self, key, stream, on_finish)
+        self._flights[key] = flight
+        self.flights += 1
+        return Subscription(flight)
+
+    def _detach(self, flight: _Flight) -> None:
+        if self._flights.get(flight.key) is flight:
+            del self._flights[flight.key]
+
+    def stats(self) -> dict[str, Any]:
+        return {"flights": self.flights,
+                "joined": self.joined,
+                "late_joins": self.late_joins,
+                "cancelled": self.cancelled,
+                "in_flight": len(self._flights)}
@@ -0,0 +1,91 @@
+'''
+投机执行：意图识别进行中，按先验（关键词提示 / 同一 topic 上次意图）提前启动最可能的下游调用
+下游输出先缓冲，意图确定后提交（继续转发）或取消（关闭上游连接）
+'''
+import asyncio
+import time
+from typing import Any, AsyncIterator
+
+from admission import Permit
+from async_utils import cancel_and_wait
+
+_END = object()
+
+
+class Speculation:
+    def __init__(self, intent: str, stream: AsyncIterator[Any], stats: 'SpeculationStats', buffer_size: int,
+                 permit: Permit | None = None) -> None:
+        self.intent = intent
+        # 投机调用占用的上游并发名额，取消或转发结束时归还
+        self.permit = permit
+        self.stats = stats
+        self.started = time.perf_counter()
+        self._stream = stream
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=buffer_size)
+        self._task = asyncio.create_task(self._pump())
+        self._closed = False
+        stats.started += 1
+
+    async def _pump(self) -> None:
+        # 缓冲区满时阻塞上游读取，避免提交前无限占用内存
+        try:
+            async for item in self._stream:
+                await self._queue.put(item)
+        except Exception as e:
+            await self._queue.put(e)
+            return
+        await self._queue.put(_END)
+
+    def commit(self) -> AsyncIterator[Any]:
+        '''
+        投机命中：先输出已缓冲的数据，再继续转发上游
+        '''
+        self.stats.hits += 1
+        self.stats.time_saved += time.perf_counter() - self.started
+        return self._drain()
+
+    async def _drain(self) -> AsyncIterator[Any]:
+        try:
+            while True:
+                item = await self._queue.get()
+                if item is _END:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            await self.cancel(count=False)
+
+    async def cancel(self, count: bool = True) -> None:
+        '''
+        投机失败：取消读取任务并关闭下游生成器，上游连接随之关闭
+        提交后转发结束（_drain）与响应关闭（on_close）都会调用，只执行第一次
+        '''
+        if self._closed:
+            return
+        self._closed = True
+        if count:
+            self.stats.misses += 1
+        await cancel_and_wait(self._task)
+        await self._stream.aclose()
+        if self.permit is not None:
+            self.permit.release()
+
+
+class SpeculationStats:
+    __slots__ = ('started', 'hits', 'misses', 'time_saved')
+
+    def __init__(self) -> None:
+        self.started = 0
+        self.hits = 0
+        self.misses = 0
+        self.time_saved = 0.0
+
+    def stats(self) -> dict[str, Any]:
+        decided = self.hits + self.misses
+        return {"started": self.started,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / decided, 4) if decided else None,
+                "time_saved_seconds": round(self.time_saved, 3),
+                "avg_time_saved_seconds": round(self.time_saved / self.hits, 4) if self.hits else None}
@@ -0,0 +1,70 @@
+'''
+SSE 帧编码：直接产出 EventSourceResponse 原样写出的 bytes
+
+原路径每帧先 json.dumps 一个 dict，再由 sse_starlette 的 ServerSentEvent 按行切分、拼接、编码，
+中间产生多份临时字符串。这里按帧类型预先构造好固定的前缀 / 后缀 bytes，只转义变化的 data，
+输出与 ServerSentEvent(json.dumps({"data": data, "type": frame_type})).encode() 逐字节一致
+
+可选 orjson（SSE_FRAME_ORJSON）：转义更快，但非 ASCII 字符按 UTF-8 原样输出而不是 \\uXXXX，
+JSON 解析结果相同、字节不同，默认关闭
+'''
+from json.encoder import encode_basestring_ascii
+
+from sse_starlette.sse import ServerSentEvent
+
+
+def escape_ascii(data: str) -> bytes:
+    '''
+    与 json.dumps(data) 一致的 JSON 字符串（带引号）
+    '''
+    return encode_basestring_ascii(data).encode('ascii')
+
+
+def orjson_dumps():
+    '''
+    可选依赖，只在开启 SSE_FRAME_ORJSON 时导入；未安装时返回 None
+    '''
+    try:
+        import orjson
+    except ImportError:
+        return None
+    return orjson.dumps
+
+
+def encode_event(frame: str, sep: str = '\r\n') -> bytes:
+    '''
+    与 ServerSentEvent(frame, sep=sep).encode() 一致；不含换行时不经过 ServerSentEvent
+    '''
+    if '\n' in frame or '\r' in frame:
+        return ServerSentEvent(frame, sep=sep).encode()
+    return b''.join((b'data: ', frame.encode('utf-8'), sep.encode() * 2))
+
+
+class TypedFrameEncoder:
+    '''
+    {"data": ..., "type": frame_type} 帧；知识库帧还可以带与 data 相同的 docs 字段
+    '''
+
+    def __init__(self, frame_type: int, sep: str = '\r\n', use_orjson: bool = False) -> None:
+        self.frame_type = frame_type
+        self.sep = sep
+        self.head = b'data: {"data": '
+        self.docs = b', "docs": '
+        self.tail = f', "type": {frame_type}}}'.encode() + sep.encode() * 2
+        self.escape = (orjson_dumps() if use_orjson else None) or escape_ascii
+        self.done = self.encode('[DONE]')
+
+    def encode(self, data: str) -> bytes:
+        return b''.join((self.head, self.escape(data), self.tail))
+
+    def pack(self, payload: bytes, docs: bool = False) -> bytes:
+        '''
+        payload 为已经是 JSON 的 data 字段；含换行时（原样嵌入的多行 JSON）按 ServerSentEvent 切分成多行 data
+        '''
+        if b'\n' in payload or b'\r' in payload:
+            body = payload.decode('utf-8')
+            frame = '{"data": ' + body + (', "docs": ' + body if docs else '') + f', "type": {self.frame_type}}}'
+            return ServerSentEvent(frame, sep=self.sep).encode()
+        if docs:
+            return b''.join((self.head, payload, self.docs, payload, self.tail))
+        return b''.join((self.head, payload, self.tail))
@@ -0,0 +1,112 @@
+'''
+增量 SSE 解析器：直接消费上游的字节块，按空行切分事件，支持多行 data、注释行与 \\r\\n / \\n / \\r 换行
+'''
+from typing import AsyncIterator, Iterable
+
+
+class SSEEvent:
+    __slots__ = ('event', 'data', 'id')
+
+    def __init__(self, event: str | None, data: str, id: str | None) -> None:
+        self.event = event
+        self.data = data
+        self.id = id
+
+    def __repr__(self) -> str:
+        return f'SSEEvent(event={self.event!r}, data={self.data!r}, id={self.id!r})'
+
+
+class SSEParser:
+    def __init__(self, raw_prefixes: tuple[str, ...] = ()) -> None:
+        '''
+        raw_prefixes: data 行冒号后不带空格、直接以这些前缀开头时，保留 "data:" 前缀（兼容依赖该写法的旧输出）
+        '''
+        self.raw_prefixes = tuple(raw_prefixes)
+        self._buffer = bytearray()
+        self._pending_cr = False
+        self._event: str | None = None
+        self._data: list[str] = []
+        self._id: str | None = None
+
+    def feed(self, chunk: bytes) -> list[SSEEvent]:
+        '''
+        输入任意切分的字节块，返回其中已完整的事件
+        换行符不会出现在 UTF-8 多字节字符内部，按行切分后再解码不会截断字符
+        '''
+        buffer = self._buffer
+        buffer += chunk
+        events: list[SSEEvent] = []
+        start = 0
+        length = len(buffer)
+        if self._pending_cr and length:
+            # 上一块以 \r 结尾，本块开头的 \n 属于同一个换行
+            if buffer[0] == 0x0A:
+                start = 1
+            self._pending_cr = False
+        while start < length:
+            lf = buffer.find(b'\n', start)
+            cr = buffer.find(b'\r', start, lf if lf != -1 else length)
+            if cr != -1:
+                end, next_start = cr, cr + 1
+                if next_start < length and buffer[next_start] == 0x0A:
+                    next_start += 1
+                elif next_start == length:
+                    self._pending_cr = True
+            elif lf != -1:
+                end, next_start = lf, lf + 1
+            else:
+                break
+            self._line(buffer[start:end], events)
+            start = next_start
+        del buffer[:start]
+        return events
+
+    def flush(self) -> list[SSEEvent]:
+        '''
+        上游结束时处理没有以空行结尾的最后一个事件
+        '''
+        events: list[SSEEvent] = []
+        if self._buffer:
+            self._line(self._buffer, events)
+            self._buffer.clear()
+        self._line(b'', events)
+        return events
+
+    def _line(self, raw: bytes | bytearray, events: list[SSEEvent]) -> None:
+        if not raw:
+            if self._data:
+                events.append(SSEEvent(self._event, '\n'.join(self._data), self._id))
+            self._event, self._data = None, []
+            return
+        if raw[0] == 0x3A:  # ':' 注释行（心跳）
+            return
+        line = raw.decode('utf-8', errors='replace')
+        field, sep, value = line.partition(':')
+        if sep and value.startswith(' '):
+            value = value[1:]
+        elif field == 'data' and self.raw_prefixes and value.startswith(self.raw_prefixes):
+            value = line
+        if field == 'data':
+            self._data.append(value)
+        elif field == 'event':
+            self._event = value
+        elif field == 'id':
+            self._id = value
+        elif not sep:
+            # 不符合 SSE 规范的裸数据行，按 data 处理
+            self._data.append(line)
+
+
+async def parse_stream(chunks: AsyncIterator[bytes] | Iterable[bytes],
+                       raw_prefixes: tuple[str, ...] = ()) -> AsyncIterator[SSEEvent]:
+    parser = SSEParser(raw_prefixes)
+    if hasattr(chunks, '__aiter__'):
+        async for chunk in chunks:
+            for event in parser.feed(chunk):
+                yield event
+    else:
+        for chunk in chunks:
+            for event in parser.feed(chunk):
+                yield event
+    for event in parser.flush():
+        yield event
@@ -0,0 +1,266 @@
+'''
+通用 SSE 转发：上游解码器 -> 有界队列 -> 输出编码 -> 批量写给客户端
+
+- 上游读取与客户端写出在两个任务中，通过有界队列衔接；客户端慢时队列写满，上游读取暂停（TCP 背压）
+- 客户端一侧把队列中已就绪的多帧合并成一次写出
+- 上游长时间无输出时发送 SSE 注释行作为心跳
+- 帧在读取任务中直接编码为 SSE bytes（sse_frames.py），客户端一侧只做拼接
+- 新的上游只需增加一份 UpstreamSpec 配置
+- 配置 UpstreamPolicy 时，首字节 / 空闲超时、首帧前重试与熔断由 policy 控制
+- 请求有 Trace 时记录 relay.connect（每次尝试）、relay.stream 与累计的 relay.encode 耗时
+'''
+import asyncio
+import copy
+import json
+import logging
+import time
+from contextlib import aclosing
+from json.encoder import encode_basestring_ascii
+from typing import Any, AsyncIterator, Callable
+
+import aiohttp
+from sse_starlette.sse import ServerSentEvent
+
+import tracing
+from async_utils import cancel_and_wait
+from metrics import ERRORS
+from resilience import CircuitOpen, UpstreamPolicy, UpstreamStatusError
+from sse_frames import TypedFrameEncoder, encode_event
+from sse_parser import parse_stream
+
+logger = logging.getLogger('sse_relay')
+
+# 解码器产出的结束标记
+DONE = object()
+_END = object()
+
+
+async def decode_lines(content: aiohttp.StreamReader, done_prefixes: tuple[str, ...]) -> AsyncIterator[Any]:
+    '''
+    按行转发（考勤）：每行去除首尾空白后作为一帧，遇到结束行产出 DONE
+    '''
+    async for line in content:
+        line = line.decode('utf-8').strip()
+        if line == '[DONE]' or line.startswith(done_prefixes):
+            yield DONE
+            return
+        yield line
+
+
+async def decode_sse(content: aiohttp.StreamReader, done_prefixes: tuple[str, ...],
+                     raw_prefixes: tuple[str, ...] = ()) -> AsyncIterator[Any]:
+    '''
+    按 SSE 事件转发（知识库）：data 为 [DONE] 时产出 DONE；raw_prefixes 见 SSEParser
+    '''
+    async for event in parse_stream(content.iter_any(), raw_prefixes):
+        if event.data == '[DONE]' or event.data.startswith(done_prefixes):
+            yield DONE
+            return
+        yield event.data
+
+
+DECODERS: dict[str, Callable[..., AsyncIterator[Any]]] = {"lines": decode_lines, "sse": decode_sse}
+
+
+def encode_typed(data: str, frame_type: int) -> str:
+    '''
+    与 json.dumps({"data": data, "type": frame_type}) 输出一致
+    '''
+    return '{"data": ' + encode_basestring_ascii(data) + ', "type": ' + str(frame_type) + '}'
+
+
+class UpstreamSpec:
+    '''
+    上游配置
+    params: 上游请求字段 -> 网关请求字段（question / user_id / user_role / topic_id / user_no）
+    encode: 把解码后的 data 编码为输出帧，默认 {"data": ..., "type": frame_type}
+    encode_event: 直接编码为 SSE bytes（优先于 encode），参数为 data 与该上游的帧编码器
+    decoder_options: 传给解码器的额外参数
+    '''
+
+    def __init__(self, name: str, url: str, params: dict[str, str], decoder: str, frame_type: int,
+                 done_frame: str | None = None, done_prefixes: tuple[str, ...] = (),
+                 encode: Callable[[str], str] | None = None,
+                 encode_error: Callable[[Exception], str] | None = None,
+                 encode_event: Callable[[str, TypedFrameEncoder], bytes] | None = None,
+                 decoder_options: dict[str, Any] | None = None) -> None:
+        self.name = name
+        self.url = url
+        self.params = params
+        self.decoder = DECODERS[decoder]
+        self.decoder_options = decoder_options or {}
+        self.frame_type = frame_type
+        self.done_frame = done_frame if done_frame is not None else encode_typed('[DONE]', frame_type)
+        self.done_prefixes = tuple(done_prefixes)
+        self.encode = encode or (lambda data: encode_typed(data, frame_type))
+        # 默认格式的帧由 TypedFrameEncoder 按预先构造的前缀 / 后缀编码
+        self.typed = encode is None
+        self.encode_event = encode_event
+        # 默认以 type 4 帧返回上游错误
+        self.encode_error = encode_error or (lambda e: encode_typed(str(e), 4))
+
+    def build_params(self, **fields: str) -> dict[str, str]:
+        return {key: fields[source] for key, source in self.params.items()}
+
+    # 可以通过配置文件覆盖的字段；帧格式（frame_type、编码函数）是与客户端的约定，不能覆盖
+    OVERRIDABLE = ('url', 'params', 'decoder', 'done_frame', 'done_prefixes', 'decoder_options')
+
+    def with_overrides(self, config: dict[str, Any]) -> 'UpstreamSpec':
+        '''
+        返回覆盖了部分字段的副本，未出现的字段与编码函数沿用当前配置
+        '''
+        unknown = set(config) - {'name', *self.OVERRIDABLE}
+        if unknown:
+            raise ValueError(f'{self.name}: fields cannot be overridden: {sorted(unknown)}')
+        spec = copy.copy(self)
+        for field in ('url', 'params', 'done_frame'):
+            if field in config:
+                setattr(spec, field, config[field])
+        if 'decoder' in config:
+            spec.decoder = DECODERS[config['decoder']]
+        if 'done_prefixes' in config:
+            spec.done_prefixes = tuple(config['done_prefixes'])
+        if 'decoder_options' in config:
+            # JSON 中的列表转为元组（例如 raw_prefixes 用于 str.startswith）
+            spec.decoder_options = {key: tuple(value) if isinstance(value, list) else value
+                                    for key, value in config['decoder_options'].items()}
+        return spec
+
+
+class SSERelay:
+    def __init__(self, spec: UpstreamSpec, queue_size: int = 64, batch_frames: int = 32,
+                 heartbeat_interval: float = 15.0, sep: str = '\r\n', policy: UpstreamPolicy | None = None,
+                 use_orjson: bool = False) -> None:
+        self.spec = spec
+        self.policy = policy
+        self.queue_size = queue_size
+        self.batch_frames = batch_frames
+        self.heartbeat_interval = heartbeat_interval
+        self.sep = sep
+        self.heartbeat = ServerSentEvent(comment='ping', sep=sep).encode()
+        self.frames = TypedFrameEncoder(spec.frame_type, sep=sep, use_orjson=use_orjson)
+        # 正常结束时最后写出的结束帧
+        self.done_event = self._encode_event(spec.done_frame)
+
+    def _encode_event(self, frame: str) -> bytes:
+        return encode_event(frame, self.sep)
+
+    def encode_data(self, data: str) -> bytes:
+        spec = self.spec
+        if spec.encode_event is not None:
+            return spec.encode_event(data, self.frames)
+        if spec.typed:
+            return self.frames.encode(data)
+        return self._encode_event(spec.encode(data))
+
+    async def _decode(self, session: aiohttp.ClientSession, params: dict[str, str]) -> AsyncIterator[Any]:
+        spec = self.spec
+        started = time.perf_counter()
+        async with session.post(spec.url, json=params, headers={'Content-Type': 'application/json'}) as response:
+            tracing.record('relay.connect', started, upstream=spec.name, status=response.status)
+            logger.info("upstream response", extra={"fields": {"upstream": spec.name, "status": response.status}})
+            if response.status >= 500:
+                raise UpstreamStatusError(spec.name, response.status)
+            try:
+                async for data in spec.decoder(response.content, spec.done_prefixes, **spec.decoder_options):
+                    yield data
+                    if data is DONE:
+                        break
+            except (asyncio.CancelledError, GeneratorExit, TimeoutError):
+                # 被取消 / 超时时直接关闭连接，未读完的响应体不能归还连接池
+                response.close()
+                raise
+
+    async def _produce(self, session: aiohttp.ClientSession, params: dict[str, str], queue: asyncio.Queue) -> None:
+        spec = self.spec
+        if self.policy is not None:
+            frames = self.policy.stream(lambda: self._decode(session, params))
+        else:
+            frames = self._decode(session, params)
+        traced = tracing.current() is not None
+        started = time.perf_counter()
+        count = 0
+        encode_seconds = 0.0
+        try:
+            async with aclosing(frames):
+                # 解码器在 DONE 之后自行结束，连接可以正常归还连接池
+                async for data in frames:
+                    if data is DONE:
+                        await queue.put(self.done_event)
+                        continue
+                    if not traced:
+                        await queue.put(self.encode_data(data))
+                        continue
+                    if not count:
+                        tracing.event('relay.first_frame')
+                    count += 1
+                    encode_started = time.perf_counter()
+                    event = self.encode_data(data)
+                    encode_seconds += time.perf_counter() - encode_started
+                    await queue.put(event)
+        except (aiohttp.ClientError, TimeoutError, UpstreamStatusError, CircuitOpen) as e:
+            ERRORS.inc(spec.name, type(e).__name__)
+            logger.warning("upstream error", extra={"fields": {"upstream": spec.name, "error": repr(e)}})
+            await queue.put(self._encode_event(spec.encode_error(e)))
+        except Exception as e:
+            # 交给客户端一侧抛出
+            await queue.put(e)
+            return
+        finally:
+            if traced:
+                tracing.record('relay.stream', started, upstream=spec.name, frames=count)
+                trace = tracing.current()
+                trace.add_span('relay.encode', started, started + encode_seconds, {"upstream": spec.name})
+        await queue.put(_END)
+
+    async def stream(self, session: aiohttp.ClientSession, **fields: str) -> AsyncIterator[bytes]:
+        '''
+        返回已编码的 SSE 字节，EventSourceResponse 对 bytes 不再二次封装
+        '''
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        producer = asyncio.create_task(self._produce(session, self.spec.build_params(**fields), queue))
+        try:
+            finished = False
+            while not finished:
+                try:
+                    item = await asyncio.wait_for(queue.get(), self.heartbeat_interval)
+                except asyncio.TimeoutError:
+                    yield self.heartbeat
+                    continue
+                # 合并队列中已就绪的帧，一次写出
+                batch = []
+                error = None
+                while True:
+                    if item is _END:
+                        finished = True
+                        break
+                    if isinstance(item, Exception):
+                        error = item
+                        break
+                    batch.append(item)
+                    if len(batch) >= self.batch_frames or queue.empty():
+                        break
+                    item = queue.get_nowait()
+                if batch:
+                    yield b''.join(batch)
+                # 先写出异常之前已收到的帧
+                if error is not None:
+                    raise error
+        finally:
+            await cancel_and_wait(producer)
+
+
+def load_upstream_overrides(path: str, specs: dict[str, UpstreamSpec]) -> dict[str, UpstreamSpec]:
+    '''
+    从 JSON 文件（列表，每项 {"name": 已有上游, 字段: 值}，字段见 UpstreamSpec.OVERRIDABLE）覆盖已有上游的配置，
+    例如切换地址或请求字段；路由由意图决定，只能覆盖已有上游，不能新增
+    '''
+    with open(path, encoding='utf-8') as f:
+        configs = json.load(f)
+    result = dict(specs)
+    for config in configs:
+        name = config.get('name')
+        if name not in result:
+            raise ValueError(f'unknown upstream {name!r}, expected one of {sorted(result)}')
+        result[name] = result[name].with_overrides(config)
+    return result
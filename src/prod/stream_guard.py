@@ -0,0 +1,103 @@
+'''
+客户端断开后的上游取消
+
+EventSourceResponse 收到 http.disconnect 后会取消写出任务，但如果此时生成器停在 yield 上，
+生成器本身不会被关闭，上游读取要等到垃圾回收才结束。这里在响应结束后显式关闭生成器，
+使取消沿 转发生成器 -> 上游读取任务 -> aiohttp 响应 / LLM 流 逐层传递，并统计放弃的流
+同时记录每个响应的 TTFT、总耗时、字节数与写出次数（metrics.py），并作为 stream span 记入请求的 Trace
+'''
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable
+
+from sse_starlette.sse import EventSourceResponse
+from starlette.background import BackgroundTask
+
+import tracing
+from metrics import ERRORS, RESPONSE_BYTES, RESPONSE_FRAMES, STREAM_SECONDS, TTFT_SECONDS
+
+
+class _UpstreamStreamStats:
+    __slots__ = ('completed', 'abandoned', 'reclaimed_seconds', 'avg_duration')
+
+    def __init__(self) -> None:
+        self.completed = 0
+        self.abandoned = 0
+        self.reclaimed_seconds = 0.0
+        # 完整流耗时的指数滑动平均，用于估算放弃时节省的上游时间
+        self.avg_duration: float | None = None
+
+
+class StreamGuard:
+    def __init__(self, ewma_alpha: float = 0.1) -> None:
+        self.ewma_alpha = ewma_alpha
+        self.upstreams: dict[str, _UpstreamStreamStats] = {}
+
+    def _stats(self, upstream: str) -> _UpstreamStreamStats:
+        stats = self.upstreams.get(upstream)
+        if stats is None:
+            stats = self.upstreams[upstream] = _UpstreamStreamStats()
+        return stats
+
+    async def track(self, upstream: str, stream: AsyncIterator[Any],
+                    request_started: float | None = None) -> AsyncIterator[Any]:
+        started = time.perf_counter()
+        if request_started is None:
+            request_started = started
+        completed = False
+        frames = size = 0
+        try:
+            async for item in stream:
+                if not frames:
+                    TTFT_SECONDS.observe(time.perf_counter() - request_started, upstream)
+                    tracing.event('first_frame')
+                frames += 1
+                size += len(item)
+                yield item
+            completed = True
+        except Exception as e:
+            ERRORS.inc(upstream, type(e).__name__)
+            raise
+        finally:
+            now = time.perf_counter()
+            elapsed = now - started
+            STREAM_SECONDS.observe(now - request_started, upstream)
+            RESPONSE_BYTES.observe(size, upstream)
+            RESPONSE_FRAMES.observe(frames, upstream)
+            tracing.record('stream', started, frames=frames, bytes=size, completed=completed)
+            stats = self._stats(upstream)
+            if completed:
+                stats.completed += 1
+                if stats.avg_duration is None:
+                    stats.avg_duration = elapsed
+                else:
+                    stats.avg_duration += self.ewma_alpha * (elapsed - stats.avg_duration)
+            else:
+                stats.abandoned += 1
+                if stats.avg_duration is not None:
+                    stats.reclaimed_seconds += max(0.0, stats.avg_duration - elapsed)
+                # 关闭下游生成器，取消其上游读取并关闭连接
+                await stream.aclose()
+
+    def response(self, upstream: str, stream: AsyncIterator[Any],
+                 on_close: Callable[[], Awaitable[None]] | None = None, started: float | None = None,
+                 **kwargs) -> EventSourceResponse:
+        '''
+        构造 EventSourceResponse，响应结束（包括客户端断开）后关闭生成器
+        on_close 用于释放生成器尚未启动时就已占用的资源（例如投机执行的读取任务）
+        started 为收到请求的时间（perf_counter），用于计算 TTFT
+        '''
+        tracked = self.track(upstream, stream, started)
+
+        async def close() -> None:
+            await tracked.aclose()
+            if on_close is not None:
+                await on_close()
+
+        return EventSourceResponse(tracked, background=BackgroundTask(close), **kwargs)
+
+    def stats(self) -> dict[str, Any]:
+        return {upstream: {"completed": stats.completed,
+                           "abandoned": stats.abandoned,
+                           "reclaimed_upstream_seconds": round(stats.reclaimed_seconds, 3),
+                           "avg_stream_seconds": round(stats.avg_duration, 4) if stats.avg_duration else None}
+                for upstream, stats in self.upstreams.items()}
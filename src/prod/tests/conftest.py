@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 网关模块按文件名直接导入（与在 src/prod 目录下运行时一致）
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
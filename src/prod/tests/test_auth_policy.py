@@ -0,0 +1,93 @@
+'''
+（角色, 意图）权限矩阵：经过 user_intent_recognize 校验每个组合返回 403 还是打开上游流
+
+运行（在 src/prod 目录下）：
+    python -m pytest -q tests
+'''
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+import intent_gataway_api as gateway
+from auth_policy import ROUTES, AuthPolicy, matrix
+from intents import INTENT_ATTENDANCE, INTENT_CHAT, INTENT_KNOWLEDGE
+
+INTENTS = (INTENT_ATTENDANCE, INTENT_KNOWLEDGE, INTENT_CHAT)
+# 配置中出现的角色与一个未配置的角色
+ROLES = sorted({role for roles in gateway.auth_role_allown_map.values() for role in roles}) + ["Intern"]
+
+
+def expected_allowed(rules: dict[str, list[str]], role: str, route: str) -> bool:
+    return route not in rules or role in rules[route]
+
+
+@pytest.fixture
+def classified(monkeypatch):
+    '''
+    意图识别固定返回 classified.intent，并记录是否被调用；关闭投机执行与知识库合并调用，避免请求真实上游
+    '''
+    class Classified:
+        intent = INTENT_CHAT
+        calls = 0
+
+    async def classify_question(question, user_role=None):
+        Classified.calls += 1
+        return Classified.intent
+
+    monkeypatch.setattr(gateway, "classify_question", classify_question)
+    monkeypatch.setattr(gateway.settings, "SPECULATIVE_DISPATCH", False)
+    monkeypatch.setattr(gateway.settings, "SINGLEFLIGHT_KNOWLEDGE", False)
+    return Classified
+
+
+def recognize(role: str, topic_id: str):
+    '''
+    返回 403 时的 HTTPException 或打开的流式响应（未开始读取上游，结束时归还并发名额）
+    '''
+    async def run():
+        body = gateway.RequestBody(question="问题", user_id="u", user_no="n", user_role=role, topic_id=topic_id)
+        try:
+            response = await gateway.user_intent_recognize(body)
+        except HTTPException as e:
+            return e
+        await response.background()
+        return response
+
+    return asyncio.run(run())
+
+
+@pytest.mark.parametrize("role", ROLES)
+@pytest.mark.parametrize("intent", INTENTS, ids=lambda intent: gateway.ROUTE_BY_INTENT[intent])
+def test_role_intent_matrix(classified, role, intent):
+    classified.intent = intent
+    route = gateway.ROUTE_BY_INTENT[intent]
+    result = recognize(role, f"{role}-{intent}")
+    if expected_allowed(gateway.auth_role_allown_map, role, route):
+        assert not isinstance(result, HTTPException)
+        assert result.media_type == "text/event-stream"
+    else:
+        assert isinstance(result, HTTPException)
+        assert result.status_code == 403
+        assert result.detail == gateway.AUTH_REFUSE_BY_ROUTE.get(route, gateway.ILLEGAL_AUTH_REFUSE_DEFAULT)
+
+
+def test_role_without_routes_rejected_before_classification(classified, monkeypatch):
+    monkeypatch.setattr(gateway, "auth_policy", AuthPolicy({route: ["HR"] for route in ROUTES}))
+    result = recognize("Employee", "no-routes")
+    assert isinstance(result, HTTPException) and result.status_code == 403
+    assert classified.calls == 0
+    assert not isinstance(recognize("HR", "hr"), HTTPException)
+
+
+@pytest.mark.parametrize("rules", [
+    {"attendance": ["Boss", "Assistant", "HR"], "chat": ["Boss", "Assistant", "HR", "Manager", "Employee"]},
+    {"attendance": ["HR"], "knowledge": ["HR", "Manager"], "chat": []},
+    {},
+])
+def test_compiled_policy_matches_rules(rules):
+    policy = AuthPolicy(rules)
+    for role, result in matrix(policy, ["Intern"]):
+        for route, allowed in result.items():
+            assert allowed == expected_allowed(rules, role, route), (role, route)
+            assert (route in policy.allowed_routes(role)) == allowed, (role, route)
@@ -0,0 +1,51 @@
+'''
+指令使用热度：只按指令中心的已知指令计数；/usage/prompts 需要管理令牌或本机访问
+'''
+import pytest
+from fastapi.testclient import TestClient
+
+import intent_gataway_api as gateway
+from prompt_usage import PromptMatcher
+
+PROMPTS = ["查询员工每天工作时长，以列表形式展示，时间为这个月，姓名为：",
+           "上周几个人请假了，分别请了多少天",
+           "上周几个人请假了，对比一下采购和销售部门的工时"]
+
+
+def test_match_exact_and_prefix():
+    matcher = PromptMatcher(PROMPTS)
+    assert matcher.match(" 上周几个人请假了，分别请了多少天 ") == PROMPTS[1]
+    # 补充的姓名不进入统计 key
+    assert matcher.match(PROMPTS[0] + "张三") == PROMPTS[0]
+    assert matcher.match(PROMPTS[2]) == PROMPTS[2]
+
+
+def test_unknown_question_not_matched():
+    matcher = PromptMatcher(PROMPTS)
+    assert matcher.match("张三工号 1024 上个月的工资是多少") is None
+    assert matcher.match("上周几个人") is None
+    assert PromptMatcher().match(PROMPTS[1]) is None
+
+
+@pytest.fixture
+def client():
+    # 不进入 lifespan，避免连接真实上游
+    return TestClient(gateway.app, client=("10.0.0.8", 50000))
+
+
+def test_usage_requires_admin(client, monkeypatch):
+    monkeypatch.setattr(gateway.settings, "ADMIN_TOKEN", "")
+    assert client.get("/usage/prompts").status_code == 403
+    assert client.post("/cache/knowledge/invalidate").status_code == 403
+    monkeypatch.setattr(gateway.settings, "ADMIN_TOKEN", "secret")
+    assert client.get("/usage/prompts", headers={"X-Admin-Token": "wrong"}).status_code == 403
+    response = client.get("/usage/prompts", headers={"X-Admin-Token": "secret"})
+    assert response.status_code == 200
+    assert "auth_roles" in response.json()
+
+
+def test_usage_local_without_token(monkeypatch):
+    monkeypatch.setattr(gateway.settings, "ADMIN_TOKEN", "")
+    local = TestClient(gateway.app, client=("127.0.0.1", 50000))
+    assert local.get("/usage/prompts").status_code == 200
+    assert local.get("/usage/prompts", params={"limit": gateway.settings.PROMPT_USAGE_MAX_LIMIT + 1}).status_code == 422
@@ -0,0 +1,40 @@
+'''
+追问识别：沿用上一次意图的条件
+'''
+import pytest
+
+from fast_intent import FastIntentClassifier
+from intents import INTENT_ATTENDANCE, INTENT_KNOWLEDGE
+from session_store import SessionStore
+
+score = FastIntentClassifier(threshold=0.6).score
+
+
+@pytest.fixture
+def store():
+    return SessionStore(maxsize=100, ttl=600.0)
+
+
+@pytest.mark.parametrize("question", ["你能帮我写首诗吗", "你能帮我写首诗呢", "再帮我写一首关于春天的诗"])
+def test_question_without_evidence_is_not_follow_up(store, question):
+    # 关键词对所有意图都是 0 分时，有自身内容的问题不能沿用上一次的考勤意图
+    assert set(score(question).values()) == {0.0}
+    record = store.record("t", INTENT_ATTENDANCE, "昨天谁迟到了", reused=False)
+    assert not store.is_follow_up(question, record, score)
+
+
+@pytest.mark.parametrize("question", ["那上个月呢", "还有呢", "那行政部呢？", "换成销售部", "然后呢"])
+def test_elliptical_question_is_follow_up(store, question):
+    record = store.record("t", INTENT_ATTENDANCE, "昨天谁迟到了", reused=False)
+    assert store.is_follow_up(question, record, score)
+
+
+def test_keyword_evidence(store):
+    record = store.record("t", INTENT_KNOWLEDGE, "年假有几天", reused=False)
+    assert store.is_follow_up("那年假怎么算呢", record, score)
+    # 关键词偏向其他意图时重新识别
+    assert not store.is_follow_up("那明天天气呢", record, score)
+
+
+def test_no_session(store):
+    assert not store.is_follow_up("那上个月呢", None, score)
@@ -0,0 +1,64 @@
+'''
+投机执行：提交后转发结束与响应关闭都会调用 cancel，上游只关闭一次、名额只归还一次
+'''
+import asyncio
+
+from speculation import Speculation, SpeculationStats
+
+
+class Upstream:
+    '''
+    记录 aclose 次数的下游生成器替身
+    '''
+
+    def __init__(self, items: list[str]) -> None:
+        self.items = list(items)
+        self.acloses = 0
+
+    def __aiter__(self) -> 'Upstream':
+        return self
+
+    async def __anext__(self) -> str:
+        if not self.items:
+            raise StopAsyncIteration
+        return self.items.pop(0)
+
+    async def aclose(self) -> None:
+        self.acloses += 1
+
+
+class CountingPermit:
+    def __init__(self) -> None:
+        self.releases = 0
+
+    def release(self) -> None:
+        self.releases += 1
+
+
+def test_commit_then_on_close_closes_once():
+    async def run():
+        upstream, permit, stats = Upstream(["a", "b"]), CountingPermit(), SpeculationStats()
+        speculation = Speculation("知识库助理", upstream, stats, buffer_size=8, permit=permit)
+        frames = [item async for item in speculation.commit()]
+        # StreamGuard 的 on_close 在转发结束后再次调用
+        await speculation.cancel(count=False)
+        return frames, upstream, permit, stats
+
+    frames, upstream, permit, stats = asyncio.run(run())
+    assert frames == ["a", "b"]
+    assert upstream.acloses == 1
+    assert permit.releases == 1
+    assert (stats.hits, stats.misses) == (1, 0)
+
+
+def test_cancel_twice_counts_one_miss():
+    async def run():
+        upstream, stats = Upstream(["a"]), SpeculationStats()
+        speculation = Speculation("考勤数据查询助理", upstream, stats, buffer_size=8)
+        await speculation.cancel()
+        await speculation.cancel()
+        return upstream, stats
+
+    upstream, stats = asyncio.run(run())
+    assert upstream.acloses == 1
+    assert stats.misses == 1
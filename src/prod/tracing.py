@@ -0,0 +1,323 @@
+'''
+请求级耗时追踪：每个请求一个 Trace，记录各阶段（span）相对收到请求的开始时间与耗时
+
+- 请求 ID 取自请求头 X-Request-ID（没有或不合法时生成），并在响应头中返回，日志中也带上 request_id
+- 当前 Trace 放在 contextvar 中，请求内创建的任务（上游读取、SSE 写出）自动继承；没有 Trace 时 span 不做任何事
+- 结束的 Trace 放进有界环形缓冲区，GET /debug/traces 按耗时倒序查看各阶段耗时
+- 可选采样分析（SamplingProfiler）：后台线程定时抓取事件循环线程的调用栈，记到当时正在运行的任务所属的请求上，
+  请求耗时超过阈值时保留聚合后的调用栈（flamegraph 的 collapsed 格式），否则丢弃
+'''
+import asyncio
+import re
+import sys
+import threading
+import time
+import uuid
+import weakref
+from collections import Counter, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Iterator
+
+REQUEST_ID_HEADER = 'x-request-id'
+# 客户端传入的请求 ID 只接受字母、数字与 -_.:，否则重新生成
+_VALID_REQUEST_ID = re.compile(r'[A-Za-z0-9\-_.:]{1,128}')
+
+_current: ContextVar['Trace | None'] = ContextVar('trace', default=None)
+
+
+class Trace:
+    __slots__ = ('request_id', 'method', 'path', 'wall_time', 'started', 'duration', 'status', 'attrs', 'spans',
+                 'events', 'max_spans', 'dropped_spans', 'samples', 'profile')
+
+    def __init__(self, request_id: str, method: str, path: str, max_spans: int = 64) -> None:
+        self.request_id = request_id
+        self.method = method
+        self.path = path
+        self.wall_time = time.time()
+        self.started = time.perf_counter()
+        # 结束后才有值（秒）
+        self.duration: float | None = None
+        self.status: int | None = None
+        self.attrs: dict[str, Any] = {}
+        # (名称, 相对请求开始的时间, 耗时, 属性)
+        self.spans: list[tuple[str, float, float, dict[str, Any] | None]] = []
+        # 事件名 -> 第一次发生时相对请求开始的时间
+        self.events: dict[str, float] = {}
+        self.max_spans = max_spans
+        self.dropped_spans = 0
+        # 采样分析期间的调用栈，结束时聚合到 profile
+        self.samples: list[str] | None = None
+        self.profile: list[tuple[str, int]] | None = None
+
+    def add_span(self, name: str, start: float, end: float, attrs: dict[str, Any] | None = None) -> None:
+        if self.duration is not None:
+            # 请求已结束（例如合并调用中由其他请求继续读取的上游）
+            return
+        if len(self.spans) >= self.max_spans:
+            self.dropped_spans += 1
+            return
+        self.spans.append((name, start - self.started, end - start, attrs or None))
+
+    def event(self, name: str) -> None:
+        if self.duration is None and name not in self.events:
+            self.events[name] = time.perf_counter() - self.started
+
+    def phases(self) -> dict[str, float]:
+        '''
+        按名称汇总的耗时（毫秒），从大到小；嵌套的 span 各自计入
+        '''
+        totals: dict[str, float] = {}
+        for name, _, duration, _ in self.spans:
+            totals[name] = totals.get(name, 0.0) + duration
+        return {name: round(total * 1000, 3)
+                for name, total in sorted(totals.items(), key=lambda item: item[1], reverse=True)}
+
+    def to_dict(self, spans: bool = True) -> dict[str, Any]:
+        result = {"request_id": self.request_id,
+                  "method": self.method,
+                  "path": self.path,
+                  "status": self.status,
+                  "ts": round(self.wall_time, 3),
+                  "duration_ms": round(self.duration * 1000, 3) if self.duration is not None else None,
+                  **self.attrs,
+                  "phases": self.phases(),
+                  "events": {name: round(offset * 1000, 3) for name, offset in self.events.items()}}
+        if spans:
+            result["spans"] = [{"name": name, "start_ms": round(start * 1000, 3),
+                                "duration_ms": round(duration * 1000, 3), **(attrs or {})}
+                               for name, start, duration, attrs in self.spans]
+        if self.dropped_spans:
+            result["dropped_spans"] = self.dropped_spans
+        if self.profile is not None:
+            result["profile"] = [{"stack": stack, "samples": count} for stack, count in self.profile]
+        return result
+
+
+def current() -> Trace | None:
+    return _current.get()
+
+
+def current_request_id() -> str | None:
+    trace = _current.get()
+    return trace.request_id if trace is not None else None
+
+
+@contextmanager
+def span(name: str, **attrs: Any) -> Iterator[dict[str, Any]]:
+    '''
+    with span('classify') as attrs: ...；可以在块内向 attrs 补充属性
+    '''
+    trace = _current.get()
+    if trace is None:
+        yield attrs
+        return
+    start = time.perf_counter()
+    try:
+        yield attrs
+    finally:
+        trace.add_span(name, start, time.perf_counter(), attrs)
+
+
+def record(name: str, start: float, **attrs: Any) -> None:
+    '''
+    记录从 start（perf_counter）到现在的 span，用于不方便包成 with 块的阶段
+    '''
+    trace = _current.get()
+    if trace is not None:
+        trace.add_span(name, start, time.perf_counter(), attrs)
+
+
+def event(name: str) -> None:
+    trace = _current.get()
+    if trace is not None:
+        trace.event(name)
+
+
+def annotate(**attrs: Any) -> None:
+    '''
+    请求级属性（路由、意图等），在 /debug/traces 中与耗时一起展示
+    '''
+    trace = _current.get()
+    if trace is not None:
+        trace.attrs.update(attrs)
+
+
+class SamplingProfiler:
+    '''
+    只能看到占用事件循环的同步代码（编码、压缩、解析、日志等），等待上游的时间不会出现在采样中
+    任务与请求的对应关系通过 task factory 在创建任务时记录（新任务属于创建它时所在的请求）
+    '''
+
+    def __init__(self, threshold: float, interval: float = 0.005, max_samples: int = 2000,
+                 max_depth: int = 64, top: int = 50) -> None:
+        self.threshold = threshold
+        self.interval = interval
+        self.max_samples = max_samples
+        self.max_depth = max_depth
+        self.top = top
+        self._tasks: weakref.WeakKeyDictionary[asyncio.Task, Trace] = weakref.WeakKeyDictionary()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._thread_id: int | None = None
+        self._stopped = threading.Event()
+        self._thread: threading.Thread | None = None
+        self.samples = 0
+        self.profiled = 0
+
+    def start(self) -> None:
+        '''
+        在事件循环线程中调用
+        '''
+        loop = asyncio.get_running_loop()
+        self._loop = loop
+        self._thread_id = threading.get_ident()
+        factory = loop.get_task_factory()
+
+        def task_factory(loop, coro, **kwargs):
+            if factory is not None:
+                task = factory(loop, coro, **kwargs)
+            else:
+                task = asyncio.Task(coro, loop=loop, **kwargs)
+            context = kwargs.get('context')
+            trace = context.get(_current) if context is not None else _current.get()
+            if trace is not None:
+                self._tasks[task] = trace
+            return task
+
+        loop.set_task_factory(task_factory)
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name='trace-profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def bind(self, trace: Trace) -> None:
+        '''
+        请求本身所在的任务在 Trace 创建之前就已存在，需要单独登记
+        '''
+        task = asyncio.current_task()
+        if task is not None:
+            self._tasks[task] = trace
+        trace.samples = []
+
+    def finish(self, trace: Trace) -> None:
+        samples, trace.samples = trace.samples, None
+        if samples and trace.duration is not None and trace.duration >= self.threshold:
+            self.profiled += 1
+            trace.profile = Counter(samples).most_common(self.top)
+
+    def _stack(self, frame) -> str:
+        names = []
+        while frame is not None and len(names) < self.max_depth:
+            code = frame.f_code
+            names.append(f'{code.co_filename.rsplit("/", 1)[-1]}:{code.co_name}:{frame.f_lineno}')
+            frame = frame.f_back
+        return ';'.join(reversed(names))
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            task = asyncio.current_task(self._loop)
+            if task is None:
+                continue
+            trace = self._tasks.get(task)
+            if trace is None or trace.samples is None or len(trace.samples) >= self.max_samples:
+                continue
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is not None:
+                self.samples += 1
+                trace.samples.append(self._stack(frame))
+
+    def stats(self) -> dict[str, Any]:
+        return {"threshold_s": self.threshold, "interval_s": self.interval, "samples": self.samples,
+                "profiled_requests": self.profiled}
+
+
+class Tracer:
+    def __init__(self, buffer_size: int = 1000, max_spans: int = 64,
+                 profiler: SamplingProfiler | None = None) -> None:
+        self.traces: deque[Trace] = deque(maxlen=buffer_size)
+        self.max_spans = max_spans
+        self.profiler = profiler
+        self.active = 0
+        self.finished = 0
+
+    def start(self, request_id: str | None, method: str, path: str) -> Trace:
+        if not request_id or not _VALID_REQUEST_ID.fullmatch(request_id):
+            request_id = uuid.uuid4().hex
+        trace = Trace(request_id, method, path, self.max_spans)
+        self.active += 1
+        if self.profiler is not None:
+            self.profiler.bind(trace)
+        return trace
+
+    def finish(self, trace: Trace) -> None:
+        trace.duration = time.perf_counter() - trace.started
+        self.active -= 1
+        self.finished += 1
+        if self.profiler is not None:
+            self.profiler.finish(trace)
+        self.traces.append(trace)
+
+    def find(self, request_id: str) -> Trace | None:
+        for trace in reversed(self.traces):
+            if trace.request_id == request_id:
+                return trace
+        return None
+
+    def slowest(self, limit: int = 20, min_seconds: float = 0.0) -> list[Trace]:
+        traces = [trace for trace in self.traces if trace.duration >= min_seconds]
+        traces.sort(key=lambda trace: trace.duration, reverse=True)
+        return traces[:limit]
+
+    def recent(self, limit: int = 20) -> list[Trace]:
+        return list(self.traces)[-limit:][::-1]
+
+    def stats(self) -> dict[str, Any]:
+        stats = {"buffered": len(self.traces), "active": self.active, "finished": self.finished}
+        if self.profiler is not None:
+            stats["profiler"] = self.profiler.stats()
+        return stats
+
+
+class TraceMiddleware:
+    '''
+    ASGI 中间件：为 paths 前缀下的请求创建 Trace，响应头带上请求 ID；流式响应写完（包括客户端断开）后结束 Trace
+    '''
+
+    def __init__(self, app, tracer: Tracer, paths: tuple[str, ...] = ('/',)) -> None:
+        self.app = app
+        self.tracer = tracer
+        self.paths = tuple(paths)
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope['type'] != 'http' or not scope['path'].startswith(self.paths):
+            await self.app(scope, receive, send)
+            return
+        request_id = None
+        for name, value in scope['headers']:
+            if name == b'x-request-id':
+                request_id = value.decode('latin-1')
+                break
+        trace = self.tracer.start(request_id, scope['method'], scope['path'])
+        header = (REQUEST_ID_HEADER.encode(), trace.request_id.encode())
+
+        async def send_with_request_id(message) -> None:
+            if message['type'] == 'http.response.start':
+                trace.status = message['status']
+                message = {**message, 'headers': [*message.get('headers', ()), header]}
+            await send(message)
+
+        token = _current.set(trace)
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        except BaseException:
+            if trace.status is None:
+                trace.status = 500
+            raise
+        finally:
+            _current.reset(token)
+            self.tracer.finish(trace)
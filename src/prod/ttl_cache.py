@@ -0,0 +1,57 @@
+'''
+进程内 LRU + TTL 缓存，超出容量时淘汰最久未使用的条目
+'''
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+
+
+class TTLCache:
+    def __init__(self, maxsize: int, ttl: float, timer: Callable[[], float] = time.monotonic) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.timer = timer
+        # key -> (过期时间, value)
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key) is not None
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        item = self._data.get(key)
+        if item is None:
+            return default
+        expires_at, value = item
+        if expires_at <= self.timer():
+            del self._data[key]
+            self.expirations += 1
+            return default
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: float | None = None) -> None:
+        expires_at = self.timer() + (self.ttl if ttl is None else ttl)
+        self._data[key] = (expires_at, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        item = self._data.pop(key, None)
+        return default if item is None else item[1]
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def items(self) -> list[tuple[Hashable, Any]]:
+        '''
+        返回未过期条目的快照（不改变 LRU 顺序）
+        '''
+        now = self.timer()
+        return [(key, value) for key, (expires_at, value) in self._data.items() if expires_at > now]
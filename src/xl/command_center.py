@@ -1,11 +1,47 @@
+from contextlib import asynccontextmanager
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import random
+import time
 from pydantic import BaseModel
+import aiohttp
 import uvicorn
-from fastapi import FastAPI
-from random import sample
-from typing import List, Dict
+from fastapi import FastAPI, Request, Response
+
+from recommender import DEFAULT_AUTH_ROLES, Recommender
+
+# 指令配置文件（JSON），为空时使用内置的考勤 / 知识问答指令
+COMMAND_CENTER_CONFIG = os.getenv('COMMAND_CENTER_CONFIG', '')
+# 配置文件变更检查间隔（秒）
+COMMAND_CENTER_RELOAD_INTERVAL = float(os.getenv('COMMAND_CENTER_RELOAD_INTERVAL', '5'))
+# 推荐项轮换周期，也是客户端缓存时间（秒）
+COMMAND_CENTER_MAX_AGE = int(os.getenv('COMMAND_CENTER_MAX_AGE', '60'))
+# 网关的问题使用热度接口，例如 http://127.0.0.1:8088/usage/prompts，为空时按均匀权重推荐
+GATEWAY_USAGE_URL = os.getenv('GATEWAY_USAGE_URL', '')
+COMMAND_CENTER_USAGE_INTERVAL = float(os.getenv('COMMAND_CENTER_USAGE_INTERVAL', '60'))
+# 网关管理接口的令牌（网关的 ADMIN_TOKEN），网关未配置令牌时只允许本机访问
+GATEWAY_ADMIN_TOKEN = os.getenv('GATEWAY_ADMIN_TOKEN', '')
+
+logger = logging.getLogger('command_center')
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    tasks = []
+    if COMMAND_CENTER_CONFIG:
+        tasks.append(asyncio.create_task(watch_config(COMMAND_CENTER_RELOAD_INTERVAL)))
+    if GATEWAY_USAGE_URL:
+        tasks.append(asyncio.create_task(poll_usage(GATEWAY_USAGE_URL, COMMAND_CENTER_USAGE_INTERVAL)))
+    yield
+    for task in tasks:
+        task.cancel()
+
 
 # 创建FastAPI实例
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 
 # 将CommandInfo转换为BaseModel子类
@@ -32,48 +68,157 @@ class ResponseModel(BaseModel):
         return cls(code=200, data=data, message="Success")
 
 
-@app.get('/commandCenter')
-def command_center() -> ResponseModel:
-    data = []
+class CommandCenterSnapshot:
+    '''
+    指令中心响应的预计算结果，构建后不再修改；重新加载时整体替换
+
+    响应中只有“推荐”两条是每次请求生成的（按角色与使用热度加权抽取，见 recommender.py），
+    其余部分（全部 / 各分类）预先序列化为 JSON 字节，每条推荐项也预先序列化，请求时只做拼接，不再经过 pydantic 校验
+    '''
+    __slots__ = ('prefix', 'recommend_items', 'etag', 'titles', 'texts', 'recommender')
+
+    def __init__(self, sections: list[AiCommandCenterVO], usage: dict[str, float],
+                 auth_roles: dict[str, list[str]]) -> None:
+        commands = [command for section in sections for command in section.command_list]
+        self.titles = [section.title for section in sections for _ in section.command_list]
+        self.texts = [command.sub_content or '' for command in commands]
+        all_sections = [AiCommandCenterVO(title="全部", command_list=commands)] + sections
+        data = ','.join(_dumps(section.model_dump()) for section in all_sections)
+        # 与 FastAPI 默认的 JSONResponse 输出一致
+        self.prefix = ('{"code":200,"data":[' + data + ',{"title":"推荐","command_list":[').encode('utf-8')
+        self.recommend_items = [_dumps(CommandInfo(sub_content=command.sub_content).model_dump()).encode('utf-8')
+                                for command in commands]
+        self.etag = 'W/"' + hashlib.sha1(self.prefix + b''.join(self.recommend_items)).hexdigest()[:16] + '"'
+        self.recommender = Recommender(self.titles, self.texts, auth_roles, usage)
+
+    def with_usage(self, usage: dict[str, float], auth_roles: dict[str, list[str]]) -> 'CommandCenterSnapshot':
+        '''
+        复用已序列化的部分，只重建推荐别名表
+        '''
+        snapshot = object.__new__(CommandCenterSnapshot)
+        for name in ('prefix', 'recommend_items', 'etag', 'titles', 'texts'):
+            setattr(snapshot, name, getattr(self, name))
+        snapshot.recommender = Recommender(self.titles, self.texts, auth_roles, usage)
+        return snapshot
+
+    def recommend(self, user_role: str | None, window: int) -> tuple[list[int], str]:
+        '''
+        抽取推荐项，返回下标与对应响应的 ETag
+        以 (角色, 时间窗口) 为随机种子，同一窗口内同一角色抽到的推荐项相同，客户端重新验证时才能命中 304；
+        使用热度更新后抽到的推荐项可能变化，ETag 中带上下标
+        '''
+        indices = self.recommender.recommend(user_role, 2, random.Random(f'{user_role}:{window}'))
+        sample = hashlib.sha1(f'{user_role}:{indices}'.encode('utf-8')).hexdigest()[:8]
+        return indices, self.etag[:-1] + '-' + sample + '"'
+
+    def render(self, indices: list[int]) -> bytes:
+        items = self.recommend_items
+        return self.prefix + b','.join(items[i] for i in indices) + _SUFFIX
+
+
+_SUFFIX = b']}],"message":"Success"}'
+
 
-    # 创建考勤和知识问答的命令中心数据
-    clocking_in_commands = ai_command_center_clocking_in()
-    knowledge_questions_commands = ai_command_center_knowledge_questions()
+def _dumps(value) -> str:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
 
-    # 创建包含全部的命令中心数据
-    all_commands = AiCommandCenterVO(title="全部",
-                                     command_list=clocking_in_commands.command_list + knowledge_questions_commands.command_list)
 
-    # 添加所有数据到data列表
-    data.append(all_commands)
-    data.append(clocking_in_commands)
-    data.append(knowledge_questions_commands)
+def default_sections() -> list[AiCommandCenterVO]:
+    return [ai_command_center_clocking_in(), ai_command_center_knowledge_questions()]
 
-    # 从ai_command_center_clocking_in和ai_command_center_knowledge_questions获取数据
-    clocking_in_commands = ai_command_center_clocking_in().command_list
-    knowledge_questions_commands = ai_command_center_knowledge_questions().command_list
 
-    # 将CommandInfo对象转换为字典列表
-    clocking_in_commands_dicts = [ci.dict() for ci in clocking_in_commands]
-    knowledge_questions_dicts = [kq.dict() for kq in knowledge_questions_commands]
+def load_sections(path: str) -> list[AiCommandCenterVO]:
+    '''
+    配置文件格式：[{"title": "考勤", "command_list": [{"subtitle": ..., "sub_content": ...}, ...]}, ...]
+    '''
+    with open(path, encoding='utf-8') as f:
+        return [AiCommandCenterVO.model_validate(section) for section in json.load(f)]
 
-    # 现在你可以调用random_recommend_commands函数
-    recommended_commands = random_recommend_commands(
-        clocking_in_commands_dicts + knowledge_questions_dicts, "推荐"
-    )
-    data.append(AiCommandCenterVO(title="推荐",
-                                  command_list=[CommandInfo(sub_content=rc['content']) for rc in recommended_commands]))
 
-    return ResponseModel.success(data)
+# 最近一次从网关取到的使用热度与角色权限
+_usage: dict[str, float] = {}
+_auth_roles: dict[str, list[str]] = DEFAULT_AUTH_ROLES
 
 
-# 随机推荐命令函数
-def random_recommend_commands(command_infos: List[Dict], title: str) -> List[Dict]:
-    if len(command_infos) < 2:
-        return [{"title": title, "content": command_infos[0]['sub_content']}]
+def build_snapshot() -> CommandCenterSnapshot:
+    sections = load_sections(COMMAND_CENTER_CONFIG) if COMMAND_CENTER_CONFIG else default_sections()
+    return CommandCenterSnapshot(sections, _usage, _auth_roles)
 
-    selected_indices = sample(range(len(command_infos)), 2)
-    return [{"title": title, "content": command_infos[i]['sub_content']} for i in selected_indices]
+
+def reload_snapshot() -> bool:
+    '''
+    重新读取配置并整体替换快照；配置有误时保留旧快照
+    '''
+    global _snapshot
+    try:
+        snapshot = build_snapshot()
+    except (OSError, ValueError) as e:
+        logger.warning("command center reload failed: %r", e)
+        return False
+    _snapshot = snapshot
+    logger.info("command center reloaded, etag %s", snapshot.etag)
+    return True
+
+
+async def watch_config(interval: float) -> None:
+    '''
+    配置文件修改时间变化时重新加载
+    '''
+    mtime = _config_mtime()
+    while True:
+        await asyncio.sleep(interval)
+        current = _config_mtime()
+        if current != mtime:
+            mtime = current
+            await asyncio.to_thread(reload_snapshot)
+
+
+async def poll_usage(url: str, interval: float) -> None:
+    '''
+    定期从网关取问题使用热度与角色权限，重建推荐别名表；网关不可达时沿用上一次的数据
+    '''
+    global _snapshot, _usage, _auth_roles
+    headers = {"X-Admin-Token": GATEWAY_ADMIN_TOKEN} if GATEWAY_ADMIN_TOKEN else None
+    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=10), headers=headers) as session:
+        while True:
+            try:
+                async with session.get(url) as response:
+                    payload = await response.json()
+                _usage = {item["question"]: item["score"] for item in payload["prompts"]}
+                _auth_roles = payload.get("auth_roles") or _auth_roles
+                _snapshot = _snapshot.with_usage(_usage, _auth_roles)
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError, KeyError) as e:
+                logger.warning("usage refresh failed: %r", e)
+            await asyncio.sleep(interval)
+
+
+def _config_mtime() -> float | None:
+    try:
+        return os.stat(COMMAND_CENTER_CONFIG).st_mtime
+    except OSError:
+        return None
+
+
+@app.get('/commandCenter', response_model=ResponseModel)
+def command_center(request: Request, user_role: str | None = None) -> Response:
+    '''
+    user_role 为空时从全部指令中推荐；否则只推荐该角色有权限的指令
+    '''
+    snapshot = _snapshot
+    # 推荐项每 COMMAND_CENTER_MAX_AGE 秒换一批，客户端缓存到本窗口结束
+    max_age = max(1, COMMAND_CENTER_MAX_AGE)
+    now = time.time()
+    window = int(now // max_age)
+    indices, etag = snapshot.recommend(user_role, window)
+    headers = {"ETag": etag, "Cache-Control": f"private, max-age={max(1, int((window + 1) * max_age - now))}"}
+    if request.headers.get('if-none-match') == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=snapshot.render(indices), media_type="application/json", headers=headers)
+
+
+@app.post('/commandCenter/reload')
+def command_center_reload():
+    return {"reloaded": reload_snapshot(), "etag": _snapshot.etag}
 
 
 def ai_command_center_clocking_in() -> AiCommandCenterVO:
@@ -113,5 +258,9 @@ def knowledge_questions_in_command_infos() -> list[CommandInfo]:
     return list_process
 
 
+# 启动时构建一次，之后只在重新加载时替换
+_snapshot = build_snapshot()
+
+
 if __name__ == '__main__':
     uvicorn.run(app=app, host='0.0.0.0', port=8012)
@@ -0,0 +1,92 @@
+'''
+指令中心推荐：按角色过滤可用的指令，再按使用热度加权随机抽取
+
+- 角色权限与网关的 auth_role_allown_map 一致：受限分类（如考勤）只推荐给有权限的角色
+- 使用热度来自网关 /usage/prompts 的衰减计数；每条指令的权重为 1 + 热度，没被用过的指令仍可能被推荐
+- 每个角色预先构建别名表（Vose alias method），每次抽取 O(1)
+'''
+import random
+from typing import Sequence
+
+# 分类标题 -> 网关权限校验的查询类型，未列出的分类不限角色
+SECTION_AGENCY = {"考勤": "attendance"}
+# 网关不可达时使用的权限表，与网关 auth_role_allown_map 保持一致
+DEFAULT_AUTH_ROLES = {"attendance": ["Boss", "Assistant", "HR"],
+                      "chat": ["Boss", "Assistant", "HR", "Manager", "Employee"]}
+
+
+class AliasTable:
+    def __init__(self, weights: Sequence[float]) -> None:
+        n = len(weights)
+        total = float(sum(weights))
+        self.n = n
+        self.prob = [0.0] * n
+        self.alias = list(range(n))
+        scaled = [w * n / total for w in weights]
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            s, l = small.pop(), large.pop()
+            self.prob[s] = scaled[s]
+            self.alias[s] = l
+            scaled[l] -= 1.0 - scaled[s]
+            (small if scaled[l] < 1.0 else large).append(l)
+        for i in small + large:
+            self.prob[i] = 1.0
+
+    def draw(self, rng: random.Random) -> int:
+        i = int(rng.random() * self.n)
+        return i if rng.random() < self.prob[i] else self.alias[i]
+
+
+class _RoleTable:
+    __slots__ = ('indices', 'table')
+
+    def __init__(self, indices: list[int], weights: list[float]) -> None:
+        self.indices = indices
+        self.table = AliasTable([weights[i] for i in indices]) if indices else None
+
+
+class Recommender:
+    def __init__(self, sections: Sequence[str], texts: Sequence[str], auth_roles: dict[str, list[str]],
+                 usage: dict[str, float], rng: random.Random | None = None) -> None:
+        '''
+        sections / texts: 每条指令所属的分类标题与问题文本
+        usage: 网关统计的问题 -> 热度；以指令文本开头的问题（例如在“姓名为：”后补充了姓名）也计入该指令
+        '''
+        self.rng = rng or random.Random()
+        weights = [1.0 + sum(score for question, score in usage.items() if question.startswith(text)) if text
+                   else 1.0 for text in texts]
+        self.weights = weights
+        restricted = [auth_roles.get(SECTION_AGENCY[title]) if title in SECTION_AGENCY else None
+                      for title in sections]
+        roles = {role for allowed in restricted if allowed is not None for role in allowed}
+        n = len(texts)
+        # None: 未提供角色，推荐全部指令（兼容旧客户端）
+        self.tables: dict[str | None, _RoleTable] = {None: _RoleTable(list(range(n)), weights)}
+        for role in roles:
+            self.tables[role] = _RoleTable([i for i in range(n) if restricted[i] is None or role in restricted[i]],
+                                           weights)
+        # 未知角色只推荐不受限的指令
+        self.unknown_role = _RoleTable([i for i in range(n) if restricted[i] is None], weights)
+
+    def recommend(self, role: str | None, count: int, rng: random.Random | None = None) -> list[int]:
+        '''
+        返回 count 条不重复指令的下标，可用指令不足时全部返回；rng 为空时使用构造时的随机数生成器
+        '''
+        rng = rng or self.rng
+        role_table = self.tables.get(role, self.unknown_role)
+        indices = role_table.indices
+        if len(indices) <= count:
+            return indices[:]
+        chosen: list[int] = []
+        attempts = 0
+        while len(chosen) < count:
+            index = indices[role_table.table.draw(rng)]
+            attempts += 1
+            if index not in chosen:
+                chosen.append(index)
+            elif attempts > 8 * count:
+                # 权重极度集中时不再重抽，从剩余指令中均匀补足
+                chosen.extend(rng.sample([i for i in indices if i not in chosen], count - len(chosen)))
+        return chosen